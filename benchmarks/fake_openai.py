@@ -0,0 +1,183 @@
+"""Local stand-in for the OpenAI API used by the load benchmarks.
+
+Serves `/v1/embeddings` and `/v1/chat/completions` (plain and streaming) with
+configurable latency and jitter, so the service can be benchmarked offline and
+without an API key. Embeddings are deterministic bag-of-words hash projections:
+texts sharing words get similar vectors, which keeps retrieval behaving realistically.
+
+Run with `python -m benchmarks.fake_openai --port 8100 --latency-ms 50 --jitter-ms 20`.
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+import uuid
+import zlib
+from collections.abc import AsyncIterator
+from typing import Any
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+TOKEN_PATTERN = re.compile(r"\w+")
+HASH_BUCKETS = 4096
+ANSWER_TEXT = (
+    "Thanks for your question! Based on our store policy, here is what you need to know. "
+    "Please check the details on your order page, and feel free to contact customer support "
+    "if anything is unclear. We are always happy to help you with your purchase."
+)
+
+settings: dict[str, Any] = {
+    "latency_ms": 50.0,
+    "jitter_ms": 10.0,
+    "token_latency_ms": 5.0,
+    "dimensions": 1536,
+}
+
+app = FastAPI(title="Fake OpenAI API")
+_projection: np.ndarray | None = None
+
+
+def get_projection() -> np.ndarray:
+    """Return the random matrix that maps hashed words to embedding space."""
+    global _projection  # noqa: PLW0603
+    if _projection is None or _projection.shape[1] != settings["dimensions"]:
+        rng = np.random.default_rng(0)
+        _projection = rng.standard_normal((HASH_BUCKETS, settings["dimensions"]), dtype=np.float32)
+    return _projection
+
+
+def embed(text: str) -> list[float]:
+    """Embed text deterministically as the normalized sum of its hashed word vectors."""
+    buckets = [zlib.crc32(token.encode()) % HASH_BUCKETS for token in TOKEN_PATTERN.findall(text.casefold())]
+    if not buckets:
+        buckets = [0]
+    vector = get_projection()[buckets].sum(axis=0)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+async def simulate_latency() -> None:
+    """Sleep for the configured base latency plus uniform jitter."""
+    delay = settings["latency_ms"] + random.uniform(-settings["jitter_ms"], settings["jitter_ms"])  # noqa: S311
+    await asyncio.sleep(max(delay, 0.0) / 1000)
+
+
+@app.post("/v1/embeddings")
+async def embeddings(request: Request) -> JSONResponse:
+    """Return deterministic embeddings for one or many input texts."""
+    body = await request.json()
+    inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+    await simulate_latency()
+    tokens = sum(len(TOKEN_PATTERN.findall(text)) for text in inputs)
+    return JSONResponse({
+        "object": "list",
+        "model": body.get("model", "fake-embedding"),
+        "data": [{"object": "embedding", "index": index, "embedding": embed(text)} for index, text in enumerate(inputs)],
+        "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+    })
+
+
+def completion_chunk(
+    completion_id: str,
+    model: str,
+    delta: dict[str, str] | None,
+    finish_reason: str | None,
+    *,
+    usage: dict[str, int] | None = None,
+) -> str:
+    """Format one streamed chat completion chunk as an SSE message; the usage chunk has no choices."""
+    chunk = {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [] if delta is None else [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        "usage": usage,
+    }
+    return f"data: {json.dumps(chunk)}\n\n"
+
+
+async def stream_completion(
+    completion_id: str,
+    model: str,
+    *,
+    prompt_tokens: int,
+    include_usage: bool,
+) -> AsyncIterator[str]:
+    """Stream the canned answer word by word, optionally followed by a usage chunk."""
+    words = ANSWER_TEXT.split(" ")
+    yield completion_chunk(completion_id, model, {"role": "assistant", "content": ""}, None)
+    for word in words:
+        await asyncio.sleep(settings["token_latency_ms"] / 1000)
+        yield completion_chunk(completion_id, model, {"content": word + " "}, None)
+    yield completion_chunk(completion_id, model, {}, "stop")
+    if include_usage:
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(words),
+            "total_tokens": prompt_tokens + len(words),
+        }
+        yield completion_chunk(completion_id, model, None, None, usage=usage)
+    yield "data: [DONE]\n\n"
+
+
+@app.post("/v1/chat/completions", response_model=None)
+async def chat_completions(request: Request) -> JSONResponse | StreamingResponse:
+    """Return a canned answer, either at once or as a token stream."""
+    body = await request.json()
+    model = body.get("model", "fake-chat")
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    prompt_tokens = sum(len(TOKEN_PATTERN.findall(message.get("content", ""))) for message in body["messages"])
+    await simulate_latency()
+
+    if body.get("stream"):
+        include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+        return StreamingResponse(
+            stream_completion(completion_id, model, prompt_tokens=prompt_tokens, include_usage=include_usage),
+            media_type="text/event-stream",
+        )
+
+    completion_tokens = len(ANSWER_TEXT.split(" "))
+    await asyncio.sleep(settings["token_latency_ms"] * completion_tokens / 1000)
+    return JSONResponse({
+        "id": completion_id,
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [
+            {"index": 0, "message": {"role": "assistant", "content": ANSWER_TEXT}, "finish_reason": "stop"},
+        ],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    })
+
+
+def main() -> None:
+    """Run the fake OpenAI server."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency-ms", type=float, default=settings["latency_ms"])
+    parser.add_argument("--jitter-ms", type=float, default=settings["jitter_ms"])
+    parser.add_argument("--token-latency-ms", type=float, default=settings["token_latency_ms"])
+    parser.add_argument("--dimensions", type=int, default=settings["dimensions"])
+    args = parser.parse_args()
+
+    settings.update(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        token_latency_ms=args.token_latency_ms,
+        dimensions=args.dimensions,
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
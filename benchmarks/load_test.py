@@ -0,0 +1,308 @@
+"""Offline load test for the FAQ service.
+
+Starts the fake OpenAI server and the application on local ports against a generated
+FAQ corpus in a temporary directory, drives `/api/ask`, `/api/ask/stream` and
+`/api/history` at the requested concurrency levels and reports latency percentiles,
+throughput, errors and the peak memory of the application process.
+
+Run with `python -m benchmarks.load_test --faqs 5000 --concurrency 1 8 32 --requests 200`.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections.abc import Awaitable, Callable, Iterator
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+import httpx
+import numpy as np
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+STARTUP_TIMEOUT_SECONDS = 600.0
+ENDPOINTS = ("ask", "stream", "history")
+
+TOPICS = (
+    "shipping", "returns", "refunds", "payments", "warranty", "invoices", "discounts", "accounts",
+    "passwords", "subscriptions", "gift cards", "exchanges", "delivery", "orders", "pickup", "loyalty points",
+)
+PRODUCTS = (
+    "laptops", "phones", "headphones", "monitors", "keyboards", "cameras", "tablets", "printers",
+    "speakers", "chargers", "routers", "watches", "consoles", "projectors", "drones", "scanners",
+)
+DETAILS = (
+    "are processed within {n} business days", "require the original receipt and packaging",
+    "can be requested from the account page", "are available in {n} countries",
+    "cost {n} euros unless the order qualifies for a promotion", "are handled by the support team within {n} hours",
+    "need a verified email address", "are confirmed by email once approved",
+)
+
+
+@dataclass
+class Result:
+    """Summary of one endpoint run at one concurrency level."""
+
+    endpoint: str
+    concurrency: int
+    requests: int
+    errors: int
+    duration_seconds: float
+    requests_per_second: float
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    peak_memory_mb: float | None
+
+
+def generate_corpus(size: int, *, seed: int) -> tuple[list[str], list[str]]:
+    """Generate `size` FAQ entries and one matching question per entry."""
+    rng = random.Random(seed)  # noqa: S311
+    entries: list[str] = []
+    questions: list[str] = []
+    for number in range(size):
+        topic, product = rng.choice(TOPICS), rng.choice(PRODUCTS)
+        detail = rng.choice(DETAILS).format(n=rng.randint(2, 30))
+        entries.append(f"{topic.capitalize()} for {product} (policy {number}) {detail}.")
+        questions.append(f"How do {topic} work for {product} under policy {number}?")
+    return entries, questions
+
+
+def free_port() -> int:
+    """Return a TCP port that is currently free on localhost."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def peak_memory_mb(pid: int) -> float | None:
+    """Return the peak resident memory of a process, where `/proc` provides it."""
+    try:
+        status = Path(f"/proc/{pid}/status").read_text(encoding="utf-8")
+    except OSError:
+        return None
+    for line in status.splitlines():
+        if line.startswith("VmHWM:"):
+            return int(line.split()[1]) / 1024
+    return None
+
+
+async def wait_until_ready(url: str, process: subprocess.Popen[bytes]) -> None:
+    """Poll the URL until it answers with a success status, failing if the process exits first."""
+    deadline = time.monotonic() + STARTUP_TIMEOUT_SECONDS
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                msg = f"Process exited with code {process.returncode} before {url} became ready"
+                raise RuntimeError(msg)
+            try:
+                response = await client.get(url)
+            except httpx.TransportError:
+                pass
+            else:
+                if response.is_success:
+                    return
+            await asyncio.sleep(0.2)
+    msg = f"{url} did not become ready within {STARTUP_TIMEOUT_SECONDS:.0f} seconds"
+    raise TimeoutError(msg)
+
+
+@contextmanager
+def running(command: list[str], *, env: dict[str, str], log_path: Path) -> Iterator[subprocess.Popen[bytes]]:
+    """Run a command in the background for the duration of the block."""
+    with log_path.open("wb") as log_file:
+        process = subprocess.Popen(command, cwd=REPO_ROOT, env=env, stdout=log_file, stderr=subprocess.STDOUT)  # noqa: S603
+        try:
+            yield process
+        finally:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+async def run_level(
+    endpoint: str,
+    send: Callable[[int], Awaitable[None]],
+    *,
+    concurrency: int,
+    requests: int,
+) -> tuple[list[float], int, float]:
+    """Send `requests` requests with `concurrency` workers; return latencies, errors and duration."""
+    latencies: list[float] = []
+    errors = 0
+    counter = iter(range(requests))
+
+    async def worker() -> None:
+        nonlocal errors
+        for number in counter:
+            start = time.perf_counter()
+            try:
+                await send(number)
+            except (httpx.HTTPError, ValueError):
+                errors += 1
+            else:
+                latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    duration = time.perf_counter() - start
+    print(f"  {endpoint:<8} c={concurrency:<4} done in {duration:.2f}s", file=sys.stderr)  # noqa: T201
+    return latencies, errors, duration
+
+
+def make_sender(endpoint: str, client: httpx.AsyncClient, questions: list[str]) -> Callable[[int], Awaitable[None]]:
+    """Return a coroutine function that sends request number `n` to the endpoint."""
+
+    async def ask(number: int) -> None:
+        response = await client.post("/api/ask", json={"question": questions[number % len(questions)]})
+        response.raise_for_status()
+
+    async def stream(number: int) -> None:
+        payload = {"question": questions[number % len(questions)]}
+        async with client.stream("POST", "/api/ask/stream", json=payload) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if line.startswith("event: error"):
+                    msg = "Stream returned an error event"
+                    raise ValueError(msg)
+
+    async def history(_: int) -> None:
+        response = await client.get("/api/history", params={"limit": 50})
+        response.raise_for_status()
+
+    return {"ask": ask, "stream": stream, "history": history}[endpoint]
+
+
+async def benchmark(args: argparse.Namespace, workdir: Path) -> list[Result]:
+    """Start both servers and run every endpoint at every concurrency level."""
+    entries, questions = generate_corpus(args.faqs, seed=args.seed)
+    seed_path = workdir / "seed.txt"
+    seed_path.write_text("\n".join(entries) + "\n", encoding="utf-8")
+    random.Random(args.seed).shuffle(questions)  # noqa: S311
+
+    fake_port, app_port = free_port(), free_port()
+    env = {
+        **os.environ,
+        "OPENAI_API_KEY": "benchmark",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{fake_port}/v1",
+        "OPENAI_MODEL": "fake-chat",
+        "OPENAI_EMBEDDING_MODEL": "fake-embedding",
+        "DATABASE_URL": f"sqlite+aiosqlite:///{workdir / 'faq.db'}",
+        "DATABASE_ECHO": "false",
+        "FAQ_SEED_PATH": str(seed_path),
+        "LOG_FILE_PATH": str(workdir / "app.log"),
+        "IVF_INDEX_PATH": str(workdir / "faq_ivf.npz"),
+        "FAQ_INDEX_SNAPSHOT_PATH": str(workdir / "faq_index.npz"),
+        "WORKER_LOCK_DIR": str(workdir),
+    }
+    fake_command = [
+        sys.executable, "-m", "benchmarks.fake_openai",
+        "--port", str(fake_port),
+        "--latency-ms", str(args.latency_ms),
+        "--jitter-ms", str(args.jitter_ms),
+        "--token-latency-ms", str(args.token_latency_ms),
+        "--dimensions", str(args.dimensions),
+    ]
+    app_command = [
+        sys.executable, "-m", "uvicorn", "main:app",
+        "--host", "127.0.0.1", "--port", str(app_port), "--log-level", "warning", "--no-access-log",
+    ]
+
+    results: list[Result] = []
+    with running(fake_command, env=env, log_path=workdir / "fake_openai.out") as fake_server:
+        await wait_until_ready(f"http://127.0.0.1:{fake_port}/docs", fake_server)
+        print(f"Seeding {args.faqs} FAQ entries and starting the app...", file=sys.stderr)  # noqa: T201
+        started = time.perf_counter()
+        with running(app_command, env=env, log_path=workdir / "app.out") as app_server:
+            await wait_until_ready(f"http://127.0.0.1:{app_port}/readyz", app_server)
+            print(f"App ready after {time.perf_counter() - started:.1f}s", file=sys.stderr)  # noqa: T201
+
+            limits = httpx.Limits(max_connections=max(args.concurrency), max_keepalive_connections=max(args.concurrency))
+            async with httpx.AsyncClient(
+                base_url=f"http://127.0.0.1:{app_port}", limits=limits, timeout=args.timeout,
+            ) as client:
+                for endpoint in args.endpoints:
+                    send = make_sender(endpoint, client, questions)
+                    for _ in range(args.warmup):
+                        await send(0)
+                    for concurrency in args.concurrency:
+                        latencies, errors, duration = await run_level(
+                            endpoint, send, concurrency=concurrency, requests=args.requests,
+                        )
+                        p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) if latencies else (np.nan,) * 3
+                        results.append(Result(
+                            endpoint=endpoint,
+                            concurrency=concurrency,
+                            requests=args.requests,
+                            errors=errors,
+                            duration_seconds=round(duration, 3),
+                            requests_per_second=round(len(latencies) / duration, 1),
+                            p50_ms=round(float(p50), 1),
+                            p95_ms=round(float(p95), 1),
+                            p99_ms=round(float(p99), 1),
+                            peak_memory_mb=peak_memory_mb(app_server.pid),
+                        ))
+    return results
+
+
+def print_table(results: list[Result]) -> None:
+    """Print the results as a fixed-width table."""
+    header = f"{'endpoint':<8} {'conc':>5} {'reqs':>6} {'errs':>5} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'peak MB':>8}"
+    print(header)  # noqa: T201
+    print("-" * len(header))  # noqa: T201
+    for result in results:
+        memory = f"{result.peak_memory_mb:.0f}" if result.peak_memory_mb is not None else "n/a"
+        print(  # noqa: T201
+            f"{result.endpoint:<8} {result.concurrency:>5} {result.requests:>6} {result.errors:>5} "
+            f"{result.requests_per_second:>8.1f} {result.p50_ms:>8.1f} {result.p95_ms:>8.1f} "
+            f"{result.p99_ms:>8.1f} {memory:>8}",
+        )
+
+
+def parse_args() -> argparse.Namespace:
+    """Parse the command-line options."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--faqs", type=int, default=1000, help="Number of generated FAQ entries.")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32], help="Concurrency levels.")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per endpoint and level.")
+    parser.add_argument("--endpoints", nargs="+", choices=ENDPOINTS, default=["ask", "history"])
+    parser.add_argument("--warmup", type=int, default=5, help="Unmeasured requests per endpoint.")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Fake OpenAI base latency.")
+    parser.add_argument("--jitter-ms", type=float, default=10.0, help="Fake OpenAI latency jitter.")
+    parser.add_argument("--token-latency-ms", type=float, default=5.0, help="Fake OpenAI delay per answer token.")
+    parser.add_argument("--dimensions", type=int, default=1536, help="Fake embedding dimensionality.")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Client timeout per request in seconds.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the generated corpus.")
+    parser.add_argument("--output", type=Path, help="Also write the results to this JSON file.")
+    parser.add_argument("--keep", action="store_true", help="Keep the temporary directory with logs and database.")
+    return parser.parse_args()
+
+
+def main() -> None:
+    """Run the benchmark and report the results."""
+    args = parse_args()
+    workdir = Path(tempfile.mkdtemp(prefix="faq-bench-"))
+    try:
+        results = asyncio.run(benchmark(args, workdir))
+    finally:
+        if args.keep:
+            print(f"Benchmark files kept in {workdir}", file=sys.stderr)  # noqa: T201
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print_table(results)
+    if args.output is not None:
+        args.output.write_text(json.dumps([asdict(result) for result in results], indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+"""Recall and memory benchmark for compact FAQ index representations.
+
+Builds the FAQ index with every combination of the requested precisions, dimensions and
+re-scoring settings and reports recall@k against exact cosine similarity, the memory
+scanned per search and the single-query latency.
+
+Embeddings come from an existing database (`--database faq.db`), with real user questions
+from its query embedding cache as queries when there are enough of them, or are generated.
+Generated vectors concentrate their variance in the leading dimensions, like embeddings
+trained for truncation, but only real embeddings give numbers worth tuning against.
+
+Run with `python -m benchmarks.recall --faqs 20000 --dimensions 1536 --top-k 1 3 10`.
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+import numpy as np
+
+# The query handler is only imported for its cosine helper; no API call is made.
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+from services.faq_index import FAQIndex
+from services.query_handler import OpenAIQueryHandler
+from services.vector_codec import PRECISIONS, VectorCodec
+
+MIN_CACHED_QUERIES = 20
+VERIFIED_QUERIES = 3
+
+
+@dataclass
+class Result:
+    """Measurements for one index configuration."""
+
+    precision: str
+    dimensions: int
+    rescore_factor: int
+    memory_mb: float
+    compression: float
+    recall: dict[str, float]
+    p50_ms: float
+
+
+def generate_embeddings(args: argparse.Namespace) -> tuple[np.ndarray, np.ndarray]:
+    """Return clustered FAQ vectors and noisy copies of some of them as queries."""
+    rng = np.random.default_rng(args.seed)
+    spectrum = (np.arange(args.dimensions) + 1.0) ** -0.5
+    centers = rng.normal(size=(max(args.faqs // 50, 1), args.dimensions)) * spectrum
+    faqs = centers[rng.integers(0, centers.shape[0], args.faqs)]
+    faqs = faqs + rng.normal(scale=0.5, size=faqs.shape) * spectrum
+    sources = faqs[rng.integers(0, args.faqs, args.queries)]
+    queries = sources + rng.normal(scale=0.5, size=sources.shape) * spectrum
+    return faqs.astype(np.float32), queries.astype(np.float32)
+
+
+def read_embeddings(args: argparse.Namespace) -> tuple[np.ndarray, np.ndarray]:
+    """Return the FAQ embeddings of a database and its cached question embeddings, or noisy FAQs, as queries."""
+    with sqlite3.connect(args.database) as connection:
+        faqs = [
+            np.frombuffer(blob, dtype="<f4")
+            for (blob,) in connection.execute(
+                "SELECT embedding FROM faq_entries WHERE typeof(embedding) = 'blob' ORDER BY id",
+            )
+        ]
+        cached = [
+            np.frombuffer(blob, dtype="<f4")
+            for (blob,) in connection.execute(
+                "SELECT embedding FROM query_embedding_cache LIMIT ?", (args.queries,),
+            )
+        ]
+    if not faqs:
+        msg = f"No FAQ embeddings found in {args.database}"
+        raise SystemExit(msg)
+    matrix = np.asarray(faqs, dtype=np.float32)
+    if len(cached) >= MIN_CACHED_QUERIES:
+        return matrix, np.asarray(cached, dtype=np.float32)
+
+    rng = np.random.default_rng(args.seed)
+    sources = matrix[rng.integers(0, matrix.shape[0], args.queries)]
+    noise = rng.normal(scale=np.abs(matrix).mean(), size=sources.shape)
+    return matrix, (sources + noise).astype(np.float32)
+
+
+def verify_ground_truth(faqs: np.ndarray, queries: np.ndarray, exact: FAQIndex, k: int) -> None:
+    """Check that the exact index ranks the first queries like `_cosine_similarity` does."""
+    for query in queries[:VERIFIED_QUERIES]:
+        similarities = [OpenAIQueryHandler._cosine_similarity(query, faq) for faq in faqs]  # noqa: SLF001
+        expected = set(np.argsort(similarities)[::-1][:k].tolist())
+        found = {faq_id for faq_id, _ in exact.nearest(query, top_n=k)}
+        if expected != found:
+            msg = "Exact index search disagrees with _cosine_similarity"
+            raise SystemExit(msg)
+
+
+def measure(  # noqa: PLR0913
+    rows: list[tuple[int, str, np.ndarray]],
+    queries: np.ndarray,
+    truth: list[list[int]],
+    *,
+    codec: VectorCodec,
+    rescore_factor: int,
+    top_k: list[int],
+    baseline_bytes: int,
+) -> Result:
+    """Build one index configuration and measure its recall, memory and latency."""
+    index = FAQIndex(codec=codec, rescore_factor=rescore_factor)
+    index.build(rows)
+    found: list[list[int]] = []
+    durations: list[float] = []
+    for query in queries:
+        start = time.perf_counter()
+        matches = index.nearest(query, top_n=max(top_k))
+        durations.append(time.perf_counter() - start)
+        found.append([faq_id for faq_id, _ in matches])
+
+    recall = {
+        f"@{k}": float(np.mean([
+            len(set(expected[:k]) & set(result[:k])) / k for expected, result in zip(truth, found, strict=True)
+        ]))
+        for k in top_k
+    }
+    return Result(
+        precision=codec.precision,
+        dimensions=codec.dimensions or rows[0][2].shape[0],
+        rescore_factor=rescore_factor,
+        memory_mb=index.nbytes / 2**20,
+        compression=baseline_bytes / index.nbytes,
+        recall=recall,
+        p50_ms=float(np.percentile(durations, 50) * 1000),
+    )
+
+
+def print_table(results: list[Result], top_k: list[int]) -> None:
+    """Print the results as a fixed-width table."""
+    recall_header = " ".join(f"{'R@' + str(k):>7}" for k in top_k)
+    header = f"{'precision':<9} {'dims':>5} {'rescore':>7} {'MB':>8} {'x':>5} {recall_header} {'p50 ms':>8}"
+    print(header)  # noqa: T201
+    print("-" * len(header))  # noqa: T201
+    for result in results:
+        recall = " ".join(f"{result.recall[f'@{k}']:>7.3f}" for k in top_k)
+        print(  # noqa: T201
+            f"{result.precision:<9} {result.dimensions:>5} {result.rescore_factor or '-':>7} "
+            f"{result.memory_mb:>8.1f} {result.compression:>5.1f} {recall} {result.p50_ms:>8.2f}",
+        )
+
+
+def parse_args() -> argparse.Namespace:
+    """Parse the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database", type=Path, help="Read embeddings from this SQLite database.")
+    parser.add_argument("--faqs", type=int, default=20000, help="Number of generated FAQ vectors.")
+    parser.add_argument("--dimensions", type=int, default=1536, help="Dimensionality of generated vectors.")
+    parser.add_argument("--queries", type=int, default=200, help="Number of queries.")
+    parser.add_argument("--top-k", type=int, nargs="+", default=[1, 3, 10], help="Recall cut-offs.")
+    parser.add_argument("--precisions", nargs="+", choices=PRECISIONS, default=list(PRECISIONS))
+    parser.add_argument(
+        "--reduced-dimensions", type=int, nargs="+", default=[0, 512, 256],
+        help="Index dimensions to try; 0 keeps every dimension.",
+    )
+    parser.add_argument("--rescore-factor", type=int, default=4, help="Also measure re-scoring this many times k.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for generated vectors and noise.")
+    parser.add_argument("--output", type=Path, help="Also write the results to this JSON file.")
+    return parser.parse_args()
+
+
+def main() -> None:
+    """Run the benchmark and print the results."""
+    args = parse_args()
+    faqs, queries = read_embeddings(args) if args.database else generate_embeddings(args)
+    rows = [(faq_id, f"faq {faq_id}", vector) for faq_id, vector in enumerate(faqs)]
+    print(f"{faqs.shape[0]} FAQ vectors, {queries.shape[0]} queries, {faqs.shape[1]} dimensions", file=sys.stderr)  # noqa: T201
+
+    exact = FAQIndex()
+    exact.build(rows)
+    verify_ground_truth(faqs, queries, exact, max(args.top_k))
+    truth = [[faq_id for faq_id, _ in exact.nearest(query, top_n=max(args.top_k))] for query in queries]
+
+    configurations = [
+        (codec, rescore_factor)
+        for dimensions in args.reduced_dimensions
+        for codec in (VectorCodec(precision=precision, dimensions=dimensions) for precision in args.precisions)
+        for rescore_factor in dict.fromkeys([0, 0 if codec.identity else args.rescore_factor])
+    ]
+    results = [
+        measure(
+            rows, queries, truth,
+            codec=codec, rescore_factor=rescore_factor, top_k=args.top_k, baseline_bytes=exact.nbytes,
+        )
+        for codec, rescore_factor in configurations
+    ]
+    print_table(results, args.top_k)
+    if args.output:
+        args.output.write_text(json.dumps([asdict(result) for result in results], indent=2))
+
+
+if __name__ == "__main__":
+    main()
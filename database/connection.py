@@ -1,13 +1,30 @@
+import os
 from collections.abc import AsyncGenerator
 
+from dotenv import load_dotenv
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import AsyncAttrs, AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import DeclarativeBase
 
-DATABASE_URL: str = "sqlite+aiosqlite:///./faq.db"
+load_dotenv()
 
-engine: AsyncEngine = create_async_engine(DATABASE_URL, echo=True)
+DATABASE_URL: str = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./faq.db")
+DATABASE_ECHO: bool = os.getenv("DATABASE_ECHO", "true").lower() in {"1", "true", "yes"}
+
+engine: AsyncEngine = create_async_engine(DATABASE_URL, echo=DATABASE_ECHO)
 async_session_maker: async_sessionmaker[AsyncSession] = async_sessionmaker(engine, expire_on_commit=False)
 
+
+if engine.dialect.name == "sqlite":
+    @event.listens_for(engine.sync_engine, "connect")
+    def _configure_sqlite(dbapi_connection, _connection_record) -> None:
+        """Let several worker processes share the database: readers never block the writer."""
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA busy_timeout=5000")
+        cursor.close()
+
+
 class Base(AsyncAttrs, DeclarativeBase):
     """Base class that combines functionalities of `AsyncAttrs` and `DeclarativeBase`.
 
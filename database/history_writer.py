@@ -0,0 +1,115 @@
+import asyncio
+import logging
+import os
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+from dotenv import load_dotenv
+
+from database.connection import async_session_maker
+from database.manager import db_manager
+from utils.metrics import timed
+from utils.schemas import HistoryItemCreate
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+
+class HistoryWriter:
+    """Write-behind persistence of Q&A history.
+
+    Requests hand their history items to a bounded queue and return immediately; a
+    background task collects them into batches and stores each batch with one multi-row
+    insert once `batch_size` items are waiting or `flush_interval` seconds have passed.
+    A full queue makes `submit` wait, which applies backpressure instead of growing
+    memory. Until `start` is called, items are written directly.
+    """
+
+    def __init__(self, *, max_queue_size: int, batch_size: int, flush_interval: float) -> None:
+        self.max_queue_size = max_queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.written: int = 0
+        self._queue: asyncio.Queue[HistoryItemCreate | None] | None = None
+        self._task: asyncio.Task[None] | None = None
+
+    @property
+    def running(self) -> bool:
+        """Whether the background writer task is accepting items."""
+        return self._task is not None and not self._task.done()
+
+    @property
+    def depth(self) -> int:
+        """Return the number of items waiting to be written."""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def start(self) -> None:
+        """Start the background writer task."""
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._task = asyncio.create_task(self._run(self._queue), name="history-writer")
+
+    async def stop(self) -> None:
+        """Flush every queued item and stop the background writer task."""
+        if self._queue is None or self._task is None:
+            return
+        logger.info("[HistoryWriter] Draining %d queued items.", self.depth)
+        if not self._task.done():
+            await self._queue.put(None)
+        await self._task
+        self._queue = None
+        self._task = None
+
+    async def submit(self, item: HistoryItemCreate) -> None:
+        """Queue a history item for writing, stamping it with the current time."""
+        if item.created_at is None:
+            item.created_at = datetime.now(tz=ZoneInfo("Europe/Warsaw"))
+
+        with timed("history"):
+            if not self.running or self._queue is None:
+                async with async_session_maker() as session:
+                    await db_manager.create_history_item(item=item, session=session)
+                return
+
+            if self._queue.full():
+                logger.warning("[HistoryWriter] Queue is full (%d items), waiting for a flush.", self.depth)
+            await self._queue.put(item)
+
+    async def _run(self, queue: asyncio.Queue[HistoryItemCreate | None]) -> None:
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await queue.get()
+            if item is None:
+                break
+            batch: list[HistoryItemCreate] = [item]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(queue.get(), timeout=timeout)
+                except TimeoutError:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
+
+    async def _flush(self, batch: list[HistoryItemCreate]) -> None:
+        with timed("history_flush"):
+            async with async_session_maker() as session:
+                await db_manager.create_history_items(items=batch, session=session)
+        self.written += len(batch)
+        logger.debug("[HistoryWriter] Flushed %d items, %d still queued.", len(batch), self.depth)
+
+
+history_writer = HistoryWriter(
+    max_queue_size=int(os.getenv("HISTORY_QUEUE_SIZE", "1000")),
+    batch_size=int(os.getenv("HISTORY_BATCH_SIZE", "100")),
+    flush_interval=float(os.getenv("HISTORY_FLUSH_INTERVAL_SECONDS", "0.5")),
+)
@@ -1,28 +1,63 @@
+import asyncio
+import hashlib
+import json
 import logging
+import os
 from pathlib import Path
 
 import aiofiles
+import numpy as np
+from dotenv import load_dotenv
 from httpx import HTTPError
-from sqlalchemy import func, select
+from openai import OpenAIError
+from sqlalchemy import Connection, bindparam, delete, func, inspect, select, text, update
 from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy.ext.asyncio import AsyncSession
 
 from database.connection import Base, async_session_maker, engine
 from database.models import FAQ
+from database.types import VECTOR_DTYPE, Float32Vector
+from services.answer_cache import answer_cache
+from services.embedding_cache import embedding_cache
+from services.faq_index import faq_index
 from services.query_handler import query_handler
+from services.warmup import warmup_status
+from utils.file_lock import LOCK_DIR, FileLock
+from utils.schemas import FAQIngestReport
 
-FAQ_TXT_PATH: Path = Path(__file__).parent / "seed.txt"
+load_dotenv()
+
+FAQ_TXT_PATH: Path = Path(os.getenv("FAQ_SEED_PATH", str(Path(__file__).parent / "seed.txt")))
+EMBEDDING_BATCH_SIZE: int = int(os.getenv("EMBEDDING_BATCH_SIZE", "100"))
+EMBEDDING_CONCURRENCY: int = int(os.getenv("EMBEDDING_CONCURRENCY", "4"))
+INDEX_RELOAD_INTERVAL_SECONDS: float = float(os.getenv("INDEX_RELOAD_INTERVAL_SECONDS", "2"))
+FAQ_SYNC_ON_STARTUP: bool = os.getenv("FAQ_SYNC_ON_STARTUP", "false").lower() in {"1", "true", "yes"}
 
 logger = logging.getLogger(__name__)
 
+# Serializes ingestion within this process; `ingest_file_lock` does the same across workers.
+_ingest_lock = asyncio.Lock()
+ingest_file_lock = FileLock(LOCK_DIR / "faq_ingest.lock")
+
 
 async def init_db() -> None:
-    """Initialize the database connection and seed the FAQ table."""
+    """Initialize the database connection, prune the embedding cache table and seed the FAQ table.
+
+    The seed file is only read into an empty table, unless `FAQ_SYNC_ON_STARTUP` is set,
+    in which case the table is synced with it on every start. New entries are embedded
+    later by the warmup.
+    """
     await create_tables()
-    if await is_faq_table_empty():
+    await upgrade_schema()
+    await migrate_embedding_storage()
+    await create_fts_index()
+    await embedding_cache.prune()
+    if FAQ_SYNC_ON_STARTUP or await is_faq_table_empty():
         try:
             faqs: list[str] = await read_faq_file(file_path=FAQ_TXT_PATH)
-            await seed_faq_table(faq_contents=faqs)
+            if faqs:
+                await sync_faq_table(faq_contents=faqs)
+            else:
+                logger.warning("FAQ file %s is empty, leaving the FAQ table unchanged.", FAQ_TXT_PATH)
         except FileNotFoundError:
             logger.exception("FAQ file not found at path: %s", FAQ_TXT_PATH)
         except UnicodeDecodeError:
@@ -37,6 +72,92 @@ async def create_tables() -> None:
         await conn.run_sync(Base.metadata.create_all)
 
 
+async def upgrade_schema() -> None:
+    """Add columns and indexes introduced by newer model versions to tables created by older ones.
+
+    `create_all` only creates missing tables, so existing databases are brought up to date
+    with `ALTER TABLE ... ADD COLUMN` for every column they lack and `CREATE INDEX` for
+    every index they lack.
+    """
+    async with engine.begin() as conn:
+        await conn.run_sync(_upgrade_schema)
+
+
+def _upgrade_schema(conn: Connection) -> None:
+    inspector = inspect(conn)
+    for table in Base.metadata.sorted_tables:
+        existing: set[str] = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            column_type = column.type.compile(dialect=conn.dialect)
+            conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+            logger.info("Added missing column %s.%s", table.name, column.name)
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+
+
+FTS_SCHEMA: tuple[str, ...] = (
+    "DROP INDEX IF EXISTS ix_faq_entries_content",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS faq_fts USING fts5("
+    "content, content='faq_entries', content_rowid='id', tokenize='porter unicode61')",
+    "CREATE TRIGGER IF NOT EXISTS faq_entries_fts_insert AFTER INSERT ON faq_entries BEGIN "
+    "INSERT INTO faq_fts(rowid, content) VALUES (new.id, new.content); END",
+    "CREATE TRIGGER IF NOT EXISTS faq_entries_fts_delete AFTER DELETE ON faq_entries BEGIN "
+    "INSERT INTO faq_fts(faq_fts, rowid, content) VALUES ('delete', old.id, old.content); END",
+    "CREATE TRIGGER IF NOT EXISTS faq_entries_fts_update AFTER UPDATE OF content ON faq_entries BEGIN "
+    "INSERT INTO faq_fts(faq_fts, rowid, content) VALUES ('delete', old.id, old.content); "
+    "INSERT INTO faq_fts(rowid, content) VALUES (new.id, new.content); END",
+)
+
+
+async def create_fts_index() -> None:
+    """Create the `faq_fts` full-text index mirrored from `faq_entries` by triggers.
+
+    The plain B-tree index older versions kept on `faq_entries.content` is dropped, since
+    it cannot serve text search. A newly created full-text index is filled from the
+    existing rows once; afterwards the triggers keep it in sync.
+    """
+    async with engine.begin() as conn:
+        result = await conn.execute(text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'faq_fts'"))
+        exists = result.first() is not None
+        for statement in FTS_SCHEMA:
+            await conn.execute(text(statement))
+        if not exists:
+            await conn.execute(text("INSERT INTO faq_fts(faq_fts) VALUES ('rebuild')"))
+            logger.info("Built the faq_fts full-text index.")
+
+
+async def migrate_embedding_storage() -> None:
+    """Convert embeddings stored as JSON text by older versions into float32 BLOBs.
+
+    SQLite keeps the declared type of existing columns, but stores whatever value type is
+    written, so rewriting the values in place is enough and no table rebuild is needed.
+    """
+    async with engine.begin() as conn:
+        result = await conn.execute(
+            text("SELECT id, embedding FROM faq_entries WHERE typeof(embedding) = 'text'"),
+        )
+        rows = result.all()
+        if not rows:
+            return
+
+        await conn.execute(
+            text("UPDATE faq_entries SET embedding = :embedding WHERE id = :id"),
+            [
+                {"id": faq_id, "embedding": _json_to_blob(raw)}
+                for faq_id, raw in rows
+            ],
+        )
+    logger.info("[Embedding] Migrated %d embeddings from JSON to float32 storage.", len(rows))
+
+
+def _json_to_blob(raw: str) -> bytes | None:
+    """Convert a JSON-encoded embedding into float32 bytes, keeping JSON `null` as SQL NULL."""
+    decoded = json.loads(raw)
+    return None if decoded is None else np.asarray(decoded, dtype=VECTOR_DTYPE).tobytes()
+
+
 async def is_faq_table_empty() -> bool:
     """Check if the FAQ table is empty."""
     async with async_session_maker() as session:
@@ -55,39 +176,217 @@ async def read_faq_file(*, file_path: Path) -> list[str]:
     return lines
 
 
-async def seed_faq_table(*, faq_contents: list[str]) -> None:
-    """Seed the FAQ table with content."""
+def content_hash(content: str) -> str:
+    """Return the SHA-256 of an FAQ entry, which identifies it across ingestions."""
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+async def sync_faq_table(*, faq_contents: list[str]) -> tuple[int, list[int], int]:
+    """Make the FAQ table hold exactly the given entries, matching rows by content hash.
+
+    Unchanged entries keep their rows and embeddings, new or edited ones are inserted
+    without an embedding, and rows no longer listed (or duplicated) are deleted. Rows
+    written before hashes were stored get theirs filled in. Deletes and inserts are
+    committed together, so an edited entry is never missing from the table or the
+    full-text index. Returns the number of added entries, the deleted ids and the number
+    of unchanged entries.
+    """
+    wanted: dict[str, str] = {content_hash(content): content for content in faq_contents}
     async with async_session_maker() as session:
-        faqs: list[FAQ] = [FAQ(content=line) for line in faq_contents]
-        session.add_all(faqs)
+        result = await session.execute(select(FAQ.id, FAQ.content, FAQ.content_hash).order_by(FAQ.id))
+        kept: set[str] = set()
+        removed_ids: list[int] = []
+        missing_hashes: list[dict[str, int | str]] = []
+        for faq_id, content, stored_hash in result.all():
+            row_hash = stored_hash or content_hash(content)
+            if row_hash not in wanted or row_hash in kept:
+                removed_ids.append(faq_id)
+                continue
+            kept.add(row_hash)
+            if stored_hash is None:
+                missing_hashes.append({"faq_id": faq_id, "row_hash": row_hash})
+
+        if missing_hashes:
+            await session.execute(
+                update(FAQ.__table__).where(FAQ.id == bindparam("faq_id")).values(content_hash=bindparam("row_hash")),
+                missing_hashes,
+            )
+        if removed_ids:
+            await session.execute(delete(FAQ).where(FAQ.id.in_(removed_ids)))
+        added = [content for row_hash, content in wanted.items() if row_hash not in kept]
+        session.add_all([FAQ(content=content, content_hash=content_hash(content)) for content in added])
         await session.commit()
-    logger.info("Seeded %d FAQ entries into the database.", len(faqs))
+
+    logger.info(
+        "[Ingest] Synced FAQ table: %d added, %d removed, %d unchanged.", len(added), len(removed_ids), len(kept),
+    )
+    return len(added), removed_ids, len(kept)
 
 
-async def add_embedding() -> None:
-    """Add embeddings to FAQ entries with missing embeddings."""
+async def ingest_faqs(*, faq_contents: list[str]) -> FAQIngestReport:
+    """Sync the FAQ table with new entries and update the live index without a restart.
+
+    Only new or edited entries are embedded. Deleted entries leave the index right away,
+    and the saved snapshot is refreshed so that other workers pick the changes up.
+    """
+    async with _ingest_lock:
+        await ingest_file_lock.acquire()
+        try:
+            added, removed_ids, unchanged = await sync_faq_table(faq_contents=faq_contents)
+            faq_index.remove(removed_ids)
+            embedded = await add_embedding()
+            faq_index.save_ann()
+            await faq_index.save_snapshot_in_thread()
+            if removed_ids:
+                answer_cache.invalidate()
+            async with async_session_maker() as session:
+                result = await session.execute(select(func.count()).select_from(FAQ).where(FAQ.embedding.is_(None)))
+                pending = result.scalar_one()
+        finally:
+            ingest_file_lock.release()
+    return FAQIngestReport(
+        added=added, removed=len(removed_ids), unchanged=unchanged, embedded=embedded, pending_embeddings=pending,
+    )
+
+
+async def add_embedding() -> int:
+    """Add embeddings to FAQ entries with missing embeddings.
+
+    Only rows whose embedding is still `NULL` are selected and every batch is committed on
+    its own, so an interrupted backfill resumes where it stopped on the next start.
+    Returns the number of entries embedded.
+    """
     async with async_session_maker() as session:
-        result = await session.execute(select(FAQ).where(FAQ.embedding.is_(None)))
-        faqs_without_embeddings: list[FAQ] = list(result.scalars().all())
+        result = await session.execute(
+            select(FAQ.id, FAQ.content).where(FAQ.embedding.is_(None)).order_by(FAQ.id),
+        )
+        faqs_without_embeddings: list[tuple[int, str]] = [(faq_id, content) for faq_id, content in result.all()]
 
-        if not faqs_without_embeddings:
-            return
+    if not faqs_without_embeddings:
+        return 0
+
+    logger.info("[Embedding] Found %d FAQ entries to process.", len(faqs_without_embeddings))
+    warmup_status.embedding_total += len(faqs_without_embeddings)
+    embedded = await process_faq_embeddings(faqs_without_embeddings=faqs_without_embeddings)
+    answer_cache.invalidate()
+    return embedded
 
-        logger.info("[Embedding] Found %d FAQ entries to process.", len(faqs_without_embeddings))
-        await process_faq_embeddings(session=session, faqs_without_embeddings=faqs_without_embeddings)
 
+async def process_faq_embeddings(*, faqs_without_embeddings: list[tuple[int, str]]) -> int:
+    """Compute and save embeddings for `(id, content)` FAQ rows in concurrent batches."""
+    semaphore = asyncio.Semaphore(EMBEDDING_CONCURRENCY)
+    batches = [
+        faqs_without_embeddings[start:start + EMBEDDING_BATCH_SIZE]
+        for start in range(0, len(faqs_without_embeddings), EMBEDDING_BATCH_SIZE)
+    ]
+    processed: list[int] = await asyncio.gather(
+        *(process_embedding_batch(batch=batch, semaphore=semaphore) for batch in batches),
+    )
+    logger.info("[Embedding] Embedded %d of %d FAQ entries.", sum(processed), len(faqs_without_embeddings))
+    return sum(processed)
 
-async def process_faq_embeddings(*, session: AsyncSession, faqs_without_embeddings: list[FAQ]) -> None:
-    """Compute and save embeddings for a list of FAQs."""
-    for faq in faqs_without_embeddings:
+
+async def process_embedding_batch(*, batch: list[tuple[int, str]], semaphore: asyncio.Semaphore) -> int:
+    """Embed one batch of FAQ rows with a single API call and store it in one transaction."""
+    first_id, last_id = batch[0][0], batch[-1][0]
+    async with semaphore:
+        try:
+            vectors: list[list[float]] = await query_handler.generate_embeddings([content for _, content in batch])
+        except (HTTPError, OpenAIError):
+            logger.exception("[Embedding] API error while embedding FAQ ids %d-%d", first_id, last_id)
+            return 0
+
+        statement = (
+            update(FAQ.__table__)
+            .where(FAQ.id == bindparam("faq_id"), FAQ.embedding.is_(None))
+            .values(embedding=bindparam("vector", type_=Float32Vector))
+        )
         try:
-            embedding_vector: list[float] = await query_handler.generate_embedding(faq.content)
-            faq.embedding = embedding_vector
-            session.add(faq)
-            await session.commit()
-            logger.info("[Embedding] Successfully processed FAQ id=%d", faq.id)
+            async with async_session_maker() as session:
+                await session.execute(
+                    statement,
+                    [{"faq_id": faq_id, "vector": vector} for (faq_id, _), vector in zip(batch, vectors, strict=True)],
+                )
+                await session.commit()
         except SQLAlchemyError:
-            await session.rollback()
-            logger.exception("[Embedding] Database error while processing FAQ id=%d", faq.id)
-        except HTTPError:
-            logger.exception("[Embedding] HTTP error while fetching embedding for FAQ id=%d", faq.id)
+            logger.exception("[Embedding] Database error while saving FAQ ids %d-%d", first_id, last_id)
+            return 0
+
+    faq_index.upsert([(faq_id, content, vector) for (faq_id, content), vector in zip(batch, vectors, strict=True)])
+    warmup_status.embedded += len(batch)
+    logger.info("[Embedding] Successfully processed FAQ ids %d-%d", first_id, last_id)
+    return len(batch)
+
+
+async def build_faq_index() -> None:
+    """Load all embedded FAQ entries into the in-memory similarity index."""
+    async with async_session_maker() as session:
+        await faq_index.load(session=session)
+
+
+async def load_answer_cache() -> None:
+    """Warm the semantic answer cache from recent Q&A history."""
+    async with async_session_maker() as session:
+        await answer_cache.load(session=session)
+
+
+async def warm_up(*, leader_lock: FileLock | None = None) -> None:
+    """Load the search index, backfill missing embeddings and warm the answer cache.
+
+    Runs as a background task after startup, so the app serves liveness checks and
+    history while OpenAI calls are still in progress. The index is loaded first, so
+    the embedding backfill updates it incrementally instead of requiring a rebuild.
+
+    With several workers only the one holding `leader_lock` backfills and saves the index
+    snapshot; the others wait for that snapshot and map it, taking over the lock if the
+    leader exits first. Every worker then keeps watching the snapshot, so an index saved
+    by any of them reaches all the others.
+    """
+    try:
+        warmup_status.advance("index")
+        # Followers leave the loop via `break` once the leader's snapshot is mapped; the
+        # `else` branch runs for the leader.
+        while leader_lock is not None and not leader_lock.try_acquire():
+            if await load_index_snapshot():
+                break
+            await asyncio.sleep(INDEX_RELOAD_INTERVAL_SECONDS)
+        else:
+            await build_faq_index()
+            warmup_status.advance("embedding")
+            await add_embedding()
+            faq_index.save_ann()
+            await faq_index.save_snapshot_in_thread()
+        warmup_status.advance("answer_cache")
+        await load_answer_cache()
+        warmup_status.advance("done")
+    except Exception as exc:
+        # A failed leader hands over, so another worker can build and save the index.
+        if leader_lock is not None:
+            leader_lock.release()
+        warmup_status.fail(exc)
+        logger.exception("[Warmup] Startup warmup failed during the %s stage", warmup_status.stage)
+        return
+    logger.info("[Warmup] Finished: %s", warmup_status.snapshot())
+    await watch_index_snapshot()
+
+
+async def load_index_snapshot() -> bool:
+    """Map the saved index snapshot if it matches the database, returning whether it did."""
+    async with async_session_maker() as session:
+        return await faq_index.load_current_snapshot(session=session)
+
+
+async def watch_index_snapshot() -> None:
+    """Reload the index whenever another worker saves a newer snapshot."""
+    while True:
+        await asyncio.sleep(INDEX_RELOAD_INTERVAL_SECONDS)
+        if not faq_index.snapshot_stale:
+            continue
+        try:
+            reloaded = await load_index_snapshot()
+        except (OSError, SQLAlchemyError):
+            logger.exception("[Index] Failed to reload the index snapshot")
+            continue
+        if reloaded:
+            answer_cache.invalidate()
+            logger.info("[Index] Reloaded %d FAQ embeddings from an updated snapshot.", len(faq_index))
@@ -1,13 +1,14 @@
 import logging
+from collections.abc import AsyncIterator
 from datetime import datetime
 from zoneinfo import ZoneInfo
 
-from sqlalchemy import select
+from sqlalchemy import Row, Select, and_, func, insert, or_, select
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from database.models import QAHistory
-from utils.schemas import HistoryItemSchema
+from utils.schemas import HistoryItemCreate, HistoryItemSchema
 
 logger = logging.getLogger(__name__)
 
@@ -15,30 +16,86 @@ class DBManager:
     """A class for managing database operations."""
 
     @staticmethod
-    async def read_history_items(*, session: AsyncSession) -> list[HistoryItemSchema]:
-        """Read all history items from the database."""
+    def _history_query(*, before: int | None = None, search: str | None = None) -> Select:
+        """Build the newest-first history query, optionally after a keyset cursor and filtered by text.
+
+        `before` is the id of the last item already seen; rows are ordered by `(created_at, id)`,
+        which is covered by an index, so each page is an index range scan instead of a full sort.
+        """
+        statement = select(QAHistory.id, QAHistory.question, QAHistory.answer, QAHistory.created_at)
+        if before is not None:
+            cursor_created_at = select(QAHistory.created_at).where(QAHistory.id == before).scalar_subquery()
+            statement = statement.where(
+                or_(
+                    QAHistory.created_at < cursor_created_at,
+                    and_(QAHistory.created_at == cursor_created_at, QAHistory.id < before),
+                ),
+            )
+        if search:
+            statement = statement.where(
+                or_(
+                    QAHistory.question.icontains(search, autoescape=True),
+                    QAHistory.answer.icontains(search, autoescape=True),
+                ),
+            )
+        return statement.order_by(QAHistory.created_at.desc(), QAHistory.id.desc())
+
+    @staticmethod
+    def _to_schema(row: Row) -> HistoryItemSchema:
+        return HistoryItemSchema(id=row.id, question=row.question, answer=row.answer, created_at=row.created_at)
+
+    async def read_history_items(
+        self,
+        *,
+        session: AsyncSession,
+        limit: int | None = None,
+        before: int | None = None,
+        search: str | None = None,
+    ) -> list[HistoryItemSchema]:
+        """Read a page of history items from the database, newest first."""
+        statement = self._history_query(before=before, search=search)
+        if limit is not None:
+            statement = statement.limit(limit)
         try:
-            result = await session.execute(select(QAHistory).order_by(QAHistory.created_at.desc()))
-            history_items = result.scalars().all()
+            result = await session.execute(statement)
+            history_items = result.all()
         except SQLAlchemyError:
             logger.exception("Failed to read Q&A history")
             return []
         else:
-            return [
-                HistoryItemSchema(
-                    question=item.question,
-                    answer=item.answer,
-                    created_at=item.created_at,
-                ) for item in history_items
-            ]
+            return [self._to_schema(item) for item in history_items]
+
+    @staticmethod
+    async def latest_history_id(*, session: AsyncSession) -> int | None:
+        """Return the id of the newest history item, 0 when there is none, or None if it cannot be read."""
+        try:
+            result = await session.execute(select(func.max(QAHistory.id)))
+        except SQLAlchemyError:
+            logger.exception("Failed to read the latest Q&A history id")
+            return None
+        else:
+            return result.scalar() or 0
+
+    async def stream_history_items(
+        self,
+        *,
+        session: AsyncSession,
+        search: str | None = None,
+    ) -> AsyncIterator[HistoryItemSchema]:
+        """Yield every matching history item, newest first, without loading them all into memory."""
+        result = await session.stream(self._history_query(search=search))
+        async for row in result:
+            yield self._to_schema(row)
 
     @staticmethod
-    async def create_history_item(*, item: HistoryItemSchema, session: AsyncSession) -> None:
+    async def create_history_item(*, item: HistoryItemCreate, session: AsyncSession) -> None:
         """Create a new history item in the database."""
         record: QAHistory = QAHistory(
             question=item.question,
             answer=item.answer,
-            created_at=datetime.now(tz=ZoneInfo("Europe/Warsaw")),
+            created_at=item.created_at or datetime.now(tz=ZoneInfo("Europe/Warsaw")),
+            question_embedding=item.question_embedding,
+            context_hash=item.context_hash,
         )
         try:
             session.add(record)
@@ -47,5 +104,29 @@ class DBManager:
             logger.exception("Failed to save Q&A to history")
             await session.rollback()
 
+    @staticmethod
+    async def create_history_items(*, items: list[HistoryItemCreate], session: AsyncSession) -> None:
+        """Create several history items with one multi-row insert in a single transaction."""
+        if not items:
+            return
+        try:
+            await session.execute(
+                insert(QAHistory),
+                [
+                    {
+                        "question": item.question,
+                        "answer": item.answer,
+                        "created_at": item.created_at or datetime.now(tz=ZoneInfo("Europe/Warsaw")),
+                        "question_embedding": item.question_embedding,
+                        "context_hash": item.context_hash,
+                    }
+                    for item in items
+                ],
+            )
+            await session.commit()
+        except SQLAlchemyError:
+            logger.exception("Failed to save %d Q&A items to history", len(items))
+            await session.rollback()
+
 
 db_manager = DBManager()
@@ -1,10 +1,12 @@
 from datetime import datetime
 from zoneinfo import ZoneInfo
 
-from sqlalchemy import JSON, DateTime, String
+import numpy as np
+from sqlalchemy import DateTime, Index, String
 from sqlalchemy.orm import Mapped, mapped_column
 
 from database.connection import Base
+from database.types import Float32Vector
 
 
 class FAQ(Base):
@@ -18,8 +20,9 @@ class FAQ(Base):
     __tablename__ = "faq_entries"
 
     id: Mapped[int] = mapped_column(primary_key=True)
-    content: Mapped[str] = mapped_column(String, index=True)
-    embedding: Mapped[list[float] | None] = mapped_column(JSON, nullable=True)
+    content: Mapped[str] = mapped_column(String)
+    content_hash: Mapped[str | None] = mapped_column(String(64), nullable=True, index=True)
+    embedding: Mapped[np.ndarray | None] = mapped_column(Float32Vector, nullable=True)
 
 
 class QAHistory(Base):
@@ -31,6 +34,7 @@ class QAHistory(Base):
     """
 
     __tablename__ = "qa_history"
+    __table_args__ = (Index("ix_qa_history_created_at_id", "created_at", "id"),)
 
     id: Mapped[int] = mapped_column(primary_key=True)
     question: Mapped[str] = mapped_column(String, nullable=False)
@@ -40,3 +44,20 @@ class QAHistory(Base):
         default=datetime.now(tz=ZoneInfo("Europe/Warsaw")),
         nullable=False,
     )
+    question_embedding: Mapped[np.ndarray | None] = mapped_column(Float32Vector, nullable=True)
+    context_hash: Mapped[str | None] = mapped_column(String(64), nullable=True)
+
+
+class QueryEmbeddingCache(Base):
+    """Represent a cached embedding of a user question.
+
+    Rows are keyed by a hash of the normalized question text and the embedding model
+    name, so the cache survives restarts and is shared by every process using the database.
+    """
+
+    __tablename__ = "query_embedding_cache"
+
+    key: Mapped[str] = mapped_column(String(64), primary_key=True)
+    model: Mapped[str] = mapped_column(String, nullable=False)
+    embedding: Mapped[np.ndarray] = mapped_column(Float32Vector, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, index=True)
@@ -0,0 +1,36 @@
+import json
+from collections.abc import Sequence
+
+import numpy as np
+from sqlalchemy import Dialect, LargeBinary
+from sqlalchemy.types import TypeDecorator
+
+VECTOR_DTYPE = np.dtype("<f4")
+
+
+class Float32Vector(TypeDecorator[np.ndarray]):
+    """Store an embedding vector as a raw little-endian float32 BLOB.
+
+    A 1536-dimensional vector takes 6 KB instead of roughly 30 KB of JSON text, and
+    reading it back is a zero-copy `np.frombuffer` view over the fetched bytes rather
+    than a JSON parse. Legacy rows still holding JSON text are decoded transparently
+    until `migrate_embedding_storage` rewrites them.
+    """
+
+    impl = LargeBinary
+    cache_ok = True
+
+    def process_bind_param(self, value: Sequence[float] | np.ndarray | None, dialect: Dialect) -> bytes | None:  # noqa: ARG002
+        """Serialize the vector into float32 bytes."""
+        if value is None:
+            return None
+        return np.asarray(value, dtype=VECTOR_DTYPE).tobytes()
+
+    def process_result_value(self, value: bytes | str | None, dialect: Dialect) -> np.ndarray | None:  # noqa: ARG002
+        """Return a read-only float32 view over the stored bytes."""
+        if value is None:
+            return None
+        if isinstance(value, str):
+            decoded = json.loads(value)
+            return None if decoded is None else np.asarray(decoded, dtype=VECTOR_DTYPE)
+        return np.frombuffer(value, dtype=VECTOR_DTYPE)
@@ -3,5 +3,10 @@
 # Exit immediately if a command exits with a non-zero status
 set -e
 
-# Start the server
+# Start the server; APP_ENV=production runs one worker per core (or WEB_CONCURRENCY) without the file watcher
+if [ "${APP_ENV:-development}" = "production" ]; then
+    export WEB_CONCURRENCY="${WEB_CONCURRENCY:-$(nproc)}"
+    exec uvicorn main:app --host 0.0.0.0 --port 8000 --workers "$WEB_CONCURRENCY" \
+        --no-server-header --timeout-graceful-shutdown 30
+fi
 exec uvicorn main:app --reload --reload-dir . --host 0.0.0.0 --port 8000
@@ -1,62 +1,219 @@
+import atexit
+import copy
+import json
 import logging
 import logging.config
+import os
+import queue
 import sys
+from datetime import UTC, datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from pathlib import Path
 
-LOG_FILE_PATH = Path(__file__).parent / "app.log"
+from dotenv import load_dotenv
+
+from utils.file_lock import FileLock
+from utils.metrics import registry
+from utils.request_id import current_request_id
+
+load_dotenv()
+
+LOG_FILE_PATH = Path(os.getenv("LOG_FILE_PATH", str(Path(__file__).parent / "app.log")))
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 2**20)))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_MAX_MESSAGE_CHARS = int(os.getenv("LOG_MAX_MESSAGE_CHARS", "2000"))
+
+LOG_RECORDS_DROPPED = registry.counter(
+    "faq_log_records_dropped_total", "Log records dropped because the log queue was full.",
+)
+
+_listener: QueueListener | None = None
+
+
+class RequestIdFilter(logging.Filter):
+    """Attach the id of the request being handled to every record as `request_id`."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        """Add the request id; never rejects a record."""
+        record.request_id = current_request_id()
+        return True
+
+
+class BoundedQueueHandler(QueueHandler):
+    """Queue handler that never blocks the caller.
+
+    Messages longer than `max_message_chars` are truncated, and records are dropped and
+    counted in `faq_log_records_dropped_total` while `capacity` records are already queued.
+    """
+
+    def __init__(self, log_queue: queue.Queue, *, capacity: int, max_message_chars: int) -> None:
+        super().__init__(log_queue)
+        self.capacity = capacity
+        self.max_message_chars = max_message_chars
+        self._exception_formatter = logging.Formatter()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """Render the message and traceback now, as arguments may change before the record is written."""
+        message = record.getMessage()
+        if len(message) > self.max_message_chars:
+            message = f"{message[:self.max_message_chars]}... [{len(message) - self.max_message_chars} chars truncated]"
+        record = copy.copy(record)
+        record.message = record.msg = message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = self._exception_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        """Queue the record, or drop it if the queue is full."""
+        if self.queue.qsize() >= self.capacity:
+            LOG_RECORDS_DROPPED.inc()
+            return
+        self.queue.put_nowait(record)
+
+
+class SharedRotatingFileHandler(RotatingFileHandler):
+    """Size-rotated log file that several worker processes can append to.
+
+    Writes and rollovers happen under a file lock, and a process reopens the file when
+    another one has rotated it away.
+    """
+
+    def __init__(self, filename: Path, *, max_bytes: int, backup_count: int) -> None:
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8", delay=True)
+        self._file_lock = FileLock(Path(f"{self.baseFilename}.lock"))
+
+    def _reopen_if_rotated(self) -> None:
+        if self.stream is None:
+            return
+        try:
+            on_disk = os.stat(self.baseFilename)  # noqa: PTH116
+        except FileNotFoundError:
+            on_disk = None
+        opened = os.fstat(self.stream.fileno())
+        if on_disk is None or (on_disk.st_dev, on_disk.st_ino) != (opened.st_dev, opened.st_ino):
+            self.stream.close()
+            self.stream = self._open()
+        else:
+            self.stream.seek(0, os.SEEK_END)
+
+    def emit(self, record: logging.LogRecord) -> None:
+        """Write the record, rotating the file first if it is full."""
+        with self._file_lock.hold():
+            self._reopen_if_rotated()
+            super().emit(record)
+
+
+class JsonFormatter(logging.Formatter):
+    """Format records as one JSON object per line."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        """Return the record as a JSON line."""
+        entry = {
+            "time": datetime.fromtimestamp(record.created, tz=UTC).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", None),
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        if record.stack_info:
+            entry["stack"] = self.formatStack(record.stack_info)
+        return json.dumps(entry, ensure_ascii=False)
+
 
 def setup_logging() -> None:
     """Set up logging configuration.
 
-    Configure logging settings for the application, enabling both console and file outputs
-    with a standardized format. This function sets up loggers with various levels and handlers
-    to customize behavior for specific components of the application (e.g., `sqlalchemy.engine`).
-    The logging configuration is applied using Python's `logging.config.dictConfig`.
+    Records are put on a queue by the thread that emits them and written to stdout and to
+    the size-rotated `LOG_FILE_PATH` by a background thread, so logging never waits for
+    I/O on the event loop. `LOG_FORMAT=json` writes one JSON object per record, including
+    the id of the request that emitted it. Loggers with handlers of their own, such as
+    uvicorn's and SQLAlchemy's echo logger, are routed through the same queue.
     """
+    global _listener  # noqa: PLW0603
+    stop_logging()
+
+    formatter = JsonFormatter() if LOG_FORMAT == "json" else logging.Formatter(
+        "[%(asctime)s] %(levelname)s:     %(message)s", datefmt="%Y-%m-%d %H:%M:%S",
+    )
+    console = logging.StreamHandler(sys.stdout)
+    file = SharedRotatingFileHandler(LOG_FILE_PATH, max_bytes=LOG_MAX_BYTES, backup_count=LOG_BACKUP_COUNT)
+    for handler in (console, file):
+        handler.setFormatter(formatter)
+    log_queue: queue.Queue = queue.Queue()
+
     logging_config = {
         "version": 1,
         "disable_existing_loggers": False,
 
-        "formatters": {
-            "standard": {
-                "format": "[%(asctime)s] %(levelname)s:     %(message)s",
-                "datefmt": "%Y-%m-%d %H:%M:%S",
-            },
+        "filters": {
+            "request_id": {"()": RequestIdFilter},
         },
 
         "handlers": {
-            "console": {
-                "class": "logging.StreamHandler",
-                "level": "INFO",
-                "formatter": "standard",
-                "stream": sys.stdout,
-            },
-            "file": {
-                "class": "logging.FileHandler",
-                "level": "INFO",
-                "formatter": "standard",
-                "filename": LOG_FILE_PATH,
-                "encoding": "utf-8",
+            "queue": {
+                "()": BoundedQueueHandler,
+                "log_queue": log_queue,
+                "capacity": LOG_QUEUE_SIZE,
+                "max_message_chars": LOG_MAX_MESSAGE_CHARS,
+                "filters": ["request_id"],
             },
         },
 
         "loggers": {
             "sqlalchemy.engine": {
-                "handlers": ["console", "file"],
+                "handlers": ["queue"],
                 "level": "WARNING",
                 "propagate": False,
             },
+            # `echo=True` gives the engine logger a stdout handler of its own; replace it.
+            "sqlalchemy.engine.Engine": {
+                "handlers": ["queue"],
+                "propagate": False,
+            },
             "base": {
-                "handlers": ["console", "file"],
+                "handlers": ["queue"],
                 "level": "WARNING",
                 "propagate": False,
             },
+            "uvicorn": {
+                "handlers": ["queue"],
+                "propagate": False,
+            },
+            "uvicorn.access": {
+                "handlers": ["queue"],
+                "propagate": False,
+            },
         },
 
         "root": {
-            "level": "INFO",
-            "handlers": ["console", "file"],
+            "level": LOG_LEVEL,
+            "handlers": ["queue"],
         },
     }
 
     logging.config.dictConfig(logging_config)
+    _listener = QueueListener(log_queue, console, file)
+    _listener.start()
+
+
+def stop_logging() -> None:
+    """Write out the records still queued and stop the background writer."""
+    global _listener  # noqa: PLW0603
+    if _listener is None:
+        return
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    _listener = None
+
+
+atexit.register(stop_logging)
@@ -1,30 +1,274 @@
-from collections.abc import AsyncGenerator
-from contextlib import asynccontextmanager
+import asyncio
+import logging
+import math
+import os
+import secrets
+from collections.abc import AsyncGenerator, AsyncIterator
+from contextlib import asynccontextmanager, suppress
 from pathlib import Path
 from typing import Annotated, Any
 
-from fastapi import Depends, FastAPI
-from fastapi.responses import FileResponse
-from fastapi.staticfiles import StaticFiles
+import numpy as np
+from dotenv import load_dotenv
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from openai import APIConnectionError, InternalServerError, OpenAIError, RateLimitError
+from pydantic import TypeAdapter
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from database.connection import get_async_session
-from database.initialization import add_embedding, init_db
+from database.connection import async_session_maker, get_async_session
+from database.history_writer import history_writer
+from database.initialization import ingest_faqs, init_db, warm_up
 from database.manager import db_manager
 from logger.config import setup_logging
-from services.query_handler import query_handler
-from utils.schemas import AskRequest, AskResponse, HistoryItemSchema
+from services.answer_cache import answer_cache
+from services.embedding_cache import embedding_cache
+from services.faq_index import faq_index
+from services.query_handler import Retrieval, query_handler
+from services.rate_limiter import OpenAIOverloadedError, retry_after_seconds
+from services.warmup import warmup_status
+from utils.compression import StreamingAwareGZipMiddleware
+from utils.file_lock import LOCK_DIR, FileLock
+from utils.http_cache import REVALIDATE, etag_matches, not_modified
+from utils.metrics import MetricsMiddleware, registry, timed
+from utils.request_id import RequestIdMiddleware
+from utils.schemas import (
+    AskBatchItem,
+    AskBatchRequest,
+    AskRequest,
+    AskResponse,
+    FAQIngestReport,
+    HistoryItemCreate,
+    HistoryItemSchema,
+)
+from utils.sse import format_sse
+from utils.static_assets import StaticAssets
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+NO_CONTEXT_ANSWER = "Sorry, I don't have enough information to answer that question."
+OVERLOADED_DETAIL = "The assistant is busy right now, please try again shortly."
+DEFAULT_HISTORY_PAGE_SIZE = 50
+MAX_HISTORY_PAGE_SIZE = 500
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+ASK_BATCH_CONCURRENCY = int(os.getenv("ASK_BATCH_CONCURRENCY", "8"))
+MAX_CONTEXTS = int(os.getenv("CONTEXT_MAX_CONTEXTS", "3"))
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+GZIP_MINIMUM_SIZE = int(os.getenv("GZIP_MINIMUM_SIZE", "1000"))
+GZIP_COMPRESS_LEVEL = int(os.getenv("GZIP_COMPRESS_LEVEL", "5"))
+
+static_assets = StaticAssets(Path("static"))
+history_adapter = TypeAdapter(list[HistoryItemSchema])
+
+startup_lock = FileLock(LOCK_DIR / "faq_startup.lock")
+leader_lock = FileLock(LOCK_DIR / "faq_leader.lock")
+
+registry.callback(
+    "faq_cache_lookups_total",
+    "Embedding and answer cache lookups by result.",
+    "counter",
+    lambda: [
+        (("embedding", "hit"), embedding_cache.hits),
+        (("embedding", "miss"), embedding_cache.misses),
+        (("answer", "hit"), answer_cache.hits),
+        (("answer", "miss"), answer_cache.misses),
+    ],
+    ("cache", "result"),
+)
+registry.callback(
+    "faq_cache_entries",
+    "Entries currently held in memory by each cache.",
+    "gauge",
+    lambda: [(("embedding",), embedding_cache.stats()["size"]), (("answer",), len(answer_cache))],
+    ("cache",),
+)
+registry.callback("faq_index_entries", "FAQ entries in the search index.", "gauge", lambda: [((), len(faq_index))])
+registry.callback("faq_ready", "Whether the startup warmup has finished.", "gauge", lambda: [((), int(warmup_status.ready))])
+registry.callback(
+    "faq_history_queue_depth", "History items waiting to be written.", "gauge", lambda: [((), history_writer.depth)],
+)
+registry.callback(
+    "faq_history_written_total", "History items written by the background writer.", "counter",
+    lambda: [((), history_writer.written)],
+)
+
+
+def find_cached_answer(retrieval: Retrieval) -> tuple[str | None, np.ndarray | None]:
+    """Look the question up in the semantic answer cache, by the embedding computed during retrieval.
+
+    Returns the cached answer, if any, and the question embedding needed to cache a new one.
+    Both are `None` when the cache is disabled or retrieval did not embed the question, as in
+    `lexical` mode or after an embedding timeout, so the answer is generated without the cache.
+    """
+    if not answer_cache.enabled or retrieval.query_embedding is None:
+        return None, None
+    with timed("answer_cache"):
+        cached_answer = answer_cache.lookup(retrieval.query_embedding, retrieval.contexts)
+    return cached_answer, retrieval.query_embedding
+
+
+def remember_answer(
+    question: str,
+    contexts: list[str],
+    answer: str,
+    question_embedding: np.ndarray | None,
+) -> HistoryItemCreate:
+    """Build the history record of a generated answer and add the answer to the semantic answer cache."""
+    if question_embedding is None:
+        return HistoryItemCreate(question=question, answer=answer)
+    item = HistoryItemCreate(
+        question=question,
+        answer=answer,
+        question_embedding=question_embedding,
+        context_hash=answer_cache.context_hash(contexts),
+    )
+    answer_cache.add(question_embedding, contexts, answer)
+    return item
+
+
+async def answer_question(question: str, retrieval: Retrieval) -> tuple[str, HistoryItemCreate | None]:
+    """Answer a question from its retrieved contexts, using the semantic answer cache.
+
+    Returns the answer and the history record to save, which is `None` when no context was found.
+    """
+    contexts = retrieval.contexts
+    if not contexts:
+        return NO_CONTEXT_ANSWER, None
+
+    cached_answer, question_embedding = find_cached_answer(retrieval)
+    if cached_answer is not None:
+        return cached_answer, HistoryItemCreate(question=question, answer=cached_answer)
+
+    answer = await query_handler.generate_answer(question, contexts)
+    return answer, remember_answer(question, contexts, answer, question_embedding)
+
+
+async def answer_batch_item(
+    index: int,
+    question: str,
+    retrieval: Retrieval,
+    semaphore: asyncio.Semaphore,
+) -> tuple[AskBatchItem, HistoryItemCreate | None]:
+    """Answer one question of a batch; a failure is reported on the item instead of raised."""
+    async with semaphore:
+        try:
+            answer, item = await answer_question(question, retrieval)
+        except OpenAIError as exc:
+            logger.warning("Failed to answer batch question %d: %s", index, type(exc).__name__)
+            return AskBatchItem(index=index, question=question, error="Failed to get a response"), None
+        except Exception:
+            logger.exception("Failed to answer batch question %d", index)
+            return AskBatchItem(index=index, question=question, error="Failed to get a response"), None
+    return AskBatchItem(index=index, question=question, answer=answer), item
+
+
+async def save_history_batch(items: list[HistoryItemCreate]) -> None:
+    """Store the history records of a batch in one transaction."""
+    with timed("history"):
+        async with async_session_maker() as session:
+            await db_manager.create_history_items(items=items, session=session)
+
+
+async def stream_batch_answers(questions: list[str], retrievals: list[Retrieval]) -> AsyncIterator[str]:
+    """Answer a batch concurrently and yield each result as an NDJSON line as soon as it is ready."""
+    semaphore = asyncio.Semaphore(ASK_BATCH_CONCURRENCY)
+    tasks = [
+        asyncio.create_task(answer_batch_item(index, question, retrieval, semaphore))
+        for index, (question, retrieval) in enumerate(zip(questions, retrievals, strict=True))
+    ]
+    items: list[HistoryItemCreate] = []
+    try:
+        for next_result in asyncio.as_completed(tasks):
+            result, item = await next_result
+            if item is not None:
+                items.append(item)
+            yield result.model_dump_json() + "\n"
+    finally:
+        # Stop answering when the client goes away mid-stream.
+        for task in tasks:
+            task.cancel()
+    await save_history_batch(items)
+
+
+async def stream_answer_events(question: str, retrieval: Retrieval) -> AsyncIterator[str]:
+    """Produce the Server-Sent Events for a streamed answer and save it to the history."""
+    contexts = retrieval.contexts
+    if not contexts:
+        yield format_sse({"delta": NO_CONTEXT_ANSWER})
+        yield format_sse({"answer": NO_CONTEXT_ANSWER}, event="done")
+        return
+
+    cached_answer, question_embedding = find_cached_answer(retrieval)
+    if cached_answer is not None:
+        yield format_sse({"delta": cached_answer})
+        answer = cached_answer
+    else:
+        parts: list[str] = []
+        try:
+            async for delta in query_handler.stream_answer(question, contexts):
+                parts.append(delta)
+                yield format_sse({"delta": delta})
+        except OpenAIError:
+            logger.exception("Failed to stream answer from OpenAI")
+            yield format_sse({"detail": "Failed to get a response"}, event="error")
+            return
+        answer = "".join(parts).strip()
+        if not answer:
+            logger.warning("OpenAI streamed an empty answer")
+            yield format_sse({"detail": "Failed to get a response"}, event="error")
+            return
+
+    # The answer has been delivered; failing to record it must not leave the client without `done`.
+    try:
+        if cached_answer is not None:
+            item = HistoryItemCreate(question=question, answer=answer)
+        else:
+            item = remember_answer(question, contexts, answer, question_embedding)
+        await history_writer.submit(item)
+    except Exception:
+        logger.exception("Failed to save the streamed answer to history")
+    yield format_sse({"answer": answer}, event="done")
+
+
+async def stream_history_json(*, search: str | None) -> AsyncIterator[str]:
+    """Serialize history items into a JSON array one item at a time."""
+    async with async_session_maker() as session:
+        separator = ""
+        yield "["
+        async for item in db_manager.stream_history_items(session=session, search=search):
+            yield separator + item.model_dump_json()
+            separator = ","
+        yield "]"
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI) -> AsyncGenerator[None, Any]:
-    """Set up the application lifespan management."""
+    """Set up the application lifespan management.
+
+    Only the local database setup runs before the app starts serving; loading the index
+    and embedding new FAQ entries continue in the background, tracked by `/readyz`.
+    With several workers the database setup runs one worker at a time, and only one
+    worker leads the warmup.
+    """
     setup_logging()
-    await init_db()
-    await add_embedding()
+    await startup_lock.acquire()
+    try:
+        await init_db()
+    finally:
+        startup_lock.release()
+    await history_writer.start()
+    warmup_task = asyncio.create_task(warm_up(leader_lock=leader_lock))
 
     yield
 
+    warmup_task.cancel()
+    with suppress(asyncio.CancelledError):
+        await warmup_task
+    leader_lock.release()
+    await history_writer.stop()
+
 app = FastAPI(
     version="1.0.0",
     title="AI Knowledge Assistant",
@@ -35,17 +279,55 @@ app = FastAPI(
     docs_url="/api/docs",
 )
 
-app.mount("/static", StaticFiles(directory="static"), name="static")
+app.add_middleware(StreamingAwareGZipMiddleware, minimum_size=GZIP_MINIMUM_SIZE, compresslevel=GZIP_COMPRESS_LEVEL)
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(RequestIdMiddleware)
+
+
+@app.exception_handler(OpenAIOverloadedError)
+@app.exception_handler(RateLimitError)
+@app.exception_handler(APIConnectionError)
+@app.exception_handler(InternalServerError)
+async def openai_unavailable_handler(request: Request, exc: OpenAIError) -> JSONResponse:
+    """Answer with 503 when OpenAI calls are shed or keep failing after retries."""
+    if isinstance(exc, OpenAIOverloadedError):
+        retry_after = exc.retry_after
+    else:
+        logger.warning("OpenAI unavailable after retries: %s", type(exc).__name__)
+        retry_after = retry_after_seconds(exc) or 1.0
+    return JSONResponse(
+        {"detail": OVERLOADED_DETAIL},
+        status_code=503,
+        headers={"Retry-After": str(math.ceil(retry_after))},
+    )
+
+@app.api_route("/static/{name:path}", methods=["GET", "HEAD"], include_in_schema=False)
+async def serve_static(name: str, request: Request) -> Response:
+    """Serve a static asset; fingerprinted URLs are cached as immutable, plain ones are revalidated."""
+    return static_assets.response(name, request.headers)
 
-@app.get("/", include_in_schema=False)
-async def serve_frontend() -> FileResponse:
+@app.api_route("/", methods=["GET", "HEAD"], include_in_schema=False)
+async def serve_frontend(request: Request) -> Response:
     """Serve the frontend application by returning the main HTML file from the static directory.
 
     This function is an endpoint for the root URL of the application and serves the
-    `index.html` file located in the `static` directory. It handles asynchronous
-    requests and serves as the entry point for the client-side application.
+    `index.html` file located in the `static` directory, whose asset references point
+    at fingerprinted URLs. It serves as the entry point for the client-side application.
     """
-    return FileResponse(Path("static") / "index.html")
+    return static_assets.response("index.html", request.headers)
+
+@app.get("/healthz", include_in_schema=False)
+async def healthz() -> dict[str, str]:
+    """Report that the process is up and serving requests."""
+    return {"status": "ok"}
+
+
+@app.get("/readyz", include_in_schema=False)
+async def readyz() -> JSONResponse:
+    """Report whether the startup warmup has finished, with its progress; 503 until then."""
+    status = warmup_status.snapshot()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
 
 @app.post("/api/ask", response_model=AskResponse)
 async def ask_endpoint(
@@ -60,21 +342,135 @@ async def ask_endpoint(
     answer generation.
     """
     question = payload.question.strip()
-    contexts = await query_handler.get_relevant_contexts(question, session, top_n=1)
+    retrieval = await query_handler.get_relevant_contexts(question, session, top_n=MAX_CONTEXTS)
+    answer, item = await answer_question(question, retrieval)
+    if item is not None:
+        await history_writer.submit(item)
+    return AskResponse(answer=answer)
 
-    if not contexts:
-        return AskResponse(answer="Sorry, I don't have enough information to answer that question.")
+@app.post("/api/ask/batch", response_model=list[AskBatchItem])
+async def ask_batch_endpoint(
+    payload: AskBatchRequest,
+    session: Annotated[AsyncSession, Depends(get_async_session)],
+    stream: Annotated[bool, Query(description="Stream results as NDJSON in completion order.")] = False,  # noqa: FBT002
+) -> list[AskBatchItem] | StreamingResponse:
+    """Represent the API endpoint that answers many questions in one request.
 
-    answer = await query_handler.generate_answer(question, contexts)
-    await db_manager.create_history_item(item=HistoryItemSchema(question=question, answer=answer), session=session)
-    return AskResponse(answer=answer)
+    All questions are embedded with one upstream call and scored against the FAQ index
+    together; answers are generated concurrently (at most `ASK_BATCH_CONCURRENCY` at a
+    time) and the history of the whole batch is written in one transaction. Results are
+    returned in input order, or with `stream=true` as NDJSON lines in the order they
+    finish, each carrying its input `index`. A question that could not be answered has
+    `error` set instead of `answer`.
+    """
+    questions = [question.strip() for question in payload.questions]
+    retrievals = await query_handler.get_relevant_contexts_batch(questions, session, top_n=MAX_CONTEXTS)
+
+    if stream:
+        return StreamingResponse(stream_batch_answers(questions, retrievals), media_type="application/x-ndjson")
+
+    semaphore = asyncio.Semaphore(ASK_BATCH_CONCURRENCY)
+    results = await asyncio.gather(*(
+        answer_batch_item(index, question, retrieval, semaphore)
+        for index, (question, retrieval) in enumerate(zip(questions, retrievals, strict=True))
+    ))
+    await save_history_batch([item for _, item in results if item is not None])
+    return [result for result, _ in results]
+
+@app.post("/api/ask/stream", response_class=StreamingResponse)
+async def ask_stream_endpoint(
+    payload: AskRequest,
+    session: Annotated[AsyncSession, Depends(get_async_session)],
+) -> StreamingResponse:
+    """Represent the API endpoint that streams the answer as Server-Sent Events.
+
+    Each generated token is sent as a `data: {"delta": ...}` message as soon as OpenAI
+    produces it, followed by a final `done` event carrying the full answer. The Q&A pair
+    is saved to the history once the stream has completed.
+    """
+    question = payload.question.strip()
+    retrieval = await query_handler.get_relevant_contexts(question, session, top_n=MAX_CONTEXTS)
+    return StreamingResponse(
+        stream_answer_events(question, retrieval),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @app.get("/api/history", response_model=list[HistoryItemSchema])
-async def get_history(session: Annotated[AsyncSession, Depends(get_async_session)]) -> list[HistoryItemSchema]:
-    """Retrieve history items from the database.
+async def get_history(
+    session: Annotated[AsyncSession, Depends(get_async_session)],
+    limit: Annotated[int, Query(ge=1, le=MAX_HISTORY_PAGE_SIZE)] = DEFAULT_HISTORY_PAGE_SIZE,
+    before: Annotated[int | None, Query(description="Id of the oldest item already loaded.")] = None,
+    q: Annotated[str | None, Query(max_length=200, description="Only items containing this text.")] = None,
+    if_none_match: Annotated[str | None, Header()] = None,
+) -> Response:
+    """Retrieve a page of history items from the database, newest first.
+
+    Pages are selected with keyset pagination: pass the id of the last item of a page as
+    `before` to get the next, older page. When more items may follow, the cursor for the
+    next page is returned in the `X-Next-Cursor` header.
+
+    History is append-only, so the id of the newest item is the ETag of every page; a
+    request whose `If-None-Match` still matches it gets `304 Not Modified` without the
+    page being read.
+    """
+    headers = {"Cache-Control": REVALIDATE}
+    latest_id = await db_manager.latest_history_id(session=session)
+    if latest_id is not None:
+        headers["ETag"] = f'W/"history-{latest_id}"'
+        if etag_matches(if_none_match, headers["ETag"]):
+            return not_modified(headers)
+
+    items = await db_manager.read_history_items(session=session, limit=limit, before=before, search=q)
+    if len(items) == limit:
+        headers["X-Next-Cursor"] = str(items[-1].id)
+    # Serialized by pydantic-core in one pass, skipping the response model re-validation.
+    return Response(history_adapter.dump_json(items), media_type="application/json", headers=headers)
+
+@app.get("/api/history/export", response_class=StreamingResponse)
+async def export_history(
+    q: Annotated[str | None, Query(max_length=200, description="Only items containing this text.")] = None,
+) -> StreamingResponse:
+    """Stream the whole history as a JSON array without building it in memory."""
+    return StreamingResponse(stream_history_json(search=q), media_type="application/json")
+
+
+def require_admin(authorization: Annotated[str | None, Header()] = None) -> None:
+    """Let the request through only with the `ADMIN_TOKEN` bearer token; without a token the admin API is off."""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if authorization is None or not secrets.compare_digest(authorization.encode(), f"Bearer {ADMIN_TOKEN}".encode()):
+        raise HTTPException(status_code=401, detail="Invalid admin token", headers={"WWW-Authenticate": "Bearer"})
+
+
+@app.post(
+    "/api/admin/faq",
+    response_model=FAQIngestReport,
+    dependencies=[Depends(require_admin)],
+    openapi_extra={"requestBody": {"required": True, "content": {"text/plain": {"schema": {"type": "string"}}}}},
+)
+async def ingest_faq_endpoint(request: Request) -> FAQIngestReport:
+    """Replace the knowledge base with an uploaded FAQ file, one entry per line.
+
+    The file is diffed against the stored entries by content hash, so only new or edited
+    entries are embedded, and the live index is updated without a restart.
+    """
+    try:
+        text = (await request.body()).decode("utf-8")
+    except UnicodeDecodeError as exc:
+        raise HTTPException(status_code=400, detail="The FAQ file must be UTF-8 encoded.") from exc
+    faqs = [line.strip() for line in text.splitlines() if line.strip()]
+    if not faqs:
+        raise HTTPException(status_code=400, detail="The FAQ file has no entries.")
+    return await ingest_faqs(faq_contents=faqs)
+
+
+@app.get("/api/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def metrics() -> PlainTextResponse:
+    """Expose the service metrics in the Prometheus text format.
 
-    This function fetches a list of history items from the database using the
-    provided async database session. It is designed to work within a FastAPI
-    application and returns the data in the specified response schema.
+    Stage timings are histograms labelled by stage (`embedding`, `retrieval`, `completion`,
+    `history`, ...); OpenAI errors, retries and token usage, cache lookups and the history
+    queue depth are exported alongside them.
     """
-    return await db_manager.read_history_items(session=session)
+    return PlainTextResponse(registry.render(), media_type=PROMETHEUS_CONTENT_TYPE)
@@ -0,0 +1,135 @@
+import logging
+import os
+import zipfile
+from pathlib import Path
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+ASSIGN_CHUNK_SIZE = 8192
+
+
+class IVFFlatIndex:
+    """Inverted-file (IVF-flat) approximate nearest-neighbour index over unit vectors.
+
+    Vectors are partitioned into `n_lists` clusters with spherical k-means. A search only
+    scores the vectors in the `n_probe` clusters whose centroids are closest to the query,
+    which trades a little recall for touching a small fraction of the corpus. The index
+    stores FAQ ids per cluster, not the vectors themselves; the caller scores candidates
+    against its own matrix, so no embedding is held twice in memory.
+    """
+
+    def __init__(self, *, n_lists: int = 0, n_probe: int = 8, iterations: int = 10, seed: int = 0) -> None:
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.iterations = iterations
+        self.seed = seed
+        self.centroids: np.ndarray = np.empty((0, 0), dtype=np.float32)
+        self._lists: list[np.ndarray] = []
+        self._assignments: dict[int, int] = {}
+
+    def __len__(self) -> int:
+        """Return the number of indexed ids."""
+        return len(self._assignments)
+
+    @property
+    def trained(self) -> bool:
+        """Whether the cluster centroids have been computed."""
+        return self.centroids.shape[0] > 0
+
+    @property
+    def ids(self) -> np.ndarray:
+        """Return every indexed id."""
+        return np.fromiter(self._assignments, dtype=np.int64, count=len(self._assignments))
+
+    def _assign(self, vectors: np.ndarray) -> np.ndarray:
+        """Return the nearest centroid of every vector, processing large inputs in chunks."""
+        return np.concatenate(
+            [
+                np.argmax(vectors[start:start + ASSIGN_CHUNK_SIZE] @ self.centroids.T, axis=1)
+                for start in range(0, vectors.shape[0], ASSIGN_CHUNK_SIZE)
+            ],
+        ) if vectors.shape[0] else np.empty(0, dtype=np.int64)
+
+    def train(self, ids: np.ndarray, vectors: np.ndarray) -> None:
+        """Cluster the vectors with spherical k-means and index every id in its cluster."""
+        count = vectors.shape[0]
+        n_lists = self.n_lists or max(1, int(4 * np.sqrt(count)))
+        n_lists = min(n_lists, count)
+        rng = np.random.default_rng(self.seed)
+
+        sample_size = min(count, n_lists * 64)
+        sample = vectors[rng.choice(count, sample_size, replace=False)] if sample_size < count else vectors
+        self.centroids = sample[rng.choice(sample.shape[0], n_lists, replace=False)].astype(np.float32)
+
+        for _ in range(self.iterations):
+            assignment = self._assign(sample)
+            sums = np.zeros_like(self.centroids)
+            np.add.at(sums, assignment, sample)
+            empty = np.bincount(assignment, minlength=n_lists) == 0
+            sums[empty] = sample[rng.choice(sample.shape[0], int(empty.sum()))]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            self.centroids = (sums / norms).astype(np.float32)
+
+        self._lists = [np.empty(0, dtype=np.int64) for _ in range(n_lists)]
+        self._assignments = {}
+        self.add(ids, vectors)
+        logger.info("[ANN] Trained IVF index with %d lists over %d vectors.", n_lists, count)
+
+    def add(self, ids: np.ndarray, vectors: np.ndarray) -> None:
+        """Insert ids, or move existing ids to the cluster of their new vectors."""
+        if not self.trained or not len(ids):
+            return
+        ids = np.asarray(ids, dtype=np.int64)
+        self.remove(ids)
+        assignment = self._assign(vectors)
+        order = np.argsort(assignment, kind="stable")
+        lists, starts = np.unique(assignment[order], return_index=True)
+        for list_id, chunk in zip(lists, np.split(ids[order], starts[1:]), strict=True):
+            self._lists[list_id] = np.concatenate([self._lists[list_id], chunk])
+        self._assignments.update(zip(ids.tolist(), assignment.tolist(), strict=True))
+
+    def remove(self, ids: np.ndarray) -> None:
+        """Remove ids from the index; unknown ids are ignored."""
+        affected: dict[int, list[int]] = {}
+        for faq_id in np.asarray(ids, dtype=np.int64).tolist():
+            list_id = self._assignments.pop(faq_id, None)
+            if list_id is not None:
+                affected.setdefault(list_id, []).append(faq_id)
+        for list_id, removed in affected.items():
+            members = self._lists[list_id]
+            self._lists[list_id] = members[~np.isin(members, removed)]
+
+    def candidates(self, query: np.ndarray, *, n_probe: int | None = None) -> np.ndarray:
+        """Return the ids stored in the clusters closest to the unit query vector."""
+        if not self.trained:
+            return np.empty(0, dtype=np.int64)
+        n_probe = min(n_probe or self.n_probe, self.centroids.shape[0])
+        scores = self.centroids @ query
+        probed = np.argpartition(scores, scores.shape[0] - n_probe)[scores.shape[0] - n_probe:]
+        return np.concatenate([self._lists[list_id] for list_id in probed])
+
+    def save(self, path: Path) -> None:
+        """Persist the centroids and cluster membership to an `.npz` file, replacing it atomically."""
+        sizes = np.array([members.shape[0] for members in self._lists], dtype=np.int64)
+        members = np.concatenate(self._lists) if self._lists else np.empty(0, dtype=np.int64)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with tmp_path.open("wb") as file:
+            np.savez(file, centroids=self.centroids, sizes=sizes, members=members)
+        tmp_path.replace(path)
+
+    def load(self, path: Path) -> bool:
+        """Load a persisted index, returning `False` if the file does not exist or is unreadable."""
+        try:
+            with np.load(path) as data:
+                centroids, sizes, members = data["centroids"], data["sizes"], data["members"]
+        except (OSError, EOFError, KeyError, ValueError, zipfile.BadZipFile):
+            return False
+        self.centroids = centroids.astype(np.float32)
+        self._lists = np.split(members.astype(np.int64), np.cumsum(sizes)[:-1]) if sizes.shape[0] else []
+        self._assignments = {
+            faq_id: list_id for list_id, chunk in enumerate(self._lists) for faq_id in chunk.tolist()
+        }
+        return True
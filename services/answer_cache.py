@@ -0,0 +1,172 @@
+import hashlib
+import logging
+import os
+import time
+from collections import deque
+from collections.abc import Sequence
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import numpy as np
+from dotenv import load_dotenv
+from sqlalchemy import select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.models import QAHistory
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+HISTORY_TZ = ZoneInfo("Europe/Warsaw")
+
+
+@dataclass(slots=True, eq=False)
+class CachedAnswer:
+    """An answer remembered together with the normalized embedding of its question."""
+
+    stored_at: float
+    embedding: np.ndarray
+    answer: str
+
+
+class SemanticAnswerCache:
+    """Reuse recent answers for near-duplicate questions.
+
+    Answers are grouped by a hash of the FAQ contexts they were generated from, so a
+    cached answer is only returned when the new question retrieved exactly the same
+    context and its embedding is within `similarity_threshold` of the original question.
+    Editing an FAQ entry changes the hash of every context that contains it, which makes
+    stale answers unreachable; `invalidate` drops everything at once.
+    """
+
+    def __init__(
+        self,
+        *,
+        enabled: bool,
+        similarity_threshold: float,
+        ttl_seconds: float,
+        max_entries: int,
+    ) -> None:
+        self.enabled = enabled
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits: int = 0
+        self.misses: int = 0
+        self._groups: dict[str, list[CachedAnswer]] = {}
+        self._order: deque[tuple[str, CachedAnswer]] = deque()
+
+    @staticmethod
+    def context_hash(contexts: Sequence[str]) -> str:
+        """Hash the retrieved contexts that an answer depends on."""
+        return hashlib.sha256("\0".join(contexts).encode()).hexdigest()
+
+    @staticmethod
+    def _unit(embedding: Sequence[float] | np.ndarray) -> np.ndarray | None:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return None if norm == 0 else vector / norm
+
+    def __len__(self) -> int:
+        """Return the number of cached answers."""
+        return len(self._order)
+
+    def invalidate(self) -> None:
+        """Forget every cached answer, e.g. after the knowledge base has changed."""
+        self._groups.clear()
+        self._order.clear()
+
+    def _evict(self, now: float) -> None:
+        while self._order and (
+            len(self._order) > self.max_entries or now - self._order[0][1].stored_at >= self.ttl_seconds
+        ):
+            context_hash, entry = self._order.popleft()
+            group = self._groups.get(context_hash)
+            if group is None:
+                continue
+            group.remove(entry)
+            if not group:
+                del self._groups[context_hash]
+
+    def add(
+        self,
+        embedding: Sequence[float] | np.ndarray,
+        contexts: Sequence[str],
+        answer: str,
+    ) -> None:
+        """Remember an answer generated for a question embedding and its contexts."""
+        vector = self._unit(embedding)
+        if vector is None:
+            return
+        now = time.time()
+        self._insert(self.context_hash(contexts), CachedAnswer(stored_at=now, embedding=vector, answer=answer))
+        self._evict(now)
+
+    def _insert(self, context_hash: str, entry: CachedAnswer) -> None:
+        self._groups.setdefault(context_hash, []).append(entry)
+        self._order.append((context_hash, entry))
+
+    def lookup(self, embedding: Sequence[float] | np.ndarray, contexts: Sequence[str]) -> str | None:
+        """Return a cached answer for a near-duplicate question with the same contexts, if any."""
+        self._evict(time.time())
+        group = self._groups.get(self.context_hash(contexts))
+        vector = self._unit(embedding)
+        if not group or vector is None:
+            self.misses += 1
+            return None
+
+        scores = np.stack([entry.embedding for entry in group]) @ vector
+        best = int(np.argmax(scores))
+        if scores[best] < self.similarity_threshold:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return group[best].answer
+
+    async def load(self, *, session: AsyncSession) -> None:
+        """Warm the cache from recent `qa_history` rows that were stored with a question embedding."""
+        if not self.enabled:
+            return
+        cutoff = datetime.now(tz=HISTORY_TZ) - timedelta(seconds=self.ttl_seconds)
+        try:
+            result = await session.execute(
+                select(QAHistory.question_embedding, QAHistory.context_hash, QAHistory.answer, QAHistory.created_at)
+                .where(
+                    QAHistory.question_embedding.is_not(None),
+                    QAHistory.context_hash.is_not(None),
+                    QAHistory.created_at >= cutoff,
+                )
+                .order_by(QAHistory.created_at.desc())
+                .limit(self.max_entries),
+            )
+        except SQLAlchemyError:
+            logger.exception("[AnswerCache] Failed to load recent answers")
+            return
+
+        self.invalidate()
+        for embedding, context_hash, answer, created_at in reversed(result.all()):
+            vector = self._unit(embedding)
+            if vector is None:
+                continue
+            self._insert(context_hash, CachedAnswer(stored_at=_timestamp(created_at), embedding=vector, answer=answer))
+        self._evict(time.time())
+        logger.info("[AnswerCache] Loaded %d recent answers.", len(self))
+
+
+def _timestamp(value: datetime) -> float:
+    """Convert a `qa_history` timestamp to epoch seconds; SQLite returns them without a timezone."""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=HISTORY_TZ)
+    return value.timestamp()
+
+
+answer_cache = SemanticAnswerCache(
+    enabled=os.getenv("ANSWER_CACHE_ENABLED", "false").lower() in {"1", "true", "yes"},
+    similarity_threshold=float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95")),
+    ttl_seconds=float(os.getenv("ANSWER_CACHE_TTL_SECONDS", str(24 * 60 * 60))),
+    max_entries=int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "5000")),
+)
@@ -0,0 +1,75 @@
+import os
+from collections.abc import Sequence
+
+import numpy as np
+from dotenv import load_dotenv
+
+from utils.tokens import count_tokens
+
+load_dotenv()
+
+
+class ContextPacker:
+    """Chooses the FAQ contexts that go into a prompt.
+
+    Candidates are picked greedily by maximal marginal relevance: each step takes the
+    candidate with the best trade-off between relevance to the question and novelty
+    against the contexts already chosen (`mmr_lambda` weighs the two). Candidates nearly
+    identical to a chosen one are dropped, and candidates that no longer fit into
+    `token_budget` are skipped. The most relevant candidate is always kept, so a tight
+    budget never leaves a question without context.
+    """
+
+    def __init__(self, *, token_budget: int, mmr_lambda: float, duplicate_similarity: float) -> None:
+        self.token_budget = token_budget
+        self.mmr_lambda = mmr_lambda
+        self.duplicate_similarity = duplicate_similarity
+
+    def pack(
+        self,
+        candidates: Sequence[tuple[str, float]],
+        vectors: np.ndarray | None,
+        *,
+        max_contexts: int,
+    ) -> list[str]:
+        """Select up to `max_contexts` of the `(content, relevance)` candidates.
+
+        `vectors` holds the unit embedding of every candidate, row by row; without it
+        candidates are taken in relevance order and only the token budget applies.
+        """
+        if not candidates or max_contexts <= 0:
+            return []
+
+        relevance = np.asarray([score for _, score in candidates], dtype=np.float32)
+        redundancy = np.full(len(candidates), -np.inf, dtype=np.float32)
+        available = np.ones(len(candidates), dtype=bool)
+        selected: list[int] = []
+        used_tokens = 0
+
+        while len(selected) < max_contexts and available.any():
+            if vectors is None or not selected:
+                scores = relevance
+            else:
+                scores = self.mmr_lambda * relevance - (1 - self.mmr_lambda) * redundancy
+            best = int(np.argmax(np.where(available, scores, -np.inf)))
+            available[best] = False
+
+            if selected and redundancy[best] >= self.duplicate_similarity:
+                continue
+            tokens = count_tokens(candidates[best][0])
+            if selected and used_tokens + tokens > self.token_budget:
+                continue
+
+            selected.append(best)
+            used_tokens += tokens
+            if vectors is not None:
+                redundancy = np.maximum(redundancy, vectors @ vectors[best])
+
+        return [candidates[position][0] for position in selected]
+
+
+context_packer = ContextPacker(
+    token_budget=int(os.getenv("CONTEXT_TOKEN_BUDGET", "400")),
+    mmr_lambda=float(os.getenv("CONTEXT_MMR_LAMBDA", "0.7")),
+    duplicate_similarity=float(os.getenv("CONTEXT_DUPLICATE_SIMILARITY", "0.95")),
+)
@@ -0,0 +1,92 @@
+import asyncio
+import logging
+from collections.abc import Awaitable, Callable
+
+from utils.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = registry.histogram(
+    "faq_embedding_batch_size",
+    "Distinct texts per coalesced embeddings call.",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256),
+)
+COALESCED = registry.counter(
+    "faq_embedding_coalesced_total", "Embedding requests answered by an identical in-flight request.",
+)
+
+
+class EmbeddingBatcher:
+    """Coalesces concurrent embedding requests into multi-input API calls.
+
+    Identical texts requested while one is already in flight share its future. Distinct
+    texts arriving within `window_seconds` of the first one are sent together in a single
+    call of `embed_many`, up to `max_batch_size` texts, and each caller gets its own
+    vector back. A failed call fails every request in its batch.
+    """
+
+    def __init__(
+        self,
+        *,
+        embed_many: Callable[[list[str]], Awaitable[list[list[float]]]],
+        window_seconds: float,
+        max_batch_size: int,
+    ) -> None:
+        self.embed_many = embed_many
+        self.window_seconds = window_seconds
+        self.max_batch_size = max_batch_size
+        self._in_flight: dict[str, asyncio.Future[list[float]]] = {}
+        self._batch: dict[str, asyncio.Future[list[float]]] = {}
+        self._timer: asyncio.TimerHandle | None = None
+        self._tasks: set[asyncio.Task[None]] = set()
+
+    async def embed(self, text: str) -> list[float]:
+        """Return the embedding of the text, sharing the API call with concurrent requests."""
+        future = self._in_flight.get(text)
+        if future is not None:
+            COALESCED.inc()
+        else:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            # Consume the exception if every caller was cancelled, so it is not reported as lost.
+            future.add_done_callback(lambda done: done.cancelled() or done.exception())
+            self._in_flight[text] = future
+            self._batch[text] = future
+            if len(self._batch) >= self.max_batch_size:
+                self._flush()
+            elif self._timer is None:
+                self._timer = loop.call_later(self.window_seconds, self._flush)
+        # Shielded so that one cancelled caller does not cancel the result for the others.
+        return await asyncio.shield(future)
+
+    def _flush(self) -> None:
+        """Send the collected texts as one batch."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._batch = self._batch, {}
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._send(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, batch: dict[str, asyncio.Future[list[float]]]) -> None:
+        texts = list(batch)
+        BATCH_SIZE.observe(len(texts))
+        try:
+            embeddings = await self.embed_many(texts)
+        except asyncio.CancelledError:
+            for future in batch.values():
+                future.cancel()
+            raise
+        except Exception as exc:  # noqa: BLE001 - handed to every waiting caller
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(exc)
+        else:
+            for future, embedding in zip(batch.values(), embeddings, strict=True):
+                if not future.done():
+                    future.set_result(embedding)
+        finally:
+            for text in texts:
+                self._in_flight.pop(text, None)
@@ -0,0 +1,179 @@
+import hashlib
+import logging
+import os
+import time
+from collections import OrderedDict
+from datetime import UTC, datetime, timedelta
+
+import numpy as np
+from dotenv import load_dotenv
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.exc import SQLAlchemyError
+
+from database.connection import async_session_maker
+from database.models import QueryEmbeddingCache
+from database.types import VECTOR_DTYPE
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingCache:
+    """Two-level cache of question embeddings.
+
+    Lookups go to an in-process LRU first and fall back to the `query_embedding_cache`
+    table, so repeated questions skip the embedding API even across restarts. Entries
+    expire after `ttl_seconds` in both levels. Every `prune_interval` writes, expired rows
+    are deleted from the table and it is cut down to the `max_rows` newest rows.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_size: int,
+        ttl_seconds: float,
+        persistent: bool = True,
+        max_rows: int = 100_000,
+        prune_interval: int = 1000,
+    ) -> None:
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.persistent = persistent
+        self.max_rows = max_rows
+        self.prune_interval = prune_interval
+        self.hits: int = 0
+        self.misses: int = 0
+        self._writes_since_prune: int = 0
+        self._entries: OrderedDict[str, tuple[float, np.ndarray]] = OrderedDict()
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """Normalize question text so trivially different spellings share one entry."""
+        return " ".join(text.casefold().split())
+
+    @classmethod
+    def make_key(cls, text: str, model: str | None) -> str:
+        """Build the cache key for a question and embedding model."""
+        return hashlib.sha256(f"{model}\0{cls.normalize(text)}".encode()).hexdigest()
+
+    def stats(self) -> dict[str, int]:
+        """Return the hit/miss counters and the current in-memory size."""
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+    def _remember(self, key: str, embedding: np.ndarray, stored_at: float) -> None:
+        self._entries[key] = (stored_at, embedding)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    async def get(self, text: str, model: str | None) -> np.ndarray | None:
+        """Return the cached embedding for the question, or `None` on a miss."""
+        key = self.make_key(text, model)
+        now = time.time()
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            stored_at, embedding = entry
+            if now - stored_at < self.ttl_seconds:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return embedding
+            del self._entries[key]
+
+        if self.persistent:
+            embedding = await self._read(key, now=now)
+            if embedding is not None:
+                self.hits += 1
+                return embedding
+
+        self.misses += 1
+        return None
+
+    async def set(self, text: str, model: str | None, embedding: list[float] | np.ndarray) -> None:
+        """Store the embedding for the question in memory and, if enabled, in the database."""
+        key = self.make_key(text, model)
+        vector = np.asarray(embedding, dtype=VECTOR_DTYPE)
+        now = time.time()
+        self._remember(key, vector, now)
+
+        if self.persistent:
+            await self._write(key, model=model, embedding=vector, stored_at=now)
+            self._writes_since_prune += 1
+            if self._writes_since_prune >= self.prune_interval:
+                await self.prune()
+
+    async def prune(self) -> int:
+        """Delete expired rows and the oldest rows beyond `max_rows` from the table, returning how many."""
+        self._writes_since_prune = 0
+        cutoff = datetime.fromtimestamp(time.time(), tz=UTC) - timedelta(seconds=self.ttl_seconds)
+        overflow = (
+            select(QueryEmbeddingCache.key)
+            .order_by(QueryEmbeddingCache.created_at.desc(), QueryEmbeddingCache.key)
+            .offset(self.max_rows)
+        )
+        try:
+            async with async_session_maker() as session:
+                expired = await session.execute(
+                    delete(QueryEmbeddingCache).where(QueryEmbeddingCache.created_at < cutoff),
+                )
+                evicted = await session.execute(
+                    delete(QueryEmbeddingCache).where(QueryEmbeddingCache.key.in_(overflow.scalar_subquery())),
+                )
+                await session.commit()
+        except SQLAlchemyError:
+            logger.exception("[EmbeddingCache] Failed to prune cached embeddings")
+            return 0
+        removed = expired.rowcount + evicted.rowcount
+        if removed:
+            logger.info("[EmbeddingCache] Pruned %d cached embeddings.", removed)
+        return removed
+
+    async def _read(self, key: str, *, now: float) -> np.ndarray | None:
+        cutoff = datetime.fromtimestamp(now, tz=UTC) - timedelta(seconds=self.ttl_seconds)
+        try:
+            async with async_session_maker() as session:
+                result = await session.execute(
+                    select(QueryEmbeddingCache.embedding, QueryEmbeddingCache.created_at).where(
+                        QueryEmbeddingCache.key == key,
+                        QueryEmbeddingCache.created_at >= cutoff,
+                    ),
+                )
+                row = result.first()
+        except SQLAlchemyError:
+            logger.exception("[EmbeddingCache] Failed to read cached embedding")
+            return None
+
+        if row is None:
+            return None
+        embedding, created_at = row
+        self._remember(key, embedding, created_at.replace(tzinfo=UTC).timestamp())
+        return embedding
+
+    async def _write(self, key: str, *, model: str | None, embedding: np.ndarray, stored_at: float) -> None:
+        created_at = datetime.fromtimestamp(stored_at, tz=UTC)
+        statement = insert(QueryEmbeddingCache).values(
+            key=key,
+            model=model or "",
+            embedding=embedding,
+            created_at=created_at,
+        )
+        statement = statement.on_conflict_do_update(
+            index_elements=[QueryEmbeddingCache.key],
+            set_={"embedding": statement.excluded.embedding, "created_at": statement.excluded.created_at},
+        )
+        try:
+            async with async_session_maker() as session:
+                await session.execute(statement)
+                await session.commit()
+        except SQLAlchemyError:
+            logger.exception("[EmbeddingCache] Failed to persist embedding")
+
+
+embedding_cache = EmbeddingCache(
+    max_size=int(os.getenv("EMBEDDING_CACHE_SIZE", "1024")),
+    ttl_seconds=float(os.getenv("EMBEDDING_CACHE_TTL_SECONDS", str(7 * 24 * 60 * 60))),
+    max_rows=int(os.getenv("EMBEDDING_CACHE_MAX_ROWS", "100000")),
+    prune_interval=int(os.getenv("EMBEDDING_CACHE_PRUNE_INTERVAL", "1000")),
+)
@@ -0,0 +1,515 @@
+import asyncio
+import logging
+import os
+import time
+import zlib
+from collections.abc import Iterable, Sequence
+from pathlib import Path
+
+import numpy as np
+from dotenv import load_dotenv
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.models import FAQ
+from services.ann_index import IVFFlatIndex
+from services.vector_codec import VectorCodec
+from utils.file_lock import FileLock
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+
+class FAQIndex:
+    """Resident index of FAQ embeddings used for similarity search.
+
+    All embeddings are kept in a single L2-normalized float32 matrix, so scoring a
+    question against the whole knowledge base is one matrix-vector product followed
+    by a partial top-k selection. The matrix is replaced rather than mutated on
+    updates, which lets in-flight searches keep using the previous snapshot.
+
+    With the `ivf` backend and at least `ann_min_size` entries, searches only score the
+    candidates returned by an IVF-flat index; exact search remains available as a
+    fallback and as the baseline for recall measurements.
+
+    The matrix can be saved as a snapshot next to `snapshot_path`, so a restart maps it
+    from disk instead of decoding every embedding from the database. Snapshots are loaded
+    read-only with `mmap`, so several worker processes share one copy in the page cache.
+
+    Scoring can use a compact copy of the matrix made by `codec` (`float16`, `int8` and/or
+    fewer dimensions) instead. The full-precision matrix then stays mapped from the snapshot
+    and is only read to re-score the best `rescore_factor * top_n` candidates, if enabled,
+    and for updates.
+    """
+
+    def __init__(  # noqa: PLR0913
+        self,
+        *,
+        backend: str = "exact",
+        ann: IVFFlatIndex | None = None,
+        ann_min_size: int = 0,
+        ann_path: Path | None = None,
+        snapshot_path: Path | None = None,
+        codec: VectorCodec | None = None,
+        rescore_factor: int = 0,
+    ) -> None:
+        self.backend = backend
+        self.ann = ann if ann is not None else IVFFlatIndex()
+        self.ann_min_size = ann_min_size
+        self.ann_path = ann_path
+        self.snapshot_path = snapshot_path
+        self.codec = codec if codec is not None else VectorCodec()
+        self.rescore_factor = rescore_factor
+        self._snapshot_version: int | None = None
+        self._ids: list[int] = []
+        self._contents: list[str] = []
+        self._positions: dict[int, int] = {}
+        self._matrix: np.ndarray = np.empty((0, 0), dtype=np.float32)
+        self._codes: np.ndarray = self._matrix
+        self._scales: np.ndarray | None = None
+        self._id_order: tuple[np.ndarray, np.ndarray] | None = None
+        self.loaded: bool = False
+
+    def __len__(self) -> int:
+        """Return the number of indexed FAQ entries."""
+        return len(self._ids)
+
+    @property
+    def rescoring(self) -> bool:
+        """Whether the best candidates of the compact scores are re-scored at full precision."""
+        return self.rescore_factor > 0 and not self.codec.identity
+
+    @property
+    def nbytes(self) -> int:
+        """Return the memory used by the vectors that searches scan."""
+        return self._codes.nbytes + (self._scales.nbytes if self._scales is not None else 0)
+
+    @property
+    def ann_active(self) -> bool:
+        """Whether searches currently go through the approximate index."""
+        return self.backend == "ivf" and self.ann.trained and len(self) >= self.ann_min_size
+
+    @staticmethod
+    def _normalize(matrix: np.ndarray) -> np.ndarray:
+        """Scale every row of the matrix to unit length, leaving zero rows untouched."""
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    @staticmethod
+    def _checksums(contents: Sequence[str]) -> np.ndarray:
+        """Return a CRC32 of every content, used to tell whether a snapshot is still current."""
+        return np.fromiter((zlib.crc32(content.encode()) for content in contents), dtype=np.uint32, count=len(contents))
+
+    @staticmethod
+    def _unit_query(query_embedding: Sequence[float]) -> np.ndarray | None:
+        """Return the query as a unit float32 vector, or `None` for a zero vector."""
+        query = np.asarray(query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        return None if norm == 0 else query / norm
+
+    async def load(self, *, session: AsyncSession) -> None:
+        """Load every embedded FAQ entry and rebuild the index, from the snapshot when it is current."""
+        if await self.load_current_snapshot(session=session):
+            logger.info("[Index] Loaded %d FAQ embeddings from snapshot %s.", len(self), self.snapshot_path)
+            return
+
+        result = await session.execute(
+            select(FAQ.id, FAQ.content, FAQ.embedding).where(FAQ.embedding.is_not(None)),
+        )
+        self.build(result.all())
+        logger.info("[Index] Loaded %d FAQ embeddings.", len(self))
+
+    async def load_current_snapshot(self, *, session: AsyncSession) -> bool:
+        """Load the snapshot if it holds exactly the embedded FAQ entries in the database."""
+        if self.snapshot_path is None:
+            return False
+        result = await session.execute(
+            select(FAQ.id, FAQ.content).where(FAQ.embedding.is_not(None)).order_by(FAQ.id),
+        )
+        return self.load_snapshot(result.all())
+
+    def build(self, rows: Iterable[tuple[int, str, Sequence[float]]]) -> None:
+        """Replace the index contents with the given `(id, content, embedding)` rows."""
+        rows = [row for row in rows if row[2] is not None and len(row[2])]
+        matrix = (
+            self._normalize(np.asarray([embedding for _, _, embedding in rows], dtype=np.float32))
+            if rows else np.empty((0, 0), dtype=np.float32)
+        )
+        self._replace([faq_id for faq_id, _, _ in rows], [content for _, content, _ in rows], matrix)
+
+    def _replace(self, ids: list[int], contents: list[str], matrix: np.ndarray) -> None:
+        """Swap in a new set of entries and their unit embedding matrix."""
+        self._ids = ids
+        self._contents = contents
+        self._positions = {faq_id: position for position, faq_id in enumerate(self._ids)}
+        self._id_order = None
+        self._matrix = matrix
+        self._codes, self._scales = self.codec.encode(matrix)
+        self._snapshot_version = None
+        self.loaded = True
+        self._sync_ann()
+
+    def _matrix_path(self, generation: int) -> Path:
+        """Return the path of the `.npy` matrix file belonging to a snapshot generation."""
+        return self.snapshot_path.with_name(f"{self.snapshot_path.stem}.{generation}.npy")
+
+    def snapshot_version(self) -> int | None:
+        """Return the modification time of the saved snapshot, or `None` if there is none."""
+        try:
+            return self.snapshot_path.stat().st_mtime_ns if self.snapshot_path is not None else None
+        except FileNotFoundError:
+            return None
+
+    @property
+    def snapshot_stale(self) -> bool:
+        """Whether a snapshot exists that differs from the one this index was last loaded from or saved to."""
+        version = self.snapshot_version()
+        return version is not None and version != self._snapshot_version
+
+    def save_snapshot(self) -> None:
+        """Persist the entries to the snapshot, unless it already holds them.
+
+        The matrix goes to its own `.npy` file, sorted by id, and the ids and content checksums
+        to `snapshot_path`, which is replaced last so readers never see a partial snapshot.
+        The index then switches to the memory-mapped file.
+        """
+        state = self._snapshot_state()
+        if state is not None:
+            self._write_snapshot(*state)
+            self._load_saved(state[1], state[2])
+
+    async def save_snapshot_in_thread(self) -> None:
+        """Like `save_snapshot`, but write the files in a worker thread so the event loop keeps serving.
+
+        The index only switches to the saved file if it did not change in the meantime.
+        """
+        state = self._snapshot_state()
+        if state is None:
+            return
+        await asyncio.to_thread(self._write_snapshot, *state)
+        if state[3] is self._matrix:
+            self._load_saved(state[1], state[2])
+
+    def _snapshot_state(self) -> tuple[np.ndarray, list[int], list[str], np.ndarray] | None:
+        """Return the id order, sorted ids and contents and the matrix to save, or `None` if the snapshot is current."""
+        if self.snapshot_path is None or not self.loaded or self._snapshot_version is not None:
+            return None
+        order = np.argsort(np.asarray(self._ids, dtype=np.int64), kind="stable")
+        ids = [self._ids[position] for position in order]
+        contents = [self._contents[position] for position in order]
+        return order, ids, contents, self._matrix
+
+    def _write_snapshot(self, order: np.ndarray, ids: list[int], contents: list[str], matrix: np.ndarray) -> None:
+        """Write the snapshot files for the given state without touching the live index."""
+        generation = time.time_ns()
+        with FileLock(self.snapshot_path.with_suffix(".lock")).hold():
+            matrix_path = self._matrix_path(generation)
+            np.save(matrix_path, np.ascontiguousarray(matrix[order]) if ids else matrix)
+            tmp_path = self.snapshot_path.with_name(f"{self.snapshot_path.name}.tmp")
+            with tmp_path.open("wb") as file:
+                np.savez(
+                    file,
+                    ids=np.asarray(ids, dtype=np.int64),
+                    checksums=self._checksums(contents),
+                    generation=np.int64(generation),
+                )
+            tmp_path.replace(self.snapshot_path)
+            for old_path in self.snapshot_path.parent.glob(f"{self.snapshot_path.stem}.*.npy"):
+                if old_path != matrix_path:
+                    # Workers still mapping an old file keep their view of it until they reload.
+                    old_path.unlink(missing_ok=True)
+
+    def _load_saved(self, ids: list[int], contents: list[str]) -> None:
+        """Switch to the snapshot just saved for these entries."""
+        if not self.load_snapshot(zip(ids, contents, strict=True)):
+            logger.warning("[Index] Could not reload the snapshot just saved to %s.", self.snapshot_path)
+
+    def load_snapshot(self, rows: Iterable[tuple[int, str]]) -> bool:
+        """Rebuild the index from the snapshot, taking contents from the `(id, content)` rows.
+
+        Returns `False`, leaving the index untouched, when the snapshot is missing, unreadable,
+        or does not hold exactly these entries with these contents.
+        """
+        if self.snapshot_path is None:
+            return False
+        rows = sorted(rows)
+        version = self.snapshot_version()
+        try:
+            with np.load(self.snapshot_path) as data:
+                ids, checksums, generation = data["ids"], data["checksums"], int(data["generation"])
+            matrix = np.load(self._matrix_path(generation), mmap_mode="r" if ids.shape[0] else None)
+        except (OSError, KeyError, ValueError):
+            return False
+
+        expected_ids = np.asarray([faq_id for faq_id, _ in rows], dtype=np.int64)
+        contents = [content for _, content in rows]
+        if (
+            matrix.shape[0] != ids.shape[0]
+            or not np.array_equal(ids, expected_ids)
+            or not np.array_equal(checksums, self._checksums(contents))
+        ):
+            return False
+        self._replace(expected_ids.tolist(), contents, matrix)
+        self._snapshot_version = version
+        return True
+
+    def upsert(self, rows: Iterable[tuple[int, str, Sequence[float]]]) -> None:
+        """Insert new entries or replace existing ones without rebuilding the whole index.
+
+        Updates arriving before the first `load` are ignored, since loading picks them up anyway.
+        """
+        rows = [row for row in rows if row[2] is not None and len(row[2])]
+        if not rows or not self.loaded:
+            return
+
+        vectors = self._normalize(np.asarray([embedding for _, _, embedding in rows], dtype=np.float32))
+        if not len(self._ids):
+            self.build(rows)
+            return
+
+        contents = list(self._contents)
+        positions: list[int] = []
+        for faq_id, content, _ in rows:
+            position = self._positions.get(faq_id)
+            if position is None:
+                position = self._positions[faq_id] = len(self._ids)
+                self._ids.append(faq_id)
+                contents.append(content)
+            else:
+                contents[position] = content
+            positions.append(position)
+
+        self._matrix = self._write_rows(self._matrix, positions, vectors)
+        if self.codec.identity:
+            self._codes = self._matrix
+        else:
+            codes, scales = self.codec.encode(vectors)
+            self._codes = self._write_rows(self._codes, positions, codes)
+            self._scales = self._write_rows(self._scales, positions, scales)
+        self._contents = contents
+        self._id_order = None
+        self._snapshot_version = None
+
+        if self.ann.trained:
+            self.ann.add(np.array([faq_id for faq_id, _, _ in rows], dtype=np.int64), self.codec.reduce(vectors))
+        else:
+            self._sync_ann()
+
+    @staticmethod
+    def _write_rows(matrix: np.ndarray | None, positions: list[int], rows: np.ndarray | None) -> np.ndarray | None:
+        """Return a copy of the array with `rows` written at `positions`, growing it for new positions."""
+        if matrix is None or rows is None:
+            return None
+        updated = np.empty((max(matrix.shape[0], max(positions) + 1), *rows.shape[1:]), dtype=matrix.dtype)
+        updated[:matrix.shape[0]] = matrix
+        updated[positions] = rows
+        return updated
+
+    def remove(self, ids: Iterable[int]) -> None:
+        """Remove entries from the index; unknown ids are ignored."""
+        removed = {faq_id for faq_id in ids if faq_id in self._positions}
+        if not removed:
+            return
+
+        keep = [position for position, faq_id in enumerate(self._ids) if faq_id not in removed]
+        self._matrix = self._matrix[keep] if keep else np.empty((0, 0), dtype=np.float32)
+        self._codes = self._matrix if self.codec.identity or not keep else self._codes[keep]
+        self._scales = self._scales[keep] if self._scales is not None else None
+        self._contents = [self._contents[position] for position in keep]
+        self._ids = [self._ids[position] for position in keep]
+        self._positions = {faq_id: position for position, faq_id in enumerate(self._ids)}
+        self._id_order = None
+        self._snapshot_version = None
+        self.ann.remove(np.fromiter(removed, dtype=np.int64))
+
+    def _sync_ann(self) -> None:
+        """Bring the approximate index in line with the current entries.
+
+        A persisted index is reused when its dimensionality matches; entries added or
+        removed since it was saved are applied incrementally. Otherwise it is retrained.
+        """
+        if self.backend != "ivf" or not len(self) or len(self) < self.ann_min_size:
+            return
+
+        dimension = self._codes.shape[1]
+        if not self.ann.trained and self.ann_path is not None and self.ann.load(self.ann_path):
+            logger.info("[ANN] Loaded persisted IVF index from %s.", self.ann_path)
+        if not self.ann.trained or self.ann.centroids.shape[1] != dimension:
+            self.ann.train(np.asarray(self._ids, dtype=np.int64), self.codec.reduce(self._matrix))
+        else:
+            current = np.asarray(self._ids, dtype=np.int64)
+            indexed = self.ann.ids
+            self.ann.remove(np.setdiff1d(indexed, current))
+            missing = np.setdiff1d(current, indexed)
+            self.ann.add(missing, self.codec.reduce(self._matrix[self._lookup(missing)]))
+
+    def save_ann(self) -> None:
+        """Persist the approximate index, if it is in use.
+
+        Only the warmup leader and ingestion save it; the file lock keeps workers from
+        writing it at the same time.
+        """
+        if self.ann_path is not None and self.ann.trained:
+            with FileLock(self.ann_path.with_suffix(".lock")).hold():
+                self.ann.save(self.ann_path)
+
+    def _lookup(self, ids: np.ndarray) -> np.ndarray:
+        """Map FAQ ids to their row positions in the matrix."""
+        if self._id_order is None:
+            id_array = np.asarray(self._ids, dtype=np.int64)
+            order = np.argsort(id_array)
+            self._id_order = (id_array[order], order)
+        sorted_ids, order = self._id_order
+        return order[np.searchsorted(sorted_ids, ids)]
+
+    def _top_positions(self, query: np.ndarray, top_n: int, *, exact: bool) -> tuple[np.ndarray, np.ndarray]:
+        """Return the row positions and scores of the best matches for a unit query, best first."""
+        reduced = self.codec.reduce(query)
+        if not exact and self.ann_active:
+            positions = self._lookup(self.ann.candidates(reduced))
+            scores = self.codec.scores(self._codes, self._scales, reduced, positions)
+        else:
+            positions = None
+            scores = self.codec.scores(self._codes, self._scales, reduced)
+
+        count = scores.shape[0]
+        k = min(top_n * self.rescore_factor if self.rescoring else top_n, count)
+        candidates = np.argpartition(scores, count - k)[count - k:] if k < count else np.arange(count)
+        ordered = candidates[np.argsort(scores[candidates])[::-1]]
+        found = ordered if positions is None else positions[ordered]
+        if self.rescoring:
+            return self._rescore(found, query, top_n)
+        return found, scores[ordered]
+
+    def _rescore(self, positions: np.ndarray, query: np.ndarray, top_n: int) -> tuple[np.ndarray, np.ndarray]:
+        """Re-rank candidate positions by their full-precision score and keep the best `top_n`."""
+        # Ascending positions read the memory-mapped matrix front to back.
+        positions = np.sort(positions)
+        scores = self._matrix[positions] @ query
+        order = np.argsort(scores)[::-1][:top_n]
+        return positions[order], scores[order]
+
+    def search(
+        self,
+        query_embedding: Sequence[float],
+        *,
+        top_n: int = 1,
+        similarity_threshold: float = 0.0,
+        exact: bool = False,
+    ) -> list[tuple[float, str]]:
+        """Return up to `top_n` `(score, content)` pairs ordered by descending cosine similarity."""
+        contents = self._contents
+        query = self._unit_query(query_embedding)
+        if query is None or not self._matrix.shape[0] or top_n <= 0:
+            return []
+
+        positions, scores = self._top_positions(query, top_n, exact=exact)
+        return [
+            (float(score), contents[position])
+            for position, score in zip(positions, scores, strict=True)
+            if score >= similarity_threshold
+        ]
+
+    def nearest_batch(
+        self,
+        query_embeddings: Sequence[Sequence[float]] | np.ndarray,
+        *,
+        top_n: int,
+    ) -> list[list[tuple[int, float]]]:
+        """Run `nearest` for many queries at once, scoring them with one matrix-matrix product.
+
+        When the approximate index is active, every query goes through it separately instead.
+        """
+        ids = self._ids
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        if not queries.shape[0]:
+            return []
+        if self.ann_active:
+            return [self.nearest(query, top_n=top_n) for query in queries]
+        matrix = self._matrix
+        if not matrix.shape[0] or top_n <= 0:
+            return [[] for _ in range(queries.shape[0])]
+
+        units = self._normalize(queries)
+        scores = self.codec.scores(self._codes, self._scales, self.codec.reduce(units).T).T
+        count = scores.shape[1]
+        k = min(top_n * self.rescore_factor if self.rescoring else top_n, count)
+        if k < count:
+            candidates = np.argpartition(scores, count - k, axis=1)[:, count - k:]
+        else:
+            candidates = np.broadcast_to(np.arange(count), scores.shape)
+        candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+        order = np.argsort(-candidate_scores, axis=1)
+        positions = np.take_along_axis(candidates, order, axis=1)
+        top_scores = np.take_along_axis(candidate_scores, order, axis=1)
+        if self.rescoring:
+            rescored = [self._rescore(row, query, top_n) for row, query in zip(positions, units, strict=True)]
+            positions = np.asarray([row for row, _ in rescored])
+            top_scores = np.asarray([row_scores for _, row_scores in rescored])
+        valid = np.linalg.norm(queries, axis=1) > 0
+        return [
+            [(ids[position], score) for position, score in zip(row_positions, row_scores, strict=True)]
+            if is_valid else []
+            for row_positions, row_scores, is_valid in zip(
+                positions.tolist(), top_scores.tolist(), valid.tolist(), strict=True,
+            )
+        ]
+
+    def nearest(self, query_embedding: Sequence[float], *, top_n: int, exact: bool = False) -> list[tuple[int, float]]:
+        """Return up to `top_n` `(id, score)` pairs ordered by descending cosine similarity."""
+        ids = self._ids
+        query = self._unit_query(query_embedding)
+        if query is None or not self._matrix.shape[0] or top_n <= 0:
+            return []
+
+        positions, scores = self._top_positions(query, top_n, exact=exact)
+        return [(ids[position], float(score)) for position, score in zip(positions, scores, strict=True)]
+
+    def score(self, query_embedding: Sequence[float], ids: Iterable[int]) -> dict[int, float]:
+        """Return the cosine similarity between the query and each given id that is indexed."""
+        known = [faq_id for faq_id in ids if faq_id in self._positions]
+        query = self._unit_query(query_embedding)
+        if query is None or not known:
+            return {}
+
+        positions = [self._positions[faq_id] for faq_id in known]
+        scores = self._matrix[positions] @ query
+        return dict(zip(known, scores.tolist(), strict=True))
+
+    def vectors(self, ids: Sequence[int]) -> np.ndarray:
+        """Return the unit embeddings of the given indexed ids, row by row."""
+        return self._matrix[[self._positions[faq_id] for faq_id in ids]]
+
+    def content(self, faq_id: int) -> str:
+        """Return the content of an indexed FAQ entry."""
+        return self._contents[self._positions[faq_id]]
+
+    def recall(self, queries: Sequence[Sequence[float]], *, top_n: int = 10) -> float:
+        """Measure the mean recall@k of the active search path against exact search."""
+        hits = 0
+        total = 0
+        for query in self._normalize(np.asarray(queries, dtype=np.float32)):
+            expected, _ = self._top_positions(query, top_n, exact=True)
+            found, _ = self._top_positions(query, top_n, exact=False)
+            hits += np.intersect1d(expected, found).shape[0]
+            total += expected.shape[0]
+        return hits / total if total else 1.0
+
+
+faq_index = FAQIndex(
+    backend=os.getenv("RETRIEVAL_BACKEND", "exact"),
+    codec=VectorCodec(
+        precision=os.getenv("INDEX_PRECISION", "float32"),
+        dimensions=int(os.getenv("INDEX_DIMENSIONS", "0")),
+    ),
+    rescore_factor=int(os.getenv("INDEX_RESCORE_FACTOR", "0")),
+    ann=IVFFlatIndex(
+        n_lists=int(os.getenv("IVF_N_LISTS", "0")),
+        n_probe=int(os.getenv("IVF_N_PROBE", "8")),
+    ),
+    ann_min_size=int(os.getenv("IVF_MIN_SIZE", "20000")),
+    ann_path=Path(os.getenv("IVF_INDEX_PATH", "faq_ivf.npz")),
+    snapshot_path=Path(os.getenv("FAQ_INDEX_SNAPSHOT_PATH", "faq_index.npz")),
+)
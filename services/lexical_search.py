@@ -0,0 +1,52 @@
+import logging
+import re
+from collections.abc import Sequence
+
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+MAX_QUERY_TOKENS = 32
+
+
+def build_match_query(question: str) -> str | None:
+    """Turn free text into an FTS5 query that matches any of its words.
+
+    Every token is quoted, so punctuation and FTS5 operators in user input are searched
+    literally instead of being interpreted as query syntax.
+    """
+    tokens = list(dict.fromkeys(token.casefold() for token in TOKEN_PATTERN.findall(question)))
+    if not tokens:
+        return None
+    return " OR ".join(f'"{token}"' for token in tokens[:MAX_QUERY_TOKENS])
+
+
+async def search_faq_lexical(question: str, *, session: AsyncSession, limit: int) -> list[tuple[int, str]]:
+    """Return up to `limit` `(id, content)` FAQ entries ranked by BM25, best first."""
+    match_query = build_match_query(question)
+    if match_query is None:
+        return []
+    try:
+        result = await session.execute(
+            text(
+                "SELECT rowid, content FROM faq_fts WHERE faq_fts MATCH :query "
+                "ORDER BY bm25(faq_fts) LIMIT :limit",
+            ),
+            {"query": match_query, "limit": limit},
+        )
+    except SQLAlchemyError:
+        logger.exception("[Lexical] Full-text search failed")
+        return []
+    return [(faq_id, content) for faq_id, content in result.all()]
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[int]], *, k: int = 60) -> list[int]:
+    """Merge several best-first rankings of ids into one using reciprocal rank fusion."""
+    scores: dict[int, float] = {}
+    for ranking in rankings:
+        for rank, faq_id in enumerate(ranking):
+            scores[faq_id] = scores.get(faq_id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=scores.__getitem__, reverse=True)
@@ -1,18 +1,78 @@
+import asyncio
 import logging
 import os
+import time
+from collections.abc import AsyncIterator, Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import partial
+from typing import Any
 
 import numpy as np
 import openai
 from dotenv import load_dotenv
-from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from database.models import FAQ
+from services.context_packer import context_packer
+from services.embedding_batcher import EmbeddingBatcher
+from services.embedding_cache import embedding_cache
+from services.faq_index import faq_index
+from services.lexical_search import reciprocal_rank_fusion, search_faq_lexical
+from services.rate_limiter import openai_limiter
+from utils.metrics import OPENAI_ERRORS, OPENAI_TOKENS, record_stage, timed
+from utils.tokens import count_tokens
 
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+
+# Kept byte-for-byte identical across requests and sent first, so the API can reuse its cached prefix.
+SYSTEM_PROMPT = (
+    "You are a helpful, friendly assistant for TechShop, an online electronics store.\n"
+    "When you answer, do the following:\n"
+    "  1. Use ONLY the information from the context below to answer the question.\n"
+    "  2. Provide a complete, easy-to-read, conversational response. You can add examples,\n"
+    "     additional tips, or polite suggestions as long as they match the context.\n"
+    "  3. If the context does not contain enough information, say you are sorry and that you do not know,\n"
+    "     but keep a friendly tone."
+)
+SYSTEM_PROMPT_TOKENS = count_tokens(SYSTEM_PROMPT)
+
+ANSWER_MIN_TOKENS = int(os.getenv("ANSWER_MIN_TOKENS", "128"))
+ANSWER_MAX_TOKENS = int(os.getenv("ANSWER_MAX_TOKENS", "512"))
+
+
+@contextmanager
+def _observe_call(stage: str) -> Iterator[None]:
+    """Time an OpenAI call as a stage and count it as an error if it fails."""
+    try:
+        with timed(stage):
+            yield
+    except openai.OpenAIError as exc:
+        OPENAI_ERRORS.inc(1, stage, type(exc).__name__)
+        raise
+
+
+def _record_usage(model: str | None, usage: Any) -> None:  # noqa: ANN401
+    """Add the token usage reported by an OpenAI response to the token counters."""
+    if usage is None:
+        return
+    model = model or "unknown"
+    OPENAI_TOKENS.inc(usage.prompt_tokens, model, "prompt")
+    completion_tokens = getattr(usage, "completion_tokens", None)
+    if completion_tokens:
+        OPENAI_TOKENS.inc(completion_tokens, model, "completion")
+
+
+@dataclass(frozen=True, slots=True)
+class Retrieval:
+    """The contexts retrieved for a question and the question embedding, if retrieval computed one."""
+
+    contexts: list[str]
+    query_embedding: np.ndarray | None = None
+
+
 class OpenAIQueryHandler:
     """A class for handling queries to an OpenAI model."""
 
@@ -21,46 +81,145 @@ class OpenAIQueryHandler:
             api_key: str | None = None,
             model: str | None = None,
             embedding_model: str | None = None,
+            retrieval_mode: str | None = None,
     ) -> None:
         """Initialize the OpenAIQueryHandler with the necessary API key."""
         self.api_key = api_key or os.getenv("OPENAI_API_KEY")
         openai.api_key = self.api_key
-        self.client = openai.AsyncOpenAI(api_key=self.api_key)
+        # Retries are handled by `openai_limiter`, so the client itself never retries.
+        self.client = openai.AsyncOpenAI(
+            api_key=self.api_key,
+            timeout=float(os.getenv("OPENAI_TIMEOUT_SECONDS", "30")),
+            max_retries=0,
+        )
         self.model = model or os.getenv("OPENAI_MODEL")
         self.embedding_model = embedding_model or os.getenv("OPENAI_EMBEDDING_MODEL")
+        self.retrieval_mode = retrieval_mode or os.getenv("RETRIEVAL_MODE", "vector")
+        self.hybrid_candidates = int(os.getenv("HYBRID_CANDIDATES", "20"))
+        self.context_candidates = int(os.getenv("CONTEXT_CANDIDATES", "8"))
+        self.embedding_timeout = float(os.getenv("HYBRID_EMBEDDING_TIMEOUT_SECONDS", "2.0"))
+        self.embedding_batcher = EmbeddingBatcher(
+            embed_many=self.generate_embeddings,
+            window_seconds=float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", "5")) / 1000,
+            max_batch_size=int(os.getenv("EMBEDDING_BATCH_MAX_SIZE", "64")),
+        )
 
-    async def generate_answer(
-        self, question: str, contexts: list[str]) -> str:
-        """Generate an answer to a question based on the provided contexts using an OpenAI model."""
+    @staticmethod
+    def _build_messages(question: str, contexts: list[str]) -> tuple[list[dict[str, str]], int, int]:
+        """Build the chat messages for a question.
+
+        Returns the messages, their estimated prompt tokens and the `max_tokens` to request,
+        which grows with the question and the amount of context up to `ANSWER_MAX_TOKENS`.
+        """
         combined_context = "\n\n".join(contexts)
-        system_prompt = (
-            "You are a helpful, friendly assistant for TechShop, an online electronics store.\n"
-            "When you answer, do the following:\n"
-            "  1. Use ONLY the information from the context below to answer the question.\n"
-            "  2. Provide a complete, easy-to-read, conversational response. You can add examples,\n"
-            "     additional tips, or polite suggestions as long as they match the context.\n"
-            "  3. If the context does not contain enough information, say you are sorry and that you do not know,\n"
-            "     but keep a friendly tone.\n\n"
+        user_prompt = (
             f'Context:\n"""\n{combined_context}\n"""\n\n'
             f"User's Question:\n{question}\n\n"
             "Answer:"
         )
-        logger.info("Requesting answer from OpenAI with prompt: %s", system_prompt)
-        completion = await self.client.chat.completions.create(
+        prompt_tokens = SYSTEM_PROMPT_TOKENS + count_tokens(user_prompt)
+        max_tokens = min(
+            ANSWER_MAX_TOKENS,
+            ANSWER_MIN_TOKENS + 2 * count_tokens(question) + count_tokens(combined_context) // 2,
+        )
+        messages = [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": user_prompt},
+        ]
+        return messages, prompt_tokens, max_tokens
+
+    async def generate_answer(
+        self, question: str, contexts: list[str]) -> str:
+        """Generate an answer to a question based on the provided contexts using an OpenAI model."""
+        messages, prompt_tokens, max_tokens = self._build_messages(question, contexts)
+        logger.debug("Requesting answer from OpenAI with prompt: %s", messages[-1]["content"])
+        request = partial(
+            self.client.chat.completions.create,
             model=self.model,
-            messages=[
-                {"role": "system", "content": system_prompt},
-            ],
+            messages=messages,
             temperature=0.8,
-            max_tokens=512,
+            max_tokens=max_tokens,
+        )
+        with _observe_call("completion"):
+            completion = await openai_limiter.run("completion", request, tokens=prompt_tokens + max_tokens)
+        logger.info(
+            "Received answer %s from OpenAI (finish_reason=%s, usage=%s)",
+            completion.id, completion.choices[0].finish_reason, completion.usage,
         )
-        logger.info("Received answer from OpenAI: %s", completion)
+        logger.debug("Answer content: %s", completion.choices[0].message.content)
+        _record_usage(self.model, completion.usage)
+        if completion.choices[0].finish_reason == "length":
+            logger.warning("Answer was cut off at max_tokens=%d", max_tokens)
         return completion.choices[0].message.content.strip()
 
-    async def generate_embedding(self, text: str) -> list[float]:
-        """Generate an embedding for the given text using the OpenAI embedding model."""
-        response = await self.client.embeddings.create(input=text, model=self.embedding_model)
-        return response.data[0].embedding
+    async def stream_answer(self, question: str, contexts: list[str]) -> AsyncIterator[str]:
+        """Stream an answer to a question token by token as the OpenAI model produces it."""
+        messages, prompt_tokens, max_tokens = self._build_messages(question, contexts)
+        logger.debug("Requesting streamed answer from OpenAI with prompt: %s", messages[-1]["content"])
+        request = partial(
+            self.client.chat.completions.create,
+            model=self.model,
+            messages=messages,
+            temperature=0.8,
+            max_tokens=max_tokens,
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+        # The slot is held until the stream ends, so open streams count towards the concurrency cap.
+        async with openai_limiter.slot(tokens=prompt_tokens + max_tokens):
+            with _observe_call("completion_stream"):
+                start = time.perf_counter()
+                stream = await openai_limiter.retrying("completion_stream", request)
+                first_token = True
+                async for chunk in stream:
+                    _record_usage(self.model, chunk.usage)
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        if first_token:
+                            record_stage("completion_first_token", time.perf_counter() - start)
+                            first_token = False
+                        yield chunk.choices[0].delta.content
+
+    async def generate_embeddings(self, texts: list[str]) -> list[list[float]]:
+        """Generate embeddings for several texts with a single multi-input API call."""
+        request = partial(self.client.embeddings.create, input=texts, model=self.embedding_model)
+        tokens = sum(count_tokens(text) for text in texts)
+        with _observe_call("embedding_batch"):
+            response = await openai_limiter.run("embedding_batch", request, tokens=tokens)
+        _record_usage(self.embedding_model, response.usage)
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+    async def embed_query(self, question: str) -> np.ndarray:
+        """Return the embedding for a user question, consulting the query embedding cache first."""
+        with timed("embedding_cache"):
+            cached = await embedding_cache.get(question, self.embedding_model)
+        if cached is not None:
+            return cached
+
+        with timed("embedding"):
+            embedding = np.asarray(await self.embedding_batcher.embed(question), dtype=np.float32)
+        await embedding_cache.set(question, self.embedding_model, embedding)
+        return embedding
+
+    async def embed_queries(self, questions: list[str]) -> np.ndarray:
+        """Embed several user questions, fetching every cache miss with one multi-input call."""
+        with timed("embedding_cache"):
+            cached = [await embedding_cache.get(question, self.embedding_model) for question in questions]
+
+        missing = list(dict.fromkeys(
+            question for question, embedding in zip(questions, cached, strict=True) if embedding is None
+        ))
+        fetched: dict[str, np.ndarray] = {}
+        if missing:
+            with timed("embedding"):
+                embeddings = await self.generate_embeddings(missing)
+            for question, embedding in zip(missing, embeddings, strict=True):
+                fetched[question] = np.asarray(embedding, dtype=np.float32)
+                await embedding_cache.set(question, self.embedding_model, fetched[question])
+        return np.asarray(
+            [embedding if embedding is not None else fetched[question]
+             for question, embedding in zip(questions, cached, strict=True)],
+            dtype=np.float32,
+        )
 
     @staticmethod
     def _cosine_similarity(a: list[float], b: list[float]) -> float:
@@ -72,27 +231,114 @@ class OpenAIQueryHandler:
             return 0.0
         return float(np.dot(a_arr, b_arr) / denom)
 
+    @staticmethod
+    def _pack_matches(matches: list[tuple[int, float]], *, top_n: int) -> list[str]:
+        """Choose the prompt contexts among indexed `(id, relevance)` matches."""
+        ids = [faq_id for faq_id, _ in matches]
+        candidates = [(faq_index.content(faq_id), score) for faq_id, score in matches]
+        return context_packer.pack(candidates, faq_index.vectors(ids), max_contexts=top_n)
+
+    @staticmethod
+    def _pack_lexical(matches: list[tuple[int, str]], *, top_n: int) -> list[str]:
+        """Choose the prompt contexts among full-text matches, keeping their ranking."""
+        candidates = [(content, -float(rank)) for rank, (_, content) in enumerate(matches)]
+        return context_packer.pack(candidates, None, max_contexts=top_n)
+
     async def get_relevant_contexts(
         self,
         question: str,
         session: AsyncSession,
         top_n: int = 1,
         similarity_threshold: float = 0.4,
-    ) -> list[str]:
-        """Retrieve the most relevant contexts for a question based on cosine similarity of embeddings."""
-        query_embedding: list[float] = await self.generate_embedding(question)
-        result = await session.execute(select(FAQ).where(FAQ.embedding.is_not(None)))
-        faqs = result.scalars().all()
-
-        scored: list[tuple[float, FAQ]] = []
-        for faq in faqs:
-            if faq.embedding:
-                score = self._cosine_similarity(query_embedding, faq.embedding)
-                scored.append((score, faq))
-
-        scored.sort(key=lambda x: x[0], reverse=True)
-        top_matches: list[str] = [faq.content for score, faq in scored if score >= similarity_threshold]
-        return top_matches[:top_n]
+    ) -> Retrieval:
+        """Retrieve up to `top_n` relevant contexts for a question, with the query embedding used.
+
+        In the default `vector` mode candidates are ranked by cosine similarity of embeddings.
+        In `hybrid` mode BM25 full-text candidates and vector candidates are merged with
+        reciprocal rank fusion, and only entries above the similarity threshold are kept;
+        if the embedding API is slow or failing, the full-text ranking is used on its own.
+        The `lexical` mode skips embeddings entirely. The final contexts are chosen from
+        the candidates by `context_packer`, within its token budget. The query embedding is
+        returned for the semantic answer cache, or `None` when retrieval did not embed it.
+        """
+        if not faq_index.loaded:
+            await faq_index.load(session=session)
+
+        candidate_count = max(top_n, self.context_candidates)
+        if self.retrieval_mode == "vector":
+            query_embedding: np.ndarray = await self.embed_query(question)
+            with timed("retrieval"):
+                matches = [
+                    (faq_id, score)
+                    for faq_id, score in faq_index.nearest(query_embedding, top_n=candidate_count)
+                    if score >= similarity_threshold
+                ]
+                return Retrieval(self._pack_matches(matches, top_n=top_n), query_embedding)
+
+        with timed("lexical"):
+            lexical_matches = await search_faq_lexical(question, session=session, limit=self.hybrid_candidates)
+        if self.retrieval_mode == "lexical":
+            return Retrieval(self._pack_lexical(lexical_matches[:candidate_count], top_n=top_n))
+
+        try:
+            query_embedding = await asyncio.wait_for(self.embed_query(question), timeout=self.embedding_timeout)
+        except (TimeoutError, openai.OpenAIError) as exc:
+            logger.warning("Embedding unavailable (%s), answering from full-text search only", type(exc).__name__)
+            return Retrieval(self._pack_lexical(lexical_matches[:candidate_count], top_n=top_n))
+
+        with timed("retrieval"):
+            nearest = faq_index.nearest(query_embedding, top_n=self.hybrid_candidates)
+            vector_ranking = [faq_id for faq_id, _ in nearest]
+            lexical_ranking = [faq_id for faq_id, _ in lexical_matches]
+            scores = faq_index.score(query_embedding, {*vector_ranking, *lexical_ranking})
+            fused = [
+                (faq_id, scores[faq_id])
+                for faq_id in reciprocal_rank_fusion([vector_ranking, lexical_ranking])
+                if scores.get(faq_id, -1.0) >= similarity_threshold
+            ]
+            return Retrieval(self._pack_matches(fused[:candidate_count], top_n=top_n), query_embedding)
+
+    async def get_relevant_contexts_batch(
+        self,
+        questions: list[str],
+        session: AsyncSession,
+        top_n: int = 1,
+        similarity_threshold: float = 0.4,
+    ) -> list[Retrieval]:
+        """Retrieve the most relevant contexts for several questions, in input order.
+
+        In `vector` mode all questions are embedded with one API call and scored against
+        the index together. Other modes warm the embedding cache the same way and then
+        retrieve question by question.
+        """
+        if not questions:
+            return []
+        if not faq_index.loaded:
+            await faq_index.load(session=session)
+
+        if self.retrieval_mode == "vector":
+            query_embeddings = await self.embed_queries(questions)
+            with timed("retrieval"):
+                rows = faq_index.nearest_batch(query_embeddings, top_n=max(top_n, self.context_candidates))
+                return [
+                    Retrieval(
+                        self._pack_matches(
+                            [(faq_id, score) for faq_id, score in row if score >= similarity_threshold], top_n=top_n,
+                        ),
+                        query_embedding,
+                    )
+                    for row, query_embedding in zip(rows, query_embeddings, strict=True)
+                ]
+
+        if self.retrieval_mode == "hybrid":
+            try:
+                await self.embed_queries(questions)
+            except openai.OpenAIError as exc:
+                logger.warning("Batch embedding failed (%s), retrieving question by question", type(exc).__name__)
+        return [
+            await self.get_relevant_contexts(question, session, top_n, similarity_threshold)
+            for question in questions
+        ]
 
 
 query_handler = OpenAIQueryHandler()
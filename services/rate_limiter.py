@@ -0,0 +1,204 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from collections.abc import AsyncIterator, Awaitable, Callable
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from typing import TypeVar
+
+import openai
+from dotenv import load_dotenv
+
+from utils.metrics import OPENAI_RETRIES, registry, timed
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+RETRYABLE_ERRORS = (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)
+
+SHED_CALLS = registry.counter(
+    "faq_openai_shed_total", "OpenAI calls rejected because too many calls were already waiting.",
+)
+
+
+class OpenAIOverloadedError(openai.OpenAIError):
+    """Raised instead of queueing a call when the limiter's wait queue is full."""
+
+    def __init__(self, retry_after: float) -> None:
+        super().__init__("Too many OpenAI calls are waiting; try again shortly.")
+        self.retry_after = retry_after
+
+
+def retry_after_seconds(exc: BaseException) -> float | None:
+    """Return the delay requested by an OpenAI error response's `Retry-After` headers, if any."""
+    response = getattr(exc, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        if "retry-after" in headers:
+            value = headers["retry-after"]
+            try:
+                return float(value)
+            except ValueError:
+                return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+    return None
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at `per_minute` tokens per minute.
+
+    Callers reserve their amount up front and the balance may go negative, so waiters
+    are served in arrival order and each one sleeps exactly until its share has refilled.
+    A rate of zero disables the bucket.
+    """
+
+    def __init__(self, *, per_minute: float, capacity: float | None = None) -> None:
+        self.rate = per_minute / 60
+        self.capacity = capacity if capacity is not None else per_minute
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def reserve(self, amount: float) -> float:
+        """Take `amount` tokens and return how many seconds to wait before using them."""
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        self._tokens -= min(amount, self.capacity)
+        return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+
+class OpenAIRateLimiter:
+    """Shared admission control for OpenAI calls.
+
+    Every call first takes one of `max_concurrency` slots, then waits for the request and
+    token buckets and for any pause imposed by a 429 response. When `max_waiting` calls are
+    already queued, new calls are shed with `OpenAIOverloadedError` instead of piling up.
+    Rate-limit, connection and server errors are retried up to `max_retries` times with
+    full-jitter exponential backoff, honouring `Retry-After` when the API sends it.
+    """
+
+    def __init__(  # noqa: PLR0913
+        self,
+        *,
+        requests_per_minute: float,
+        tokens_per_minute: float,
+        max_concurrency: int,
+        max_waiting: int,
+        max_retries: int,
+        backoff_base: float,
+        backoff_max: float,
+    ) -> None:
+        self.requests = TokenBucket(per_minute=requests_per_minute)
+        self.tokens = TokenBucket(per_minute=tokens_per_minute)
+        self.max_concurrency = max_concurrency
+        self.max_waiting = max_waiting
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.in_flight: int = 0
+        self.waiting: int = 0
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._paused_until: float = 0.0
+
+    def _shed(self) -> OpenAIOverloadedError:
+        SHED_CALLS.inc()
+        logger.warning("[RateLimiter] Shedding OpenAI call, %d calls already waiting.", self.waiting)
+        return OpenAIOverloadedError(retry_after=max(self._paused_until - time.monotonic(), 1.0))
+
+    async def _wait_for_capacity(self, tokens: int) -> None:
+        delay = max(self.requests.reserve(1), self.tokens.reserve(tokens))
+        delay = max(delay, self._paused_until - time.monotonic())
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    @asynccontextmanager
+    async def slot(self, *, tokens: int) -> AsyncIterator[None]:
+        """Hold a concurrency slot for the block, after waiting for rate-limit capacity."""
+        if self.waiting >= self.max_waiting:
+            raise self._shed()
+
+        self.waiting += 1
+        try:
+            with timed("openai_wait"):
+                await self._semaphore.acquire()
+                try:
+                    await self._wait_for_capacity(tokens)
+                except BaseException:
+                    self._semaphore.release()
+                    raise
+        finally:
+            self.waiting -= 1
+
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    def _retry_delay(self, exc: BaseException, attempt: int) -> float:
+        """Return the backoff before the next attempt, preferring the server's `Retry-After`."""
+        requested = retry_after_seconds(exc)
+        if requested is not None:
+            return min(requested, self.backoff_max)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))  # noqa: S311
+
+    async def retrying(self, operation: str, request: Callable[[], Awaitable[T]]) -> T:
+        """Await `request()`, retrying transient OpenAI errors with jittered backoff."""
+        attempt = 0
+        while True:
+            try:
+                return await request()
+            except RETRYABLE_ERRORS as exc:
+                if attempt >= self.max_retries:
+                    raise
+                delay = self._retry_delay(exc, attempt)
+                if isinstance(exc, openai.RateLimitError):
+                    # Hold back every other call too, not just this one.
+                    self._paused_until = max(self._paused_until, time.monotonic() + delay)
+                attempt += 1
+                OPENAI_RETRIES.inc(1, operation)
+                logger.warning(
+                    "[RateLimiter] %s failed with %s, retrying in %.2fs (attempt %d of %d).",
+                    operation, type(exc).__name__, delay, attempt, self.max_retries,
+                )
+                await asyncio.sleep(delay)
+
+    async def run(self, operation: str, request: Callable[[], Awaitable[T]], *, tokens: int) -> T:
+        """Run one OpenAI request under the limiter, with retries."""
+        async with self.slot(tokens=tokens):
+            return await self.retrying(operation, request)
+
+
+# The limits are for the whole deployment, so each of the `WEB_CONCURRENCY` uvicorn workers gets its share.
+WORKERS = max(int(os.getenv("WEB_CONCURRENCY", "1")), 1)
+
+openai_limiter = OpenAIRateLimiter(
+    requests_per_minute=float(os.getenv("OPENAI_REQUESTS_PER_MINUTE", "3000")) / WORKERS,
+    tokens_per_minute=float(os.getenv("OPENAI_TOKENS_PER_MINUTE", "1000000")) / WORKERS,
+    max_concurrency=max(int(os.getenv("OPENAI_MAX_CONCURRENCY", "32")) // WORKERS, 1),
+    max_waiting=max(int(os.getenv("OPENAI_MAX_WAITING", "256")) // WORKERS, 1),
+    max_retries=int(os.getenv("OPENAI_MAX_RETRIES", "3")),
+    backoff_base=float(os.getenv("OPENAI_RETRY_BASE_SECONDS", "0.5")),
+    backoff_max=float(os.getenv("OPENAI_RETRY_MAX_SECONDS", "20")),
+)
+
+registry.callback(
+    "faq_openai_calls",
+    "OpenAI calls currently running or waiting for the rate limiter.",
+    "gauge",
+    lambda: [(("in_flight",), openai_limiter.in_flight), (("waiting",), openai_limiter.waiting)],
+    ("state",),
+)
@@ -0,0 +1,80 @@
+import numpy as np
+
+PRECISIONS = ("float32", "float16", "int8")
+INT8_MAX = 127
+# Compact rows are widened to float32 this many at a time, so the scratch block stays in the CPU cache.
+SCORE_CHUNK_ROWS = 256
+
+
+class VectorCodec:
+    """Compact representation of unit embedding vectors used for scoring.
+
+    Vectors can be truncated to their first `dimensions` components and re-normalized,
+    which is how embedding models trained for shortened outputs (such as OpenAI's
+    `text-embedding-3-*`) are meant to be reduced, and then stored as `float16` or as
+    `int8` with one scale per vector. Scores computed from the codes approximate the
+    cosine similarity of the full vectors.
+    """
+
+    def __init__(self, *, precision: str = "float32", dimensions: int = 0) -> None:
+        if precision not in PRECISIONS:
+            msg = f"Unknown index precision {precision!r}, expected one of {', '.join(PRECISIONS)}"
+            raise ValueError(msg)
+        self.precision = precision
+        self.dimensions = dimensions
+
+    @property
+    def identity(self) -> bool:
+        """Whether codes are the full float32 vectors themselves."""
+        return self.precision == "float32" and not self.dimensions
+
+    def reduce(self, vectors: np.ndarray) -> np.ndarray:
+        """Truncate unit vectors (or one vector) to `dimensions` components and re-normalize them."""
+        if not self.dimensions or vectors.shape[-1] <= self.dimensions:
+            return vectors
+        reduced = np.asarray(vectors[..., :self.dimensions], dtype=np.float32)
+        norms = np.linalg.norm(reduced, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return reduced / norms
+
+    def encode(self, vectors: np.ndarray) -> tuple[np.ndarray, np.ndarray | None]:
+        """Return the codes of a matrix of unit vectors and, for `int8`, their per-vector scales."""
+        if self.identity:
+            return vectors, None
+        reduced = self.reduce(vectors)
+        if self.precision == "float32":
+            return np.ascontiguousarray(reduced, dtype=np.float32), None
+        if self.precision == "float16":
+            return reduced.astype(np.float16), None
+
+        scales = np.abs(reduced).max(axis=1) / INT8_MAX if reduced.shape[0] else np.empty(0, dtype=np.float32)
+        scales[scales == 0] = 1.0
+        codes = np.rint(reduced / scales[:, None]).astype(np.int8)
+        return codes, scales.astype(np.float32)
+
+    def scores(
+        self,
+        codes: np.ndarray,
+        scales: np.ndarray | None,
+        query: np.ndarray,
+        positions: np.ndarray | None = None,
+    ) -> np.ndarray:
+        """Score rows of codes against a reduced query, or a `(dimensions, n)` matrix of them.
+
+        Only the rows at `positions` are scored when given.
+        """
+        if positions is not None:
+            codes = codes[positions]
+            scales = scales[positions] if scales is not None else None
+        if codes.dtype == np.float32:
+            scores = codes @ query
+        else:
+            scores = np.concatenate(
+                [
+                    codes[start:start + SCORE_CHUNK_ROWS].astype(np.float32) @ query
+                    for start in range(0, codes.shape[0], SCORE_CHUNK_ROWS)
+                ],
+            ) if codes.shape[0] else np.empty((0, *query.shape[1:]), dtype=np.float32)
+        if scales is not None:
+            scores *= scales.reshape(-1, *([1] * (query.ndim - 1)))
+        return scores
@@ -0,0 +1,47 @@
+import time
+from typing import Any
+
+
+class WarmupStatus:
+    """Progress of the startup work that runs in the background after the app starts serving.
+
+    The app is ready once the search index is loaded and the embedding backfill has finished;
+    warming the answer cache afterwards does not hold readiness back.
+    """
+
+    def __init__(self) -> None:
+        self.stage: str = "pending"
+        self.embedding_total: int = 0
+        self.embedded: int = 0
+        self.error: str | None = None
+        self.ready: bool = False
+        self._started = time.monotonic()
+        self._finished: float | None = None
+
+    def advance(self, stage: str) -> None:
+        """Move on to the given stage."""
+        self.stage = stage
+        if stage in ("answer_cache", "done"):
+            self.ready = True
+        if stage == "done":
+            self._finished = time.monotonic()
+
+    def fail(self, error: BaseException) -> None:
+        """Record that the warmup stopped with an error."""
+        self.error = f"{type(error).__name__}: {error}"
+        self._finished = time.monotonic()
+
+    def snapshot(self) -> dict[str, Any]:
+        """Return the status as a JSON-serializable dict."""
+        end = self._finished if self._finished is not None else time.monotonic()
+        return {
+            "ready": self.ready,
+            "stage": self.stage,
+            "embedded": self.embedded,
+            "embedding_total": self.embedding_total,
+            "error": self.error,
+            "elapsed_seconds": round(end - self._started, 3),
+        }
+
+
+warmup_status = WarmupStatus()
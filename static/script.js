@@ -11,9 +11,14 @@ const askButton = document.getElementById('askButton');
 const loadingSpinner = document.getElementById('loadingSpinner');
 const themeToggle = document.getElementById('themeToggle');
 
+// Constants
+const HISTORY_PAGE_SIZE = 50;
+
 // State
 let conversationHistory = [];
+let nextHistoryCursor = null;
 let isLoading = false;
+let isLoadingHistory = false;
 
 // Initialize the application
 function init() {
@@ -45,6 +50,13 @@ function setupEventListeners() {
 
   // Toggle theme
   themeToggle.addEventListener('click', toggleTheme);
+
+  // Load older history when scrolled to the top
+  conversationSection.addEventListener('scroll', () => {
+    if (conversationSection.scrollTop < 100) {
+      loadOlderHistory();
+    }
+  });
 }
 
 // Handle asking a question
@@ -66,14 +78,17 @@ async function handleAskQuestion() {
     questionInput.value = '';
     questionInput.style.height = 'auto';
 
-    // Send request to backend
-    const response = await askQuestion(question);
-
-    // Add AI response to UI
-    addMessageToUI('ai', response.answer, false, response.created_at);
+    // Stream the answer from the backend into a new AI message
+    const aiBubble = addMessageToUI('ai', '');
+    const answer = await askQuestionStream(question, (delta) => {
+      aiBubble.textContent += delta;
+      scrollToBottom();
+    });
+    aiBubble.textContent = answer;
 
-    // Update conversation history
-    await fetchConversationHistory();
+    // Keep the exchange locally; the server writes history in the background,
+    // so re-fetching it right away could miss this answer
+    conversationHistory.push({ question, answer, created_at: new Date().toISOString() });
 
   } catch (error) {
     showError(error.message);
@@ -82,12 +97,13 @@ async function handleAskQuestion() {
   }
 }
 
-// Send question to API
-async function askQuestion(question) {
-  const response = await fetch('/api/ask', {
+// Send question to the streaming API and call onDelta for every received chunk
+async function askQuestionStream(question, onDelta) {
+  const response = await fetch('/api/ask/stream', {
     method: 'POST',
     headers: {
       'Content-Type': 'application/json',
+      'Accept': 'text/event-stream',
     },
     body: JSON.stringify({ question })
   });
@@ -97,23 +113,85 @@ async function askQuestion(question) {
     throw new Error(errorData.detail || 'Failed to get a response');
   }
 
-  return await response.json();
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  let answer = '';
+
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) {
+      break;
+    }
+    buffer += decoder.decode(value, { stream: true });
+
+    // Server-Sent Events are separated by a blank line
+    let separatorIndex;
+    while ((separatorIndex = buffer.indexOf('\n\n')) !== -1) {
+      const rawEvent = buffer.slice(0, separatorIndex);
+      buffer = buffer.slice(separatorIndex + 2);
+
+      const { event, data } = parseServerSentEvent(rawEvent);
+      if (event === 'error') {
+        throw new Error(data.detail || 'Failed to get a response');
+      }
+      if (event === 'done') {
+        return data.answer;
+      }
+      if (data.delta) {
+        answer += data.delta;
+        onDelta(data.delta);
+      }
+    }
+  }
+
+  return answer;
 }
 
-// Fetch conversation history from API
-async function fetchConversationHistory() {
-  try {
-    const response = await fetch('/api/history');
+// Parse a single Server-Sent Event into its event name and JSON data
+function parseServerSentEvent(rawEvent) {
+  let event = 'message';
+  const dataLines = [];
 
-    if (!response.ok) {
-      const errorData = await response.json();
-      throw new Error(errorData.detail || 'Failed to fetch history');
+  rawEvent.split('\n').forEach(line => {
+    if (line.startsWith('event:')) {
+      event = line.slice(6).trim();
+    } else if (line.startsWith('data:')) {
+      dataLines.push(line.slice(5).trim());
     }
+  });
+
+  return { event, data: dataLines.length ? JSON.parse(dataLines.join('\n')) : {} };
+}
+
+// Fetch a page of conversation history from API (newest first)
+async function fetchHistoryPage(before = null) {
+  const params = new URLSearchParams({ limit: HISTORY_PAGE_SIZE });
+  if (before !== null) {
+    params.set('before', before);
+  }
+
+  const response = await fetch(`/api/history?${params}`);
 
-    const data = await response.json();
+  if (!response.ok) {
+    const errorData = await response.json();
+    throw new Error(errorData.detail || 'Failed to fetch history');
+  }
+
+  return {
+    items: await response.json(),
+    nextCursor: response.headers.get('X-Next-Cursor'),
+  };
+}
+
+// Fetch the latest page of conversation history
+async function fetchConversationHistory() {
+  try {
+    const { items, nextCursor } = await fetchHistoryPage();
 
     // Update local history
-    conversationHistory = data.reverse(); // Reverse to show oldest first
+    conversationHistory = items.reverse(); // Reverse to show oldest first
+    nextHistoryCursor = nextCursor;
 
     // Update UI with new history
     renderConversationHistory();
@@ -123,6 +201,37 @@ async function fetchConversationHistory() {
   }
 }
 
+// Load the next page of older history when scrolled to the top
+async function loadOlderHistory() {
+  if (!nextHistoryCursor || isLoadingHistory) {
+    return;
+  }
+
+  isLoadingHistory = true;
+  try {
+    const { items, nextCursor } = await fetchHistoryPage(nextHistoryCursor);
+    const olderItems = items.reverse();
+
+    conversationHistory = olderItems.concat(conversationHistory);
+    nextHistoryCursor = nextCursor;
+
+    // Prepend older messages while keeping the visible messages in place
+    const previousHeight = conversationSection.scrollHeight;
+    const fragment = document.createDocumentFragment();
+    olderItems.forEach(item => {
+      fragment.appendChild(createMessageElement('user', item.question, item.created_at));
+      fragment.appendChild(createMessageElement('ai', item.answer, item.created_at));
+    });
+    conversationContainer.insertBefore(fragment, conversationContainer.firstChild);
+    conversationSection.scrollTop += conversationSection.scrollHeight - previousHeight;
+
+  } catch (error) {
+    console.error('Error fetching history:', error);
+  } finally {
+    isLoadingHistory = false;
+  }
+}
+
 // Render conversation history in the UI
 function renderConversationHistory() {
   // Clear current content
@@ -148,14 +257,8 @@ function renderConversationHistory() {
     });
 }
 
-// Add a message to the UI
-function addMessageToUI(role, content, isHistoryItem = false, timestamp = null) {
-  // Remove empty state if present
-  const emptyState = conversationContainer.querySelector('.empty-state');
-  if (emptyState) {
-    conversationContainer.removeChild(emptyState);
-  }
-
+// Create a message element
+function createMessageElement(role, content, timestamp = null) {
   // Create message container
   const messageElement = document.createElement('div');
   messageElement.className = `message message-${role === 'user' ? 'user' : 'ai'}`;
@@ -174,6 +277,19 @@ function addMessageToUI(role, content, isHistoryItem = false, timestamp = null)
   messageElement.appendChild(bubbleElement);
   messageElement.appendChild(timestampElement);
 
+  return messageElement;
+}
+
+// Add a message to the UI
+function addMessageToUI(role, content, isHistoryItem = false, timestamp = null) {
+  // Remove empty state if present
+  const emptyState = conversationContainer.querySelector('.empty-state');
+  if (emptyState) {
+    conversationContainer.removeChild(emptyState);
+  }
+
+  const messageElement = createMessageElement(role, content, timestamp);
+
   // Add to conversation container at the end
   conversationContainer.appendChild(messageElement);
 
@@ -181,6 +297,8 @@ function addMessageToUI(role, content, isHistoryItem = false, timestamp = null)
   if (!isHistoryItem) {
     scrollToBottom();
   }
+
+  return messageElement.querySelector('.message-bubble');
 }
 
 // Show empty state
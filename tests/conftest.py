@@ -0,0 +1,48 @@
+import zlib
+from collections.abc import AsyncIterator
+from pathlib import Path
+
+import numpy as np
+import pytest
+import pytest_asyncio
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+import main
+from database import history_writer, initialization
+from services import embedding_cache, query_handler
+from services.faq_index import FAQIndex
+from utils.file_lock import FileLock
+
+EMBEDDING_DIMENSIONS = 8
+
+
+def fake_embedding(text: str) -> list[float]:
+    """Return a deterministic embedding that only depends on the text."""
+    return np.random.default_rng(zlib.crc32(text.encode())).normal(size=EMBEDDING_DIMENSIONS).tolist()
+
+
+@pytest_asyncio.fixture
+async def empty_database(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch,
+) -> AsyncIterator[async_sessionmaker[AsyncSession]]:
+    """Point the app at a fresh, empty SQLite database and at an empty FAQ index."""
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'faq.db'}")
+    session_maker = async_sessionmaker(engine, expire_on_commit=False)
+    for module in (initialization, main, history_writer, embedding_cache):
+        monkeypatch.setattr(module, "async_session_maker", session_maker)
+    monkeypatch.setattr(initialization, "engine", engine)
+    monkeypatch.setattr(initialization, "ingest_file_lock", FileLock(tmp_path / "faq_ingest.lock"))
+    index = FAQIndex()
+    for module in (initialization, query_handler, main):
+        monkeypatch.setattr(module, "faq_index", index)
+    yield session_maker
+    await engine.dispose()
+
+
+@pytest_asyncio.fixture
+async def database(empty_database: async_sessionmaker[AsyncSession]) -> async_sessionmaker[AsyncSession]:
+    """Create the full schema in the fresh test database."""
+    await initialization.create_tables()
+    await initialization.upgrade_schema()
+    await initialization.create_fts_index()
+    return empty_database
@@ -0,0 +1,69 @@
+import numpy as np
+
+from services.ann_index import IVFFlatIndex
+from services.faq_index import FAQIndex
+
+
+def make_rows(count: int, dimension: int = 32, seed: int = 0) -> list[tuple[int, str, list[float]]]:
+    """Create clustered random FAQ rows."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(20, dimension))
+    vectors = centers[rng.integers(0, 20, size=count)] + 0.3 * rng.normal(size=(count, dimension))
+    return [(faq_id, f"faq {faq_id}", vector.tolist()) for faq_id, vector in enumerate(vectors, start=1)]
+
+
+def test_ivf_search_recall_against_exact_search() -> None:
+    """Test that IVF search finds nearly the same neighbours as exact search."""
+    index = FAQIndex(backend="ivf", ann=IVFFlatIndex(n_lists=16, n_probe=4))
+    index.build(make_rows(2000))
+    queries = np.random.default_rng(1).normal(size=(50, 32))
+
+    assert index.ann_active
+    assert index.recall(queries, top_n=5) >= 0.9  # noqa: PLR2004
+
+
+def test_ivf_incremental_insert_and_delete() -> None:
+    """Test that entries added or removed after training are reflected in search results."""
+    rows = make_rows(500)
+    index = FAQIndex(backend="ivf", ann=IVFFlatIndex(n_lists=8, n_probe=8))
+    index.build(rows)
+
+    new_vector = np.ones(32).tolist()
+    index.upsert([(10_000, "new entry", new_vector)])
+    assert index.search(new_vector, top_n=1)[0][1] == "new entry"
+
+    index.remove([10_000])
+    assert index.search(new_vector, top_n=1)[0][1] != "new entry"
+    assert len(index.ann) == len(rows)
+
+
+def test_ivf_persistence_round_trip(tmp_path) -> None:
+    """Test that a saved IVF index is reused and reconciled with the current entries."""
+    path = tmp_path / "ivf.npz"
+    rows = make_rows(300)
+    index = FAQIndex(backend="ivf", ann=IVFFlatIndex(n_lists=8), ann_path=path)
+    index.build(rows)
+    assert not path.exists()
+    index.save_ann()
+
+    restored = FAQIndex(backend="ivf", ann=IVFFlatIndex(n_lists=8), ann_path=path)
+    restored.build(rows[:-10])
+
+    assert restored.ann_active
+    assert sorted(restored.ann.ids.tolist()) == [faq_id for faq_id, _, _ in rows[:-10]]
+
+
+def test_corrupted_ivf_file_is_retrained(tmp_path) -> None:
+    """Test that a torn IVF file is ignored and the index is trained from the entries instead."""
+    path = tmp_path / "ivf.npz"
+    index = FAQIndex(backend="ivf", ann=IVFFlatIndex(n_lists=8), ann_path=path)
+    index.build(make_rows(300))
+    index.save_ann()
+    path.write_bytes(path.read_bytes()[:100])
+
+    restored = FAQIndex(backend="ivf", ann=IVFFlatIndex(n_lists=8), ann_path=path)
+    restored.build(make_rows(300))
+
+    assert restored.ann_active
+    assert len(restored.ann) == 300  # noqa: PLR2004
+    assert sorted(path.parent.iterdir()) == [tmp_path / "ivf.lock", path]
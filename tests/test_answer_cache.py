@@ -0,0 +1,37 @@
+import numpy as np
+
+from services import answer_cache as answer_cache_module
+from services.answer_cache import SemanticAnswerCache
+
+
+def make_cache(**overrides) -> SemanticAnswerCache:
+    """Create an enabled cache with test-friendly defaults."""
+    options = {"enabled": True, "similarity_threshold": 0.9, "ttl_seconds": 60, "max_entries": 10}
+    options.update(overrides)
+    return SemanticAnswerCache(**options)
+
+
+def test_lookup_returns_answer_for_near_duplicate_question() -> None:
+    """Test that a similar question with the same contexts reuses the answer."""
+    cache = make_cache()
+    cache.add([1.0, 0.0, 0.0], ["shipping context"], "Shipping takes 3-5 business days.")
+
+    assert cache.lookup([0.99, 0.05, 0.0], ["shipping context"]) == "Shipping takes 3-5 business days."
+    assert cache.lookup([0.0, 1.0, 0.0], ["shipping context"]) is None
+    assert cache.lookup([1.0, 0.0, 0.0], ["changed shipping context"]) is None
+
+
+def test_entries_expire_and_are_bounded(monkeypatch) -> None:
+    """Test TTL expiry and the maximum number of cached answers."""
+    cache = make_cache(max_entries=2)
+    monkeypatch.setattr(answer_cache_module.time, "time", lambda: 1000.0)
+    for i in range(3):
+        cache.add(np.eye(3)[i], ["context"], f"answer {i}")
+
+    assert len(cache) == 2  # noqa: PLR2004
+    assert cache.lookup(np.eye(3)[0], ["context"]) is None
+
+    monkeypatch.setattr(answer_cache_module.time, "time", lambda: 1061.0)
+
+    assert cache.lookup(np.eye(3)[2], ["context"]) is None
+    assert len(cache) == 0
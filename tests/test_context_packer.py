@@ -0,0 +1,37 @@
+import numpy as np
+
+from services.context_packer import ContextPacker
+from utils.tokens import count_tokens
+
+
+def unit(*values: float) -> np.ndarray:
+    """Return the vector scaled to unit length."""
+    vector = np.asarray(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def test_pack_skips_near_duplicates() -> None:
+    """Test that a candidate almost identical to a chosen one gives way to a novel one."""
+    packer = ContextPacker(token_budget=1000, mmr_lambda=0.7, duplicate_similarity=0.95)
+    candidates = [("returns policy", 0.9), ("returns policy, again", 0.89), ("shipping times", 0.6)]
+    vectors = np.stack([unit(1, 0), unit(1, 0.01), unit(0, 1)])
+
+    assert packer.pack(candidates, vectors, max_contexts=2) == ["returns policy", "shipping times"]
+
+
+def test_pack_respects_token_budget_but_keeps_best_match() -> None:
+    """Test that contexts beyond the budget are skipped, except for the most relevant one."""
+    long_context = "word " * 50
+    packer = ContextPacker(token_budget=10, mmr_lambda=1.0, duplicate_similarity=1.1)
+    candidates = [(long_context, 0.9), ("too long " * 20, 0.8), ("short answer", 0.7)]
+
+    assert packer.pack(candidates, None, max_contexts=3) == [long_context]
+    assert count_tokens(long_context) > packer.token_budget
+
+
+def test_pack_fills_remaining_budget_with_smaller_contexts() -> None:
+    """Test that a candidate that does not fit does not stop smaller ones from being added."""
+    packer = ContextPacker(token_budget=8, mmr_lambda=1.0, duplicate_similarity=1.1)
+    candidates = [("first answer", 0.9), ("a much longer second answer text here", 0.8), ("third one", 0.7)]
+
+    assert packer.pack(candidates, None, max_contexts=3) == ["first answer", "third one"]
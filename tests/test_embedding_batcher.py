@@ -0,0 +1,63 @@
+import asyncio
+
+import pytest
+
+from services.embedding_batcher import EmbeddingBatcher
+
+
+class FakeEmbeddings:
+    """Record the batches sent to the embeddings API and embed each text as its length."""
+
+    def __init__(self) -> None:
+        self.calls: list[list[str]] = []
+
+    async def __call__(self, texts: list[str]) -> list[list[float]]:
+        """Embed a batch of texts."""
+        self.calls.append(texts)
+        await asyncio.sleep(0)
+        return [[float(len(text))] for text in texts]
+
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_share_one_call() -> None:
+    """Test that distinct texts are batched and duplicate texts share one result."""
+    api = FakeEmbeddings()
+    batcher = EmbeddingBatcher(embed_many=api, window_seconds=0.01, max_batch_size=64)
+
+    results = await asyncio.gather(*(batcher.embed(text) for text in ["a", "bb", "a", "ccc", "bb"]))
+
+    assert results == [[1.0], [2.0], [1.0], [3.0], [2.0]]
+    assert api.calls == [["a", "bb", "ccc"]]
+
+
+@pytest.mark.asyncio
+async def test_full_batch_is_sent_without_waiting_for_the_window() -> None:
+    """Test that reaching the batch size flushes immediately and the rest forms a new batch."""
+    api = FakeEmbeddings()
+    batcher = EmbeddingBatcher(embed_many=api, window_seconds=60, max_batch_size=2)
+
+    first = await asyncio.gather(batcher.embed("a"), batcher.embed("bb"))
+
+    assert first == [[1.0], [2.0]]
+    assert api.calls == [["a", "bb"]]
+
+
+@pytest.mark.asyncio
+async def test_failure_is_raised_to_every_caller_in_the_batch() -> None:
+    """Test that an API error fails all requests of the batch and later requests try again."""
+    calls = 0
+
+    async def failing(texts: list[str]) -> list[list[float]]:
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            msg = "upstream unavailable"
+            raise RuntimeError(msg)
+        return [[0.0] for _ in texts]
+
+    batcher = EmbeddingBatcher(embed_many=failing, window_seconds=0, max_batch_size=64)
+
+    results = await asyncio.gather(batcher.embed("a"), batcher.embed("b"), return_exceptions=True)
+
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert await batcher.embed("a") == [0.0]
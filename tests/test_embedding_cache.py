@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+from sqlalchemy import select
+
+from database.models import QueryEmbeddingCache
+from services import embedding_cache as embedding_cache_module
+from services.embedding_cache import EmbeddingCache
+
+
+@pytest.mark.asyncio
+async def test_cache_hit_ignores_case_and_whitespace() -> None:
+    """Test that normalized questions share one cache entry and are counted as hits."""
+    cache = EmbeddingCache(max_size=10, ttl_seconds=60, persistent=False)
+    await cache.set("What payment methods do you accept?", "model", [1.0, 2.0])
+
+    cached = await cache.get("  what payment   methods do you ACCEPT? ", "model")
+
+    assert cached is not None
+    assert np.array_equal(cached, [1.0, 2.0])
+    assert await cache.get("What payment methods do you accept?", "other-model") is None
+    assert cache.stats() == {"hits": 1, "misses": 1, "size": 1}
+
+
+@pytest.mark.asyncio
+async def test_cache_evicts_least_recently_used_entry() -> None:
+    """Test that the in-memory cache is bounded by its maximum size."""
+    cache = EmbeddingCache(max_size=2, ttl_seconds=60, persistent=False)
+    await cache.set("first question", "model", [1.0])
+    await cache.set("second question", "model", [2.0])
+    await cache.get("first question", "model")
+    await cache.set("third question", "model", [3.0])
+
+    assert await cache.get("second question", "model") is None
+    assert await cache.get("first question", "model") is not None
+
+
+@pytest.mark.asyncio
+async def test_cache_entries_expire_after_ttl(monkeypatch) -> None:
+    """Test that entries older than the TTL are treated as misses."""
+    cache = EmbeddingCache(max_size=10, ttl_seconds=60, persistent=False)
+    monkeypatch.setattr(embedding_cache_module.time, "time", lambda: 1000.0)
+    await cache.set("some question", "model", [1.0])
+
+    monkeypatch.setattr(embedding_cache_module.time, "time", lambda: 1061.0)
+
+    assert await cache.get("some question", "model") is None
+
+
+@pytest.mark.asyncio
+async def test_persistent_cache_prunes_expired_and_excess_rows(database, monkeypatch) -> None:
+    """Test that every `prune_interval` writes the table drops expired rows and keeps only the newest `max_rows`."""
+    cache = EmbeddingCache(max_size=10, ttl_seconds=60, max_rows=3, prune_interval=4)
+    now = [1000.0]
+    monkeypatch.setattr(embedding_cache_module.time, "time", lambda: now[0])
+    for stored_at, question in [(1000.0, "expired question"), (2000.0, "first question"), (2001.0, "second question")]:
+        now[0] = stored_at
+        await cache.set(question, "model", [1.0])
+
+    async def stored_keys() -> set[str]:
+        async with database() as session:
+            return set((await session.scalars(select(QueryEmbeddingCache.key))).all())
+
+    assert len(await stored_keys()) == 3  # noqa: PLR2004
+
+    now[0] = 2002.0
+    await cache.set("third question", "model", [1.0])
+
+    assert await stored_keys() == {
+        cache.make_key(question, "model") for question in ["first question", "second question", "third question"]
+    }
+
+    cache.max_rows = 2
+    assert await cache.prune() == 1
+    assert await stored_keys() == {
+        cache.make_key(question, "model") for question in ["second question", "third question"]
+    }
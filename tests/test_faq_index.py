@@ -0,0 +1,154 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from services.faq_index import FAQIndex
+from services.query_handler import OpenAIQueryHandler
+from services.vector_codec import VectorCodec
+
+
+def test_search_matches_cosine_similarity_ranking() -> None:
+    """Test that the index ranks entries exactly like the per-row cosine similarity."""
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(50, 16)).tolist()
+    index = FAQIndex()
+    index.build([(i, f"faq {i}", vector) for i, vector in enumerate(vectors)])
+
+    query = rng.normal(size=16).tolist()
+    expected = sorted(
+        ((OpenAIQueryHandler._cosine_similarity(query, vector), f"faq {i}") for i, vector in enumerate(vectors)),  # noqa: SLF001
+        reverse=True,
+    )[:5]
+    result = index.search(query, top_n=5)
+
+    assert [content for _, content in result] == [content for _, content in expected]
+    assert np.allclose([score for score, _ in result], [score for score, _ in expected], atol=1e-5)
+
+
+def test_search_applies_similarity_threshold() -> None:
+    """Test that entries below the similarity threshold are not returned."""
+    index = FAQIndex()
+    index.build([(1, "x axis", [1.0, 0.0]), (2, "y axis", [0.0, 1.0])])
+
+    result = index.search([1.0, 0.1], top_n=2, similarity_threshold=0.5)
+
+    assert [content for _, content in result] == ["x axis"]
+
+
+def test_upsert_replaces_and_appends_entries() -> None:
+    """Test that upsert patches existing rows and appends new ones."""
+    index = FAQIndex()
+    index.build([(1, "old", [1.0, 0.0])])
+    index.upsert([(1, "new", [0.0, 1.0]), (2, "other", [1.0, 0.0])])
+
+    assert len(index) == 2  # noqa: PLR2004
+    assert index.search([0.0, 1.0])[0][1] == "new"
+    assert index.search([1.0, 0.0])[0][1] == "other"
+
+
+def test_remove_keeps_a_single_matrix_with_the_identity_codec() -> None:
+    """Test that removing entries does not leave a second copy of the matrix behind as codes."""
+    index = FAQIndex()
+    index.build([(1, "x axis", [1.0, 0.0]), (2, "y axis", [0.0, 1.0]), (3, "diagonal", [1.0, 1.0])])
+    index.remove([2])
+
+    assert index._codes is index._matrix  # noqa: SLF001
+    assert [content for _, content in index.search([0.0, 1.0], top_n=3)] == ["diagonal", "x axis"]
+
+
+def test_nearest_batch_matches_individual_searches() -> None:
+    """Test that batched search returns the same results as searching each query on its own."""
+    rng = np.random.default_rng(1)
+    index = FAQIndex()
+    index.build([(i, f"faq {i}", vector) for i, vector in enumerate(rng.normal(size=(40, 8)).tolist())])
+    queries = rng.normal(size=(6, 8))
+    queries[2] = 0.0
+
+    batched = index.nearest_batch(queries, top_n=3)
+    expected = [index.nearest(query, top_n=3) for query in queries]
+
+    assert [[faq_id for faq_id, _ in row] for row in batched] == [[faq_id for faq_id, _ in row] for row in expected]
+    assert np.allclose(
+        [score for row in batched for _, score in row], [score for row in expected for _, score in row], atol=1e-5,
+    )
+
+
+def test_snapshot_round_trip_and_staleness(tmp_path: Path) -> None:
+    """Test that a snapshot restores the index, and is rejected once the entries change."""
+    rows = [(1, "first", [1.0, 0.0]), (2, "second", [0.0, 2.0])]
+    index = FAQIndex(snapshot_path=tmp_path / "index.npz")
+    index.build(rows)
+    index.save_snapshot()
+
+    restored = FAQIndex(snapshot_path=tmp_path / "index.npz")
+    assert restored.load_snapshot([(2, "second"), (1, "first")])
+    assert restored.nearest([0.0, 1.0], top_n=2) == index.nearest([0.0, 1.0], top_n=2)
+    assert isinstance(restored.vectors([1]), np.ndarray)
+    assert not restored.snapshot_stale
+
+    index.upsert([(3, "third", [1.0, 1.0])])
+    index.save_snapshot()
+    assert restored.snapshot_stale
+    assert len(list(tmp_path.glob("index.*.npy"))) == 1
+
+    stale = FAQIndex(snapshot_path=tmp_path / "index.npz")
+    assert not stale.load_snapshot([(1, "first"), (2, "second, edited")])
+    assert not stale.load_snapshot([(1, "first")])
+    assert not stale.loaded
+
+
+@pytest.mark.asyncio
+async def test_snapshot_saved_in_thread_keeps_concurrent_updates(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that the threaded save maps the snapshot, but not over an update made while it was writing."""
+    index = FAQIndex(snapshot_path=tmp_path / "index.npz")
+    index.build([(1, "first", [1.0, 0.0])])
+    await index.save_snapshot_in_thread()
+    assert not index.snapshot_stale
+
+    index.upsert([(2, "second", [0.0, 1.0])])
+    write_snapshot = index._write_snapshot  # noqa: SLF001
+
+    def write_then_update(*state: object) -> None:
+        write_snapshot(*state)
+        index.upsert([(3, "third", [1.0, 1.0])])
+
+    monkeypatch.setattr(index, "_write_snapshot", write_then_update)
+    await index.save_snapshot_in_thread()
+
+    assert len(index) == 3  # noqa: PLR2004
+    assert index.nearest([1.0, 1.0], top_n=1)[0][0] == 3  # noqa: PLR2004
+
+
+def test_compact_codecs_keep_neighbours_and_rescoring_restores_exact_ranking() -> None:
+    """Test that int8 and float16 codes find the exact neighbours and full-precision re-scoring fixes the order."""
+    rng = np.random.default_rng(2)
+    rows = [(i, f"faq {i}", vector) for i, vector in enumerate(rng.normal(size=(300, 64)).tolist())]
+    queries = rng.normal(size=(10, 64))
+    exact = FAQIndex()
+    exact.build(rows)
+    expected = [[faq_id for faq_id, _ in exact.nearest(query, top_n=5)] for query in queries]
+
+    for precision in ("float16", "int8"):
+        compact = FAQIndex(codec=VectorCodec(precision=precision), rescore_factor=4)
+        compact.build(rows)
+        assert compact.nbytes < exact.nbytes
+        assert [[faq_id for faq_id, _ in compact.nearest(query, top_n=5)] for query in queries] == expected
+        batched = compact.nearest_batch(queries, top_n=5)
+        assert [[faq_id for faq_id, _ in row] for row in batched] == expected
+
+
+def test_compact_codes_follow_upserts_and_removals() -> None:
+    """Test that incremental updates keep the compact codes in line with a full rebuild."""
+    rng = np.random.default_rng(3)
+    vectors = rng.normal(size=(20, 16)).tolist()
+    index = FAQIndex(codec=VectorCodec(precision="int8", dimensions=8))
+    index.build([(i, f"faq {i}", vector) for i, vector in enumerate(vectors[:15])])
+    index.upsert([(i, f"faq {i}", vector) for i, vector in enumerate(vectors[10:], start=10)])
+    index.remove([0, 1])
+
+    rebuilt = FAQIndex(codec=VectorCodec(precision="int8", dimensions=8))
+    rebuilt.build([(i, f"faq {i}", vector) for i, vector in enumerate(vectors) if i > 1])
+    query = rng.normal(size=16)
+
+    assert index.nearest(query, top_n=18) == rebuilt.nearest(query, top_n=18)
@@ -0,0 +1,15 @@
+from pathlib import Path
+
+from utils.file_lock import FileLock
+
+
+def test_lock_is_exclusive_until_released(tmp_path: Path) -> None:
+    """Test that only one holder at a time gets the lock, and that releasing hands it over."""
+    first = FileLock(tmp_path / "worker.lock")
+    second = FileLock(tmp_path / "worker.lock")
+
+    assert first.try_acquire()
+    assert not second.try_acquire()
+    first.release()
+    assert second.try_acquire()
+    assert second.held
@@ -0,0 +1,38 @@
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from database.history_writer import HistoryWriter
+from utils.schemas import HistoryItemCreate
+
+
+def make_item(number: int) -> HistoryItemCreate:
+    """Create a history item with a unique question."""
+    return HistoryItemCreate(question=f"Question number {number}?", answer="An answer that is long enough to be valid.")
+
+
+@pytest.mark.asyncio
+@patch("database.manager.db_manager.create_history_items", new_callable=AsyncMock)
+async def test_writer_batches_items_and_drains_on_stop(mock_create_history_items) -> None:
+    """Test that queued items are written in batches and none are lost on shutdown."""
+    writer = HistoryWriter(max_queue_size=10, batch_size=2, flush_interval=60)
+    await writer.start()
+    for number in range(5):
+        await writer.submit(make_item(number))
+    await writer.stop()
+
+    batches = [call.kwargs["items"] for call in mock_create_history_items.await_args_list]
+    assert [len(batch) for batch in batches] == [2, 2, 1]
+    assert [item.question for batch in batches for item in batch] == [make_item(n).question for n in range(5)]
+    assert all(item.created_at is not None for batch in batches for item in batch)
+    assert not writer.running
+
+
+@pytest.mark.asyncio
+@patch("database.manager.db_manager.create_history_item", new_callable=AsyncMock)
+async def test_writer_writes_directly_when_not_started(mock_create_history_item) -> None:
+    """Test that items are written immediately while the background task is not running."""
+    writer = HistoryWriter(max_queue_size=10, batch_size=2, flush_interval=60)
+    await writer.submit(make_item(1))
+
+    mock_create_history_item.assert_awaited_once()
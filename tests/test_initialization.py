@@ -0,0 +1,202 @@
+import asyncio
+import json
+from contextlib import suppress
+
+import numpy as np
+import pytest
+from openai import OpenAIError
+from sqlalchemy import event, select, text, update
+
+from database import initialization
+from database.models import FAQ
+from services.query_handler import query_handler
+from services.warmup import WarmupStatus
+from tests.conftest import fake_embedding
+from utils.file_lock import FileLock
+
+
+@pytest.fixture
+def embedded_texts(monkeypatch: pytest.MonkeyPatch) -> list[str]:
+    """Replace the embeddings API with deterministic vectors and record every text sent to it."""
+    texts: list[str] = []
+
+    async def generate_embeddings(batch: list[str]) -> list[list[float]]:
+        texts.extend(batch)
+        return [fake_embedding(content) for content in batch]
+
+    monkeypatch.setattr(query_handler, "generate_embeddings", generate_embeddings)
+    return texts
+
+
+async def _embed(batch: list[str]) -> list[list[float]]:
+    return [fake_embedding(content) for content in batch]
+
+
+async def _rows(session_maker) -> dict[str, tuple[int, str | None, np.ndarray | None]]:
+    async with session_maker() as session:
+        result = await session.execute(select(FAQ.content, FAQ.id, FAQ.content_hash, FAQ.embedding).order_by(FAQ.id))
+        rows: dict[str, tuple[int, str | None, np.ndarray | None]] = {}
+        for content, faq_id, row_hash, embedding in result.all():
+            rows.setdefault(content, (faq_id, row_hash, embedding))
+        return rows
+
+
+@pytest.mark.asyncio
+async def test_init_db_migrates_legacy_json_embeddings(empty_database, monkeypatch) -> None:
+    """Test that a database created by the JSON-embedding schema is migrated to float32 BLOBs on startup."""
+    vectors = [[0.25, -1.5, 3.0], [1e-3, 2.0, -0.125]]
+    async with empty_database() as session:
+        for statement in (
+            "CREATE TABLE faq_entries (id INTEGER NOT NULL, content VARCHAR, embedding JSON, PRIMARY KEY (id))",
+            "CREATE INDEX ix_faq_entries_content ON faq_entries (content)",
+            "CREATE TABLE qa_history (id INTEGER NOT NULL, question VARCHAR NOT NULL, answer VARCHAR NOT NULL, "
+            "created_at DATETIME NOT NULL, PRIMARY KEY (id))",
+        ):
+            await session.execute(text(statement))
+        await session.execute(
+            text("INSERT INTO faq_entries (id, content, embedding) VALUES (:id, :content, :embedding)"),
+            [
+                {"id": 1, "content": "Refunds take five days.", "embedding": json.dumps(vectors[0])},
+                {"id": 2, "content": "Shipping is free.", "embedding": json.dumps(vectors[1])},
+                {"id": 3, "content": "Support is open 24/7.", "embedding": "null"},
+            ],
+        )
+        await session.commit()
+    monkeypatch.setattr(initialization, "FAQ_SYNC_ON_STARTUP", False)
+
+    await initialization.init_db()
+
+    async with empty_database() as session:
+        result = await session.execute(text("SELECT id, typeof(embedding) FROM faq_entries ORDER BY id"))
+        assert result.all() == [(1, "blob"), (2, "blob"), (3, "null")]
+        result = await session.execute(select(FAQ.embedding).order_by(FAQ.id))
+        first, second, missing = result.scalars().all()
+    assert first.dtype == np.float32
+    assert np.array_equal(first, np.asarray(vectors[0], dtype=np.float32))
+    assert np.array_equal(second, np.asarray(vectors[1], dtype=np.float32))
+    assert missing is None
+
+
+@pytest.mark.asyncio
+async def test_ingest_embeds_only_new_entries_and_removes_stale_rows(database, embedded_texts) -> None:
+    """Test that re-ingesting keeps unchanged rows, embeds edits and new lines, and drops removed or duplicate rows."""
+    await initialization.ingest_faqs(faq_contents=["Refunds take five days.", "Shipping is free.", "We ship worldwide."])
+    async with database() as session:
+        session.add(FAQ(content="Refunds take five days.", embedding=np.ones(8, dtype=np.float32)))
+        await session.execute(update(FAQ).where(FAQ.content == "Shipping is free.").values(content_hash=None))
+        await session.commit()
+    await initialization.build_faq_index()
+    before = await _rows(database)
+    embedded_texts.clear()
+
+    report = await initialization.ingest_faqs(
+        faq_contents=["Refunds take five days.", "Shipping is free.", "We ship to Mars.", "Support is open 24/7."],
+    )
+
+    after = await _rows(database)
+    assert report.model_dump() == {"added": 2, "removed": 2, "unchanged": 2, "embedded": 2, "pending_embeddings": 0}
+    assert sorted(embedded_texts) == ["Support is open 24/7.", "We ship to Mars."]
+    assert sorted(after) == ["Refunds take five days.", "Shipping is free.", "Support is open 24/7.", "We ship to Mars."]
+    for content in ("Refunds take five days.", "Shipping is free."):
+        assert after[content][0] == before[content][0]
+        assert np.array_equal(after[content][2], before[content][2])
+    assert after["Shipping is free."][1] == initialization.content_hash("Shipping is free.")
+    assert all(row_hash is not None for _, row_hash, _ in after.values())
+    index = initialization.faq_index
+    assert sorted(index.content(faq_id) for faq_id, _, _ in after.values()) == sorted(after)
+    assert len(index) == len(after)
+
+
+@pytest.mark.asyncio
+async def test_sync_replaces_edited_entries_in_one_transaction(database, monkeypatch) -> None:
+    """Test that deleting an edited entry and inserting its new version are committed together."""
+    monkeypatch.setattr(query_handler, "generate_embeddings", _embed)
+    await initialization.ingest_faqs(faq_contents=["Shipping takes three days."])
+    commits: list[object] = []
+    event.listen(initialization.engine.sync_engine, "commit", commits.append)
+
+    added, removed_ids, unchanged = await initialization.sync_faq_table(faq_contents=["Shipping takes two days."])
+
+    async with database() as session:
+        result = await session.execute(text("SELECT content FROM faq_fts WHERE faq_fts MATCH 'days'"))
+        assert [content for (content,) in result.all()] == ["Shipping takes two days."]
+    assert (added, len(removed_ids), unchanged) == (1, 1, 0)
+    assert len(commits) == 1
+
+
+@pytest.mark.asyncio
+async def test_embedding_backfill_skips_failed_batches_and_resumes(database, monkeypatch) -> None:
+    """Test that the backfill embeds in batches, commits the ones that succeed and later retries only the rest."""
+    contents = ["Returns are free.", "Orders ship daily.", "Repairs take a week.", "Cards are accepted.", "Help is 24/7."]
+    async with database() as session:
+        session.add(FAQ(content="Already embedded.", embedding=np.ones(8, dtype=np.float32)))
+        session.add_all([FAQ(content=content) for content in contents])
+        await session.commit()
+    batches: list[list[str]] = []
+    failing = {"Repairs take a week."}
+
+    async def generate_embeddings(batch: list[str]) -> list[list[float]]:
+        batches.append(batch)
+        if failing.intersection(batch):
+            message = "embedding API unavailable"
+            raise OpenAIError(message)
+        return [fake_embedding(content) for content in batch]
+
+    monkeypatch.setattr(query_handler, "generate_embeddings", generate_embeddings)
+    monkeypatch.setattr(initialization, "warmup_status", WarmupStatus())
+    monkeypatch.setattr(initialization, "EMBEDDING_BATCH_SIZE", 2)
+    await initialization.build_faq_index()
+
+    assert await initialization.add_embedding() == 3  # noqa: PLR2004
+    assert sorted(batches) == sorted([contents[0:2], contents[2:4], contents[4:]])
+    rows = await _rows(database)
+    assert [content for content, (_, _, embedding) in rows.items() if embedding is None] == contents[2:4]
+    assert len(initialization.faq_index) == 4  # noqa: PLR2004
+
+    batches.clear()
+    failing.clear()
+    assert await initialization.add_embedding() == 2  # noqa: PLR2004
+    assert batches == [contents[2:4]]
+    rows = await _rows(database)
+    assert all(embedding is not None for _, _, embedding in rows.values())
+    assert np.array_equal(rows["Already embedded."][2], np.ones(8, dtype=np.float32))
+    assert len(initialization.faq_index) == len(rows)
+
+
+@pytest.mark.asyncio
+async def test_failed_warmup_leader_hands_over_to_a_follower(database, monkeypatch, tmp_path) -> None:
+    """Test that a follower takes the leader lock and builds the index when the leader's warmup fails."""
+    leader_lock = FileLock(tmp_path / "faq_leader.lock")
+    follower_lock = FileLock(tmp_path / "faq_leader.lock")
+    status = WarmupStatus()
+    builds: list[bool] = []
+    answer_cache_loaded = asyncio.Event()
+
+    async def build_faq_index() -> None:
+        builds.append(follower_lock.held)
+        if not follower_lock.held:
+            message = "embedding storage unreadable"
+            raise RuntimeError(message)
+
+    async def load_answer_cache() -> None:
+        answer_cache_loaded.set()
+
+    monkeypatch.setattr(initialization, "build_faq_index", build_faq_index)
+    monkeypatch.setattr(initialization, "load_answer_cache", load_answer_cache)
+    monkeypatch.setattr(initialization, "warmup_status", status)
+    monkeypatch.setattr(initialization, "INDEX_RELOAD_INTERVAL_SECONDS", 0.01)
+    assert leader_lock.try_acquire()
+    follower = asyncio.create_task(initialization.warm_up(leader_lock=follower_lock))
+    await asyncio.sleep(0.05)
+    assert not follower_lock.held
+
+    await initialization.warm_up(leader_lock=leader_lock)
+    await asyncio.wait_for(answer_cache_loaded.wait(), timeout=5)
+    follower.cancel()
+    with suppress(asyncio.CancelledError):
+        await follower
+
+    assert not leader_lock.held
+    assert builds == [False, True]
+    assert status.ready
+    follower_lock.release()
@@ -0,0 +1,14 @@
+from services.lexical_search import build_match_query, reciprocal_rank_fusion
+
+
+def test_build_match_query_quotes_tokens() -> None:
+    """Test that user input is turned into a safe OR query of quoted, de-duplicated tokens."""
+    assert build_match_query('Return policy for "XPS-13" OR NEAR(return)?') == (
+        '"return" OR "policy" OR "for" OR "xps" OR "13" OR "or" OR "near"'
+    )
+    assert build_match_query("?!") is None
+
+
+def test_reciprocal_rank_fusion_prefers_ids_ranked_by_both() -> None:
+    """Test that ids ranked highly in several rankings come first."""
+    assert reciprocal_rank_fusion([[1, 2, 3], [3, 2, 4]]) == [3, 2, 1, 4]
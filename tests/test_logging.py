@@ -0,0 +1,41 @@
+import logging
+import queue
+from pathlib import Path
+
+from logger.config import LOG_RECORDS_DROPPED, BoundedQueueHandler, RequestIdFilter, SharedRotatingFileHandler
+
+
+def _record(message: str, *args: object) -> logging.LogRecord:
+    return logging.LogRecord("test", logging.INFO, __file__, 1, message, args, None)
+
+
+def test_queue_handler_truncates_and_drops_without_blocking() -> None:
+    """Test that long messages are truncated and records beyond the capacity are dropped."""
+    log_queue: queue.Queue = queue.Queue()
+    handler = BoundedQueueHandler(log_queue, capacity=2, max_message_chars=10)
+    handler.addFilter(RequestIdFilter())
+    dropped = LOG_RECORDS_DROPPED.value()
+
+    for _ in range(3):
+        handler.handle(_record("payload: %s", "x" * 100))
+
+    assert log_queue.qsize() == 2  # noqa: PLR2004
+    assert LOG_RECORDS_DROPPED.value() == dropped + 1
+    record = log_queue.get_nowait()
+    assert record.getMessage() == "payload: x... [99 chars truncated]"
+    assert record.request_id is None
+
+
+def test_rotating_file_handler_keeps_backups_bounded(tmp_path: Path) -> None:
+    """Test that the log file is rotated at the size limit and old files are discarded."""
+    path = tmp_path / "app.log"
+    handler = SharedRotatingFileHandler(path, max_bytes=100, backup_count=2)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+
+    for index in range(20):
+        handler.emit(_record(f"line {index:02d} " + "-" * 30))
+    handler.close()
+
+    assert sorted(file.name for file in tmp_path.glob("app.log*")) == ["app.log", "app.log.1", "app.log.2", "app.log.lock"]
+    assert all(file.stat().st_size <= 100 for file in tmp_path.glob("app.log*"))  # noqa: PLR2004
+    assert "line 19" in path.read_text()
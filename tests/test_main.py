@@ -1,12 +1,25 @@
+import asyncio
+import json
+import re
+from collections.abc import AsyncIterator
+from datetime import UTC, datetime
 from http import HTTPStatus
+from typing import Any
 from unittest.mock import AsyncMock, patch
 
+import httpx
+import numpy as np
 import pytest
 from fastapi.testclient import TestClient
+from openai import APIConnectionError
 
 from database.manager import db_manager
-from main import app
-from services.query_handler import query_handler
+from main import NO_CONTEXT_ANSWER, app
+from services.answer_cache import SemanticAnswerCache
+from services.query_handler import Retrieval, query_handler
+from services.rate_limiter import OpenAIOverloadedError
+from services.warmup import WarmupStatus
+from utils.schemas import FAQIngestReport, HistoryItemCreate, HistoryItemSchema
 
 client = TestClient(app)
 
@@ -23,7 +36,7 @@ async def test_ask_endpoint_valid_request(
         mock_get_async_session,
 ) -> None:
     """Test the ask endpoint with a valid request."""
-    mock_get_relevant_contexts.return_value = ["relevant context"]
+    mock_get_relevant_contexts.return_value = Retrieval(["relevant context"])
     mock_generate_answer.return_value = (
         "We accept credit cards (Visa, MasterCard), "
         "digital wallets (PayPal, Apple Pay), and "
@@ -51,7 +64,7 @@ async def test_ask_endpoint_no_contexts(
         mock_get_async_session,
 ) -> None:
     """Test the ask endpoint with no relevant contexts."""
-    mock_get_relevant_contexts.return_value = []
+    mock_get_relevant_contexts.return_value = Retrieval([])
     payload = {"question": "Why is the sky blue?"}
     response = client.post("/api/ask", json=payload)
     assert response.status_code == HTTPStatus.OK
@@ -73,8 +86,8 @@ async def test_ask_endpoint_invalid_request(mock_get_async_session) -> None:
 @pytest.mark.asyncio
 async def test_integration_ask_endpoint(monkeypatch) -> None:
     """Test the ask endpoint with a real-world scenario."""
-    async def mock_get_relevant_contexts(question, session, top_n) -> list[str]:
-        return ["context_1", "context_2"]
+    async def mock_get_relevant_contexts(question, session, top_n) -> Retrieval:
+        return Retrieval(["context_1", "context_2"])
 
     async def mock_generate_answer(question, contexts) -> str:
         return "You can enter the promo code during checkout in the 'Apply Discount Code' field."
@@ -93,3 +106,390 @@ async def test_integration_ask_endpoint(monkeypatch) -> None:
     assert response.json() == {
         "answer": "You can enter the promo code during checkout in the 'Apply Discount Code' field.",
     }
+
+
+@pytest.mark.asyncio
+@patch("database.manager.db_manager.create_history_item", new_callable=AsyncMock)
+@patch("services.query_handler.query_handler.embed_query", new_callable=AsyncMock)
+@patch("services.query_handler.query_handler.get_relevant_contexts", new_callable=AsyncMock)
+@patch("services.query_handler.query_handler.generate_answer", new_callable=AsyncMock)
+async def test_ask_endpoint_semantic_cache_hit(
+        mock_generate_answer,
+        mock_get_relevant_contexts,
+        mock_embed_query,
+        mock_create_history_item,
+) -> None:
+    """Test that a near-duplicate question is answered from the cache using the embedding from retrieval."""
+    cached_answer = "Verified students receive a 10% discount on all laptops and tablets."
+    cache = SemanticAnswerCache(enabled=True, similarity_threshold=0.9, ttl_seconds=60, max_entries=10)
+    cache.add([1.0, 0.0], ["student discount context"], cached_answer)
+    mock_get_relevant_contexts.return_value = Retrieval(["student discount context"], np.array([0.98, 0.1]))
+
+    with patch("main.answer_cache", cache):
+        response = client.post("/api/ask", json={"question": "Is there a discount for students?"})
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.json() == {"answer": cached_answer}
+    mock_generate_answer.assert_not_awaited()
+    mock_embed_query.assert_not_awaited()
+    mock_create_history_item.assert_awaited_once()
+
+
+@patch("database.manager.db_manager.create_history_item", new_callable=AsyncMock)
+@patch("services.query_handler.query_handler.embed_query", new_callable=AsyncMock)
+@patch("services.query_handler.query_handler.get_relevant_contexts", new_callable=AsyncMock)
+@patch("services.query_handler.query_handler.generate_answer", new_callable=AsyncMock)
+def test_ask_endpoint_skips_answer_cache_without_a_retrieval_embedding(
+        mock_generate_answer,
+        mock_get_relevant_contexts,
+        mock_embed_query,
+        mock_create_history_item,
+) -> None:
+    """Test that the answer cache is skipped, not embedded for, when retrieval did not embed the question."""
+    cache = SemanticAnswerCache(enabled=True, similarity_threshold=0.9, ttl_seconds=60, max_entries=10)
+    cache.add([1.0, 0.0], ["student discount context"], "A cached answer about student discounts.")
+    answer = "Verified students receive a 10% discount on all laptops and tablets."
+    mock_get_relevant_contexts.return_value = Retrieval(["student discount context"])
+    mock_generate_answer.return_value = answer
+
+    with patch("main.answer_cache", cache):
+        response = client.post("/api/ask", json={"question": "Is there a discount for students?"})
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.json() == {"answer": answer}
+    assert len(cache) == 1
+    mock_embed_query.assert_not_awaited()
+    mock_create_history_item.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+@patch("database.manager.db_manager.create_history_item", new_callable=AsyncMock)
+@patch("services.query_handler.query_handler.get_relevant_contexts", new_callable=AsyncMock)
+async def test_ask_stream_endpoint(mock_get_relevant_contexts, mock_create_history_item, monkeypatch) -> None:
+    """Test that the streaming endpoint forwards tokens and saves the full answer."""
+    tokens = ["Once the order is shipped, ", "a tracking number ", "is sent via email."]
+
+    async def mock_stream_answer(question, contexts) -> AsyncIterator[str]:
+        for token in tokens:
+            yield token
+
+    mock_get_relevant_contexts.return_value = Retrieval(["tracking context"])
+    monkeypatch.setattr(query_handler, "stream_answer", mock_stream_answer)
+
+    response = client.post("/api/ask/stream", json={"question": "How can I track my order?"})
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [json.loads(line.removeprefix("data: ")) for line in response.text.splitlines() if line.startswith("data: ")]
+    assert [event["delta"] for event in events[:-1]] == tokens
+    assert events[-1] == {"answer": "".join(tokens)}
+    assert mock_create_history_item.await_args.kwargs["item"].answer == "".join(tokens)
+
+
+@patch("database.manager.db_manager.create_history_item", new_callable=AsyncMock)
+@patch("services.query_handler.query_handler.get_relevant_contexts", new_callable=AsyncMock)
+def test_ask_stream_endpoint_short_and_empty_answers(
+        mock_get_relevant_contexts,
+        mock_create_history_item,
+        monkeypatch,
+) -> None:
+    """Test that a short streamed answer still ends with `done` and an empty stream ends with `error`."""
+    tokens: list[str] = []
+
+    async def mock_stream_answer(question, contexts) -> AsyncIterator[str]:
+        for token in tokens:
+            yield token
+
+    mock_get_relevant_contexts.return_value = Retrieval(["shipping context"])
+    monkeypatch.setattr(query_handler, "stream_answer", mock_stream_answer)
+
+    tokens[:] = ["Yes", "."]
+    short = client.post("/api/ask/stream", json={"question": "Do you ship to Canada?"})
+    tokens[:] = []
+    empty = client.post("/api/ask/stream", json={"question": "Do you ship to Canada?"})
+
+    assert short.text.endswith('event: done\ndata: {"answer": "Yes."}\n\n')
+    assert mock_create_history_item.await_args.kwargs["item"].answer == "Yes."
+    assert empty.text == 'event: error\ndata: {"detail": "Failed to get a response"}\n\n'
+    mock_create_history_item.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+@patch("database.manager.db_manager.read_history_items", new_callable=AsyncMock)
+async def test_history_endpoint_pagination(mock_read_history_items) -> None:
+    """Test that a full history page returns the keyset cursor for the next page."""
+    mock_read_history_items.return_value = [
+        HistoryItemSchema(id=item_id, question="Which payment methods do you accept?", answer="A" * 30)
+        for item_id in (12, 11)
+    ]
+
+    response = client.get("/api/history", params={"limit": 2, "before": 13, "q": "payment"})
+
+    assert response.status_code == HTTPStatus.OK
+    assert [item["id"] for item in response.json()] == [12, 11]
+    assert response.headers["X-Next-Cursor"] == "11"
+    assert mock_read_history_items.await_args.kwargs == {
+        "session": mock_read_history_items.await_args.kwargs["session"],
+        "limit": 2,
+        "before": 13,
+        "search": "payment",
+    }
+
+
+@patch("database.manager.db_manager.latest_history_id", new_callable=AsyncMock)
+@patch("database.manager.db_manager.read_history_items", new_callable=AsyncMock)
+def test_history_endpoint_not_modified(mock_read_history_items, mock_latest_history_id) -> None:
+    """Test that history is revalidated by the newest item id and unchanged history returns 304."""
+    mock_latest_history_id.return_value = 7
+    mock_read_history_items.return_value = []
+
+    first = client.get("/api/history")
+    unchanged = client.get("/api/history", headers={"If-None-Match": first.headers["ETag"]})
+    mock_latest_history_id.return_value = 8
+    changed = client.get("/api/history", headers={"If-None-Match": first.headers["ETag"]})
+
+    assert first.headers["Cache-Control"] == "no-cache"
+    assert unchanged.status_code == HTTPStatus.NOT_MODIFIED
+    assert unchanged.content == b""
+    assert changed.status_code == HTTPStatus.OK
+    assert mock_read_history_items.await_count == 2  # noqa: PLR2004
+
+
+def test_static_assets_are_fingerprinted_and_precompressed() -> None:
+    """Test that the page links fingerprinted assets that are served gzipped and cached as immutable."""
+    page = client.get("/")
+    script_url = next(url for url in re.findall(r'src="([^"]+)"', page.text) if url.startswith("/static/script."))
+    script = client.get(script_url, headers={"Accept-Encoding": "gzip"})
+    plain = client.get("/static/script.js", headers={"If-None-Match": script.headers["ETag"]})
+
+    assert page.headers["Cache-Control"] == "no-cache"
+    assert script.headers["Content-Encoding"] == "gzip"
+    assert "immutable" in script.headers["Cache-Control"]
+    assert "fetchHistoryPage" in script.text
+    assert plain.status_code == HTTPStatus.NOT_MODIFIED
+    assert client.get("/static/missing.js").status_code == HTTPStatus.NOT_FOUND
+
+
+@patch("database.manager.db_manager.create_history_item", new_callable=AsyncMock)
+@patch("services.query_handler.query_handler.get_relevant_contexts", new_callable=AsyncMock)
+@patch("services.query_handler.query_handler.generate_answer", new_callable=AsyncMock)
+def test_metrics_endpoint_and_server_timing(
+        mock_generate_answer,
+        mock_get_relevant_contexts,
+        mock_create_history_item,
+) -> None:
+    """Test that API responses carry a Server-Timing header and stages show up in /api/metrics."""
+    mock_get_relevant_contexts.return_value = Retrieval(["relevant context"])
+    mock_generate_answer.return_value = "The sky is blue because air scatters blue light the most."
+
+    response = client.post("/api/ask", json={"question": "Why is the sky blue?"})
+    metrics = client.get("/api/metrics")
+
+    assert "total;dur=" in response.headers["server-timing"]
+    assert "history;dur=" in response.headers["server-timing"]
+    assert metrics.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert 'faq_stage_duration_seconds_count{stage="history"}' in metrics.text
+    assert 'faq_http_request_duration_seconds_count{path="/api/ask"}' in metrics.text
+
+
+@patch("services.query_handler.query_handler.get_relevant_contexts", new_callable=AsyncMock)
+def test_ask_endpoint_returns_503_when_overloaded(mock_get_relevant_contexts) -> None:
+    """Test that shed OpenAI calls are reported as 503 with a Retry-After header."""
+    mock_get_relevant_contexts.side_effect = OpenAIOverloadedError(retry_after=2.5)
+
+    response = client.post("/api/ask", json={"question": "Which payment methods do you accept?"})
+
+    assert response.status_code == HTTPStatus.SERVICE_UNAVAILABLE
+    assert response.headers["retry-after"] == "3"
+
+
+@patch("database.manager.db_manager.create_history_items", new_callable=AsyncMock)
+@patch("services.query_handler.query_handler.get_relevant_contexts_batch", new_callable=AsyncMock)
+@patch("services.query_handler.query_handler.generate_answer", new_callable=AsyncMock)
+def test_ask_batch_endpoint(
+        mock_generate_answer,
+        mock_get_relevant_contexts_batch,
+        mock_create_history_items,
+) -> None:
+    """Test that batch answers come back in input order and their history is saved together."""
+    questions = ["Which payment methods do you accept?", "Why is the sky blue?", "How long does shipping take?"]
+    mock_get_relevant_contexts_batch.return_value = [Retrieval(["payments"]), Retrieval([]), Retrieval(["shipping"])]
+
+    async def generate_answer(question: str, contexts: list[str]) -> str:
+        if contexts == ["shipping"]:
+            raise APIConnectionError(request=httpx.Request("POST", "https://api.openai.com"))
+        return f"Answer based on {contexts[0]} for: {question}"
+
+    mock_generate_answer.side_effect = generate_answer
+
+    response = client.post("/api/ask/batch", json={"questions": questions})
+    streamed = client.post("/api/ask/batch?stream=true", json={"questions": questions})
+
+    assert response.status_code == HTTPStatus.OK
+    results = response.json()
+    assert [result["index"] for result in results] == [0, 1, 2]
+    assert results[0]["answer"].startswith("Answer based on payments")
+    assert results[1]["answer"] == NO_CONTEXT_ANSWER
+    assert results[2]["error"] is not None
+    saved = mock_create_history_items.await_args_list[0].kwargs["items"]
+    assert [item.question for item in saved] == [questions[0]]
+
+    lines = [json.loads(line) for line in streamed.text.splitlines()]
+    assert streamed.headers["content-type"] == "application/x-ndjson"
+    assert sorted(lines, key=lambda line: line["index"]) == results
+
+
+@patch("database.manager.db_manager.create_history_items", new_callable=AsyncMock)
+@patch("services.query_handler.query_handler.get_relevant_contexts_batch", new_callable=AsyncMock)
+@patch("services.query_handler.query_handler.generate_answer", new_callable=AsyncMock)
+def test_ask_batch_endpoint_short_answers_and_item_failures(
+        mock_generate_answer,
+        mock_get_relevant_contexts_batch,
+        mock_create_history_items,
+) -> None:
+    """Test that short answers are saved and an unexpected per-item failure is reported on its item."""
+    questions = ["Do you ship to Canada?", "Do you ship to Mars too?"]
+    mock_get_relevant_contexts_batch.return_value = [Retrieval(["shipping"]), Retrieval(["space"])]
+
+    async def generate_answer(question: str, contexts: list[str]) -> str:
+        if contexts == ["space"]:
+            raise RuntimeError(question)
+        return "Yes, we ship to Canada."
+
+    mock_generate_answer.side_effect = generate_answer
+
+    response = client.post("/api/ask/batch", json={"questions": questions})
+    streamed = client.post("/api/ask/batch?stream=true", json={"questions": questions})
+
+    assert response.status_code == HTTPStatus.OK
+    results = response.json()
+    assert results[0]["answer"] == "Yes, we ship to Canada."
+    assert results[1]["error"] is not None
+    assert sorted((json.loads(line) for line in streamed.text.splitlines()), key=lambda line: line["index"]) == results
+    assert mock_create_history_items.await_count == 2  # noqa: PLR2004
+    for call in mock_create_history_items.await_args_list:
+        assert [item.answer for item in call.kwargs["items"]] == ["Yes, we ship to Canada."]
+
+
+@pytest.mark.asyncio
+@patch("database.manager.db_manager.create_history_items", new_callable=AsyncMock)
+@patch("services.query_handler.query_handler.get_relevant_contexts_batch", new_callable=AsyncMock)
+async def test_ask_batch_stream_is_not_held_back_by_gzip(
+        mock_get_relevant_contexts_batch,
+        mock_create_history_items,
+        monkeypatch,
+) -> None:
+    """Test that a gzip-accepting client gets the first NDJSON line while the rest of the batch is still running."""
+    first_line_sent = asyncio.Event()
+
+    async def generate_answer(question: str, contexts: list[str]) -> str:
+        if contexts == ["slow"]:
+            await first_line_sent.wait()
+        return f"Answer based on {contexts[0]} for: {question}"
+
+    mock_get_relevant_contexts_batch.return_value = [Retrieval(["fast"]), Retrieval(["slow"])]
+    monkeypatch.setattr(query_handler, "generate_answer", generate_answer)
+    body = json.dumps({"questions": ["Which payment methods do you accept?", "How long does shipping take?"]})
+    requests = [{"type": "http.request", "body": body.encode(), "more_body": False}]
+    chunks: list[bytes] = []
+
+    async def receive() -> dict[str, Any]:
+        if requests:
+            return requests.pop()
+        await asyncio.Event().wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message: dict[str, Any]) -> None:
+        if message["type"] == "http.response.start":
+            assert (b"content-encoding", b"gzip") not in message["headers"]
+        elif message["type"] == "http.response.body" and message.get("body"):
+            chunks.append(message["body"])
+            first_line_sent.set()
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST", "scheme": "http",
+        "path": "/api/ask/batch", "raw_path": b"/api/ask/batch", "query_string": b"stream=true", "root_path": "",
+        "headers": [(b"accept-encoding", b"gzip"), (b"content-type", b"application/json")],
+        "server": ("testserver", 80), "client": ("testclient", 50000),
+    }
+    await asyncio.wait_for(app(scope, receive, send), timeout=5)
+
+    assert json.loads(chunks[0])["index"] == 0
+    assert len(chunks) == 2  # noqa: PLR2004
+
+
+def test_health_and_readiness_endpoints() -> None:
+    """Test that liveness always passes while readiness follows the warmup progress."""
+    status = WarmupStatus()
+    with patch("main.warmup_status", status):
+        status.advance("embedding")
+        status.embedding_total = 10
+        not_ready = client.get("/readyz")
+        status.advance("answer_cache")
+        ready = client.get("/readyz")
+
+    assert client.get("/healthz").json() == {"status": "ok"}
+    assert not_ready.status_code == HTTPStatus.SERVICE_UNAVAILABLE
+    assert not_ready.json()["stage"] == "embedding"
+    assert ready.status_code == HTTPStatus.OK
+
+
+@patch("main.ingest_faqs", new_callable=AsyncMock)
+def test_admin_faq_ingest_requires_token(mock_ingest_faqs) -> None:
+    """Test that FAQ uploads need the admin token and are passed on as non-empty lines."""
+    mock_ingest_faqs.return_value = FAQIngestReport(
+        added=1, removed=0, unchanged=1, embedded=1, pending_embeddings=0,
+    )
+    upload = "Shipping takes 3-5 days.\n\n  Returns are free within 30 days.  \n"
+
+    with patch("main.ADMIN_TOKEN", ""):
+        disabled = client.post("/api/admin/faq", content=upload)
+    with patch("main.ADMIN_TOKEN", "secret"):
+        rejected = client.post("/api/admin/faq", content=upload, headers={"Authorization": "Bearer wrong"})
+        accepted = client.post("/api/admin/faq", content=upload, headers={"Authorization": "Bearer secret"})
+
+    assert disabled.status_code == HTTPStatus.NOT_FOUND
+    assert rejected.status_code == HTTPStatus.UNAUTHORIZED
+    assert accepted.status_code == HTTPStatus.OK
+    assert accepted.json()["added"] == 1
+    mock_ingest_faqs.assert_awaited_once_with(
+        faq_contents=["Shipping takes 3-5 days.", "Returns are free within 30 days."],
+    )
+
+
+@pytest.mark.asyncio
+async def test_history_export_streams_a_json_array(database) -> None:
+    """Test that the export is a valid JSON array when empty, with items, and filtered by `q`."""
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as http:
+        empty = await http.get("/api/history/export")
+        async with database() as session:
+            await db_manager.create_history_items(
+                items=[
+                    HistoryItemCreate(question="Do you ship abroad?", answer="Yes, we ship worldwide.",
+                                      created_at=datetime(2026, 1, 1, tzinfo=UTC)),
+                    HistoryItemCreate(question="Can I return a laptop?", answer="Yes, within 30 days.",
+                                      created_at=datetime(2026, 1, 2, tzinfo=UTC)),
+                ],
+                session=session,
+            )
+        everything = await http.get("/api/history/export")
+        filtered = await http.get("/api/history/export", params={"q": "LAPTOP"})
+
+    assert empty.status_code == HTTPStatus.OK
+    assert empty.headers["content-type"] == "application/json"
+    assert json.loads(empty.text) == []
+    assert [item["question"] for item in json.loads(everything.text)] == [
+        "Can I return a laptop?", "Do you ship abroad?",
+    ]
+    assert [item["answer"] for item in json.loads(filtered.text)] == ["Yes, within 30 days."]
+
+
+def test_request_id_is_returned_and_reused() -> None:
+    """Test that every response carries a request id, reusing a valid one sent by the client."""
+    generated = client.get("/healthz")
+    reused = client.get("/healthz", headers={"X-Request-ID": "edge-42"})
+    replaced = client.get("/healthz", headers={"X-Request-ID": "bad id\twith spaces"})
+
+    assert len(generated.headers["x-request-id"]) == 32  # noqa: PLR2004
+    assert reused.headers["x-request-id"] == "edge-42"
+    assert replaced.headers["x-request-id"] != "bad id\twith spaces"
@@ -0,0 +1,45 @@
+from utils.metrics import MetricsRegistry, record_stage, server_timing_header, start_request_timings
+
+
+def test_histogram_renders_cumulative_buckets() -> None:
+    """Test that histogram observations are rendered as cumulative Prometheus buckets."""
+    registry = MetricsRegistry()
+    histogram = registry.histogram("test_seconds", "Test durations.", ("stage",), buckets=(0.1, 1.0))
+    histogram.observe(0.05, "embedding")
+    histogram.observe(0.5, "embedding")
+    histogram.observe(2.0, "embedding")
+
+    lines = registry.render().splitlines()
+
+    assert lines[:2] == ["# HELP test_seconds Test durations.", "# TYPE test_seconds histogram"]
+    assert 'test_seconds_bucket{stage="embedding",le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{stage="embedding",le="1"} 2' in lines
+    assert 'test_seconds_bucket{stage="embedding",le="+Inf"} 3' in lines
+    assert 'test_seconds_sum{stage="embedding"} 2.55' in lines
+    assert 'test_seconds_count{stage="embedding"} 3' in lines
+
+
+def test_counter_and_callback_metrics() -> None:
+    """Test that counters accumulate per label set and callbacks are read at render time."""
+    registry = MetricsRegistry()
+    counter = registry.counter("test_tokens_total", "Test tokens.", ("kind",))
+    counter.inc(10, "prompt")
+    counter.inc(5, "prompt")
+    depth = [3]
+    registry.callback("test_depth", "Test depth.", "gauge", lambda: [((), depth[0])])
+    depth[0] = 7
+
+    output = registry.render()
+
+    assert 'test_tokens_total{kind="prompt"} 15' in output
+    assert "# TYPE test_depth gauge\ntest_depth 7\n" in output
+
+
+def test_stage_timings_are_collected_per_request() -> None:
+    """Test that recorded stages are accumulated into the Server-Timing header of the request."""
+    timings = start_request_timings()
+    record_stage("embedding", 0.012)
+    record_stage("embedding", 0.003)
+    record_stage("completion", 0.25)
+
+    assert server_timing_header(timings) == "embedding;dur=15.0, completion;dur=250.0"
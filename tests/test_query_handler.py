@@ -0,0 +1,96 @@
+import asyncio
+from collections.abc import Awaitable, Callable
+
+import numpy as np
+import pytest
+import pytest_asyncio
+from sqlalchemy import delete, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from database import initialization
+from database.models import FAQ
+from services.query_handler import query_handler
+from tests.conftest import fake_embedding
+
+FAQS = ["Refunds take five days.", "Shipping is free on all orders.", "Support is open every weekday."]
+
+
+@pytest_asyncio.fixture
+async def ingested(database, monkeypatch: pytest.MonkeyPatch) -> async_sessionmaker[AsyncSession]:
+    """Ingest `FAQS` with deterministic embeddings into the test database."""
+
+    async def generate_embeddings(batch: list[str]) -> list[list[float]]:
+        return [fake_embedding(content) for content in batch]
+
+    monkeypatch.setattr(query_handler, "generate_embeddings", generate_embeddings)
+    await initialization.ingest_faqs(faq_contents=FAQS)
+    return database
+
+
+def _embed_as(content: str) -> Callable[[str], Awaitable[np.ndarray]]:
+    async def embed_query(_: str) -> np.ndarray:
+        return np.asarray(fake_embedding(content), dtype=np.float32)
+
+    return embed_query
+
+
+async def _unavailable(_: str) -> np.ndarray:
+    await asyncio.sleep(10)
+    raise AssertionError
+
+
+@pytest.mark.asyncio
+async def test_lexical_mode_follows_faq_table_through_triggers(ingested, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that lexical retrieval never embeds and sees inserts, edits and deletes of FAQ rows."""
+    monkeypatch.setattr(query_handler, "retrieval_mode", "lexical")
+    monkeypatch.setattr(query_handler, "embed_query", _unavailable)
+
+    async with ingested() as session:
+        retrieval = await query_handler.get_relevant_contexts("How long do refunds take?", session)
+        assert retrieval.contexts == [FAQS[0]]
+        assert retrieval.query_embedding is None
+
+        session.add(FAQ(content="Gift cards never expire."))
+        await session.execute(update(FAQ).where(FAQ.content == FAQS[0]).values(content="Refunds take ten days."))
+        await session.execute(delete(FAQ).where(FAQ.content == FAQS[1]))
+        await session.commit()
+
+        assert (await query_handler.get_relevant_contexts("gift cards", session)).contexts == ["Gift cards never expire."]
+        assert (await query_handler.get_relevant_contexts("refunds", session)).contexts == ["Refunds take ten days."]
+        assert (await query_handler.get_relevant_contexts("five", session)).contexts == []
+        assert (await query_handler.get_relevant_contexts("free shipping", session)).contexts == []
+
+
+@pytest.mark.asyncio
+async def test_hybrid_mode_keeps_only_entries_above_the_similarity_threshold(
+    ingested, monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Test that hybrid retrieval fuses full-text and vector candidates and filters them by similarity."""
+    monkeypatch.setattr(query_handler, "retrieval_mode", "hybrid")
+    monkeypatch.setattr(query_handler, "embed_query", _embed_as(FAQS[1]))
+
+    async with ingested() as session:
+        retrieval = await query_handler.get_relevant_contexts(
+            "Are refunds or shipping free?", session, top_n=3, similarity_threshold=0.99,
+        )
+
+    assert retrieval.contexts == [FAQS[1]]
+    assert np.array_equal(retrieval.query_embedding, np.asarray(fake_embedding(FAQS[1]), dtype=np.float32))
+
+
+@pytest.mark.asyncio
+async def test_hybrid_mode_falls_back_to_full_text_when_embedding_times_out(
+    ingested, monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Test that a slow embedding call is abandoned and the BM25 ranking is used on its own."""
+    monkeypatch.setattr(query_handler, "retrieval_mode", "hybrid")
+    monkeypatch.setattr(query_handler, "embedding_timeout", 0.01)
+    monkeypatch.setattr(query_handler, "embed_query", _unavailable)
+
+    async with ingested() as session:
+        retrieval = await query_handler.get_relevant_contexts(
+            "When is support open?", session, similarity_threshold=0.99,
+        )
+
+    assert retrieval.contexts == [FAQS[2]]
+    assert retrieval.query_embedding is None
@@ -0,0 +1,89 @@
+import asyncio
+
+import httpx
+import openai
+import pytest
+
+from services.rate_limiter import OpenAIOverloadedError, OpenAIRateLimiter, TokenBucket, retry_after_seconds
+
+
+def make_limiter(**overrides: float) -> OpenAIRateLimiter:
+    """Create a limiter with no rate limits and instant retries, unless overridden."""
+    options = {
+        "requests_per_minute": 0,
+        "tokens_per_minute": 0,
+        "max_concurrency": 2,
+        "max_waiting": 2,
+        "max_retries": 2,
+        "backoff_base": 0,
+        "backoff_max": 1,
+    }
+    return OpenAIRateLimiter(**{**options, **overrides})
+
+
+def rate_limit_error(retry_after: str) -> openai.RateLimitError:
+    """Build the error the OpenAI client raises for a 429 response."""
+    request = httpx.Request("POST", "https://api.openai.com/v1/embeddings")
+    response = httpx.Response(429, headers={"retry-after": retry_after}, request=request)
+    return openai.RateLimitError("Rate limit reached", response=response, body=None)
+
+
+def test_token_bucket_makes_callers_wait_for_refill() -> None:
+    """Test that reservations beyond the capacity return the time needed to refill."""
+    bucket = TokenBucket(per_minute=60)
+
+    assert bucket.reserve(60) == 0
+    assert bucket.reserve(3) == pytest.approx(3, abs=0.01)
+    assert TokenBucket(per_minute=0).reserve(10**9) == 0
+
+
+@pytest.mark.asyncio
+async def test_retries_transient_errors_honouring_retry_after() -> None:
+    """Test that 429s are retried after the requested delay and the result is returned."""
+    limiter = make_limiter()
+    attempts = [rate_limit_error("0"), rate_limit_error("0")]
+
+    async def request() -> str:
+        if attempts:
+            raise attempts.pop()
+        return "ok"
+
+    assert retry_after_seconds(rate_limit_error("7")) == 7  # noqa: PLR2004
+    assert await limiter.run("embedding", request, tokens=1) == "ok"
+    assert limiter.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_gives_up_after_max_retries() -> None:
+    """Test that the last transient error is raised once the retry budget is spent."""
+    limiter = make_limiter(max_retries=1)
+    errors = [rate_limit_error("0"), rate_limit_error("0"), rate_limit_error("0")]
+
+    async def request() -> str:
+        raise errors.pop()
+
+    with pytest.raises(openai.RateLimitError):
+        await limiter.run("completion", request, tokens=1)
+    assert len(errors) == 1
+
+
+@pytest.mark.asyncio
+async def test_sheds_calls_when_wait_queue_is_full() -> None:
+    """Test that calls beyond the concurrency cap queue up to `max_waiting` and the rest are shed."""
+    limiter = make_limiter(max_concurrency=1, max_waiting=1)
+    release = asyncio.Event()
+
+    async def request() -> str:
+        await release.wait()
+        return "ok"
+
+    running = asyncio.create_task(limiter.run("completion", request, tokens=1))
+    queued = asyncio.create_task(limiter.run("completion", request, tokens=1))
+    await asyncio.sleep(0)
+
+    with pytest.raises(OpenAIOverloadedError):
+        await limiter.run("completion", request, tokens=1)
+
+    release.set()
+    assert await asyncio.gather(running, queued) == ["ok", "ok"]
+    assert limiter.waiting == 0
@@ -0,0 +1,32 @@
+from collections.abc import Callable
+from typing import Any
+
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipMiddleware, GZipResponder
+
+# Responses of these types are delivered incrementally; gzip would hold them back until it has a full block.
+STREAMING_CONTENT_TYPES = ("text/event-stream", "application/x-ndjson")
+
+
+class _StreamingAwareGZipResponder(GZipResponder):
+    async def send_with_compression(self, message: dict[str, Any]) -> None:
+        await super().send_with_compression(message)
+        if message["type"] == "http.response.start":
+            content_type = Headers(raw=message["headers"]).get("content-type", "")
+            self.content_type_is_excluded = content_type.startswith(STREAMING_CONTENT_TYPES)
+
+
+class StreamingAwareGZipMiddleware(GZipMiddleware):
+    """Gzip middleware that leaves every incrementally streamed response type uncompressed.
+
+    Starlette's middleware only skips Server-Sent Events; NDJSON streams would otherwise
+    reach the client in one piece when the response ends.
+    """
+
+    async def __call__(self, scope: dict[str, Any], receive: Callable[..., Any], send: Callable[..., Any]) -> None:
+        """Handle one ASGI connection."""
+        if scope["type"] == "http" and "gzip" in Headers(scope=scope).get("Accept-Encoding", ""):
+            responder = _StreamingAwareGZipResponder(self.app, self.minimum_size, compresslevel=self.compresslevel)
+            await responder(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
@@ -0,0 +1,65 @@
+import asyncio
+import fcntl
+import os
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+from typing import TextIO
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+LOCK_DIR = Path(os.getenv("WORKER_LOCK_DIR", "."))
+
+
+class FileLock:
+    """Exclusive advisory lock shared by every process that opens the same file.
+
+    The lock is released when it is released explicitly or when the holding process
+    exits, so a crashed worker never leaves it stuck.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._file: TextIO | None = None
+
+    @property
+    def held(self) -> bool:
+        """Whether this process currently holds the lock."""
+        return self._file is not None
+
+    def _lock(self, *, blocking: bool) -> bool:
+        file = self.path.open("a")
+        try:
+            fcntl.flock(file, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            file.close()
+            return False
+        self._file = file
+        return True
+
+    def try_acquire(self) -> bool:
+        """Take the lock if no other process holds it, without waiting."""
+        return self.held or self._lock(blocking=False)
+
+    async def acquire(self) -> None:
+        """Wait for the lock without blocking the event loop."""
+        if not self.held:
+            await asyncio.to_thread(self._lock, blocking=True)
+
+    def release(self) -> None:
+        """Release the lock, if held."""
+        if self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+
+    @contextmanager
+    def hold(self) -> Iterator[None]:
+        """Hold the lock for the duration of the block, waiting for it if needed."""
+        self._lock(blocking=True)
+        try:
+            yield
+        finally:
+            self.release()
@@ -0,0 +1,22 @@
+from http import HTTPStatus
+
+from fastapi import Response
+
+# Stored by the browser but revalidated with `If-None-Match` before every use.
+REVALIDATE = "no-cache"
+# Fingerprinted URLs never change content, so they can be cached for a year without revalidation.
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """Whether an `If-None-Match` header matches an ETag, using the weak comparison HTTP requires for GET."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return etag.removeprefix("W/") in {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+
+
+def not_modified(headers: dict[str, str]) -> Response:
+    """Return an empty `304 Not Modified` response carrying the validator and cache headers."""
+    return Response(status_code=HTTPStatus.NOT_MODIFIED, headers=headers)
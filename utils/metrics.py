@@ -0,0 +1,265 @@
+import math
+import time
+from bisect import bisect_left
+from collections.abc import Callable, Iterable, Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any
+
+Labels = tuple[str, ...]
+Sample = tuple[Labels, float]
+
+DEFAULT_BUCKETS: tuple[float, ...] = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+
+_request_timings: ContextVar[dict[str, float] | None] = ContextVar("request_timings", default=None)
+
+
+def _escape(value: str) -> str:
+    """Escape a label value for the Prometheus text format."""
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Labels, values: Labels, extra: str = "") -> str:
+    """Render a Prometheus label set such as `{stage="embedding",le="0.1"}`."""
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values, strict=True)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    """Render a sample value the way Prometheus expects it."""
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    """Monotonically increasing value, optionally split by labels."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Labels = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1.0, *labelvalues: str) -> None:
+        """Increase the counter for the given label values."""
+        self._values[labelvalues] = self._values.get(labelvalues, 0.0) + amount
+
+    def value(self, *labelvalues: str) -> float:
+        """Return the current value for the given label values."""
+        return self._values.get(labelvalues, 0.0)
+
+    def render(self) -> Iterator[str]:
+        """Yield the sample lines of the counter."""
+        for labelvalues, value in self._values.items():
+            yield f"{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_value(value)}"
+
+
+class Histogram:
+    """Distribution of observed values over fixed cumulative buckets."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Labels = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._series: dict[Labels, list[float]] = {}
+
+    def observe(self, value: float, *labelvalues: str) -> None:
+        """Record one observation; the per-bucket counts are made cumulative when rendered."""
+        series = self._series.get(labelvalues)
+        if series is None:
+            # One slot per bucket, one for +Inf, then the sum.
+            series = self._series[labelvalues] = [0.0] * (len(self.buckets) + 2)
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def count(self, *labelvalues: str) -> int:
+        """Return the number of observations for the given label values."""
+        series = self._series.get(labelvalues)
+        return int(sum(series[:-1])) if series else 0
+
+    def render(self) -> Iterator[str]:
+        """Yield the bucket, sum and count lines of every series."""
+        for labelvalues, series in self._series.items():
+            cumulative = 0.0
+            for bound, count in zip((*self.buckets, math.inf), series[:-1], strict=True):
+                cumulative += count
+                labels = _format_labels(self.labelnames, labelvalues, f'le="{_format_value(bound)}"')
+                yield f"{self.name}_bucket{labels} {_format_value(cumulative)}"
+            labels = _format_labels(self.labelnames, labelvalues)
+            yield f"{self.name}_sum{labels} {_format_value(series[-1])}"
+            yield f"{self.name}_count{labels} {_format_value(cumulative)}"
+
+
+class CallbackMetric:
+    """Metric whose samples are read from a callback at scrape time.
+
+    Used for values that are already tracked elsewhere, such as cache hit counts or
+    queue depth, so that exposing them costs nothing on the hot path.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        kind: str,
+        callback: Callable[[], Iterable[Sample]],
+        labelnames: Labels = (),
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.kind = kind
+        self.callback = callback
+        self.labelnames = labelnames
+
+    def render(self) -> Iterator[str]:
+        """Yield the sample lines returned by the callback."""
+        for labelvalues, value in self.callback():
+            yield f"{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_value(value)}"
+
+
+class MetricsRegistry:
+    """Collection of metrics rendered together in the Prometheus text format."""
+
+    def __init__(self) -> None:
+        self._metrics: dict[str, Counter | Histogram | CallbackMetric] = {}
+
+    def _register(self, metric: Any) -> Any:  # noqa: ANN401
+        """Add a metric, or return the already registered metric with the same name."""
+        return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, documentation: str, labelnames: Labels = ()) -> Counter:
+        """Create and register a counter."""
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Labels = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        """Create and register a histogram."""
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def callback(
+        self,
+        name: str,
+        documentation: str,
+        kind: str,
+        callback: Callable[[], Iterable[Sample]],
+        labelnames: Labels = (),
+    ) -> CallbackMetric:
+        """Create and register a metric read from a callback; `kind` is `counter` or `gauge`."""
+        return self._register(CallbackMetric(name, documentation, kind, callback, labelnames))
+
+    def render(self) -> str:
+        """Render every registered metric in the Prometheus text exposition format."""
+        lines: list[str] = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+STAGE_SECONDS = registry.histogram(
+    "faq_stage_duration_seconds", "Time spent in each stage of answering a question.", ("stage",),
+)
+HTTP_REQUEST_SECONDS = registry.histogram(
+    "faq_http_request_duration_seconds", "Time until the response headers were sent, per API route.", ("path",),
+)
+OPENAI_ERRORS = registry.counter(
+    "faq_openai_errors_total", "Failed OpenAI API calls by operation and error type.", ("operation", "error"),
+)
+OPENAI_RETRIES = registry.counter(
+    "faq_openai_retries_total", "Retried OpenAI API requests by operation.", ("operation",),
+)
+OPENAI_TOKENS = registry.counter(
+    "faq_openai_tokens_total", "Tokens reported by the OpenAI API by model and kind.", ("model", "kind"),
+)
+
+
+def start_request_timings() -> dict[str, float]:
+    """Begin collecting stage timings for the current request and return the collection."""
+    timings: dict[str, float] = {}
+    _request_timings.set(timings)
+    return timings
+
+
+def record_stage(stage: str, seconds: float) -> None:
+    """Observe a stage duration and add it to the current request's timings, if any."""
+    STAGE_SECONDS.observe(seconds, stage)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    """Measure the duration of the enclosed block as the given stage."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - start)
+
+
+def server_timing_header(timings: dict[str, float]) -> str:
+    """Format stage timings as a `Server-Timing` header value in milliseconds."""
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items())
+
+
+class MetricsMiddleware:
+    """ASGI middleware that times API requests and adds a `Server-Timing` header.
+
+    Stages finished before the response headers are sent are listed individually,
+    followed by the `total` time; stages of a streamed body run after the headers and
+    only appear in the histograms.
+    """
+
+    def __init__(self, app: Callable[..., Any], *, path_prefix: str = "/api/") -> None:
+        self.app = app
+        self.path_prefix = path_prefix
+
+    async def __call__(self, scope: dict[str, Any], receive: Callable[..., Any], send: Callable[..., Any]) -> None:
+        """Handle one ASGI connection."""
+        if scope["type"] != "http" or not scope["path"].startswith(self.path_prefix):
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        timings = start_request_timings()
+
+        async def send_with_timing(message: dict[str, Any]) -> None:
+            if message["type"] == "http.response.start":
+                elapsed = time.perf_counter() - start
+                # Unknown paths share one series, so scanners cannot blow up the label set.
+                path = scope["path"] if message["status"] != 404 else "unmatched"  # noqa: PLR2004
+                HTTP_REQUEST_SECONDS.observe(elapsed, path)
+                header = server_timing_header({**timings, "total": elapsed})
+                message["headers"] = [*message.get("headers", []), (b"server-timing", header.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        except Exception:
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, scope["path"])
+            raise
@@ -1,6 +1,8 @@
 from datetime import datetime
+from typing import Annotated
 
-from pydantic import BaseModel, Field
+import numpy as np
+from pydantic import BaseModel, ConfigDict, Field
 
 
 class AskRequest(BaseModel):
@@ -11,10 +13,50 @@ class AskRequest(BaseModel):
 class AskResponse(BaseModel):
     """Answer to the question."""
 
-    answer: str = Field(..., min_length=30)
+    answer: str
 
 
-class HistoryItemSchema(AskRequest, AskResponse):
-    """Item in the history."""
+class AskBatchRequest(BaseModel):
+    """Several questions to be answered together."""
 
+    questions: list[Annotated[str, Field(min_length=10)]] = Field(..., min_length=1, max_length=500)
+
+
+class AskBatchItem(BaseModel):
+    """Answer to one question of a batch, or the reason it could not be answered."""
+
+    index: int
+    question: str
+    answer: str | None = None
+    error: str | None = None
+
+
+class FAQIngestReport(BaseModel):
+    """Outcome of syncing the FAQ table with a new list of entries."""
+
+    added: int
+    removed: int
+    unchanged: int
+    embedded: int
+    pending_embeddings: int
+
+
+class HistoryItemSchema(BaseModel):
+    """Item in the history.
+
+    Answers are stored as generated, so unlike `AskResponse` no minimum length applies.
+    """
+
+    question: str
+    answer: str
+    id: int | None = None
     created_at: datetime | None = None
+
+
+class HistoryItemCreate(HistoryItemSchema):
+    """History item to be stored, with the data the semantic answer cache needs."""
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    question_embedding: np.ndarray | None = None
+    context_hash: str | None = None
@@ -0,0 +1,11 @@
+import json
+from typing import Any
+
+
+def format_sse(data: dict[str, Any], *, event: str | None = None) -> str:
+    """Format a JSON payload as a single Server-Sent Events message."""
+    lines: list[str] = []
+    if event is not None:
+        lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, ensure_ascii=False)}")
+    return "\n".join(lines) + "\n\n"
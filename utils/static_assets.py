@@ -0,0 +1,92 @@
+import gzip
+import hashlib
+import mimetypes
+import re
+from dataclasses import dataclass
+from pathlib import Path
+
+from fastapi import HTTPException, Response
+from starlette.datastructures import Headers
+
+from utils.http_cache import IMMUTABLE, REVALIDATE, etag_matches, not_modified
+
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "image/svg+xml")
+# Files referencing other assets are processed last, so their references point at final fingerprints.
+REFERENCING_SUFFIXES = (".css", ".html")
+MIN_COMPRESSED_SAVING = 0.1
+
+
+@dataclass(frozen=True, slots=True)
+class StaticAsset:
+    """One static file held in memory with its precompressed variant."""
+
+    body: bytes
+    gzipped: bytes | None
+    media_type: str
+    etag: str
+
+
+class StaticAssets:
+    """Static files served from memory under content-fingerprinted URLs.
+
+    Every file is also reachable as `name.<hash>.suffix`, which is cached by browsers as
+    immutable; references to other assets inside HTML and CSS files are rewritten to those
+    URLs. The plain names stay available and are revalidated by ETag on every use.
+    Compressible files are gzipped once at startup instead of on every request.
+    """
+
+    def __init__(self, directory: Path, *, url_prefix: str = "/static") -> None:
+        self.url_prefix = url_prefix
+        self._assets: dict[str, StaticAsset] = {}
+        self._fingerprinted: dict[str, str] = {}
+        self._names: dict[str, str] = {}
+        files = sorted(
+            (path for path in directory.rglob("*") if path.is_file()),
+            key=lambda path: (path.suffix in REFERENCING_SUFFIXES, path.suffix == ".html", path),
+        )
+        for path in files:
+            self._add(path.relative_to(directory).as_posix(), path.read_bytes())
+
+    def _add(self, name: str, body: bytes) -> None:
+        media_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        if name.endswith(REFERENCING_SUFFIXES):
+            body = self._rewrite_references(body.decode("utf-8")).encode("utf-8")
+        digest = hashlib.sha256(body).hexdigest()[:12]
+        gzipped = None
+        if media_type.startswith(COMPRESSIBLE_TYPES):
+            gzipped = gzip.compress(body, compresslevel=9, mtime=0)
+            if len(gzipped) > len(body) * (1 - MIN_COMPRESSED_SAVING):
+                gzipped = None
+        self._assets[name] = StaticAsset(body=body, gzipped=gzipped, media_type=media_type, etag=f'W/"{digest}"')
+        stem, dot, suffix = name.rpartition(".")
+        fingerprinted = f"{stem}.{digest}.{suffix}" if dot else f"{name}.{digest}"
+        self._fingerprinted[fingerprinted] = name
+        self._names[name] = fingerprinted
+
+    def _rewrite_references(self, text: str) -> str:
+        prefix = re.escape(self.url_prefix)
+        return re.sub(
+            rf"(?<=[\"'(]){prefix}/([^\"')?#]+)",
+            lambda match: self.url(match.group(1)) if match.group(1) in self._names else match.group(0),
+            text,
+        )
+
+    def url(self, name: str) -> str:
+        """Return the fingerprinted URL of an asset."""
+        return f"{self.url_prefix}/{self._names[name]}"
+
+    def response(self, name: str, headers: Headers) -> Response:
+        """Serve an asset by plain or fingerprinted name, honouring `If-None-Match` and `Accept-Encoding`."""
+        immutable = name in self._fingerprinted
+        asset = self._assets.get(self._fingerprinted.get(name, name))
+        if asset is None:
+            raise HTTPException(status_code=404, detail="Not Found")
+
+        response_headers = {"ETag": asset.etag, "Cache-Control": IMMUTABLE if immutable else REVALIDATE}
+        if etag_matches(headers.get("if-none-match"), asset.etag):
+            return not_modified(response_headers)
+        if asset.gzipped is not None and "gzip" in headers.get("accept-encoding", ""):
+            # Uncompressed responses get their `Vary` from the gzip middleware, which skips encoded ones.
+            response_headers.update({"Content-Encoding": "gzip", "Vary": "Accept-Encoding"})
+            return Response(asset.gzipped, media_type=asset.media_type, headers=response_headers)
+        return Response(asset.body, media_type=asset.media_type, headers=response_headers)
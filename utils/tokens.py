@@ -0,0 +1,17 @@
+import re
+
+TOKEN_PIECE_PATTERN = re.compile(r"\w+|[^\w\s]")
+CHARS_PER_WORD_TOKEN = 6
+
+
+def count_tokens(text: str) -> int:
+    """Count the tokens of a text locally, without calling the API.
+
+    Approximates a BPE tokenizer: every punctuation mark is one token and words are split
+    into pieces of up to six characters. This slightly overestimates English text, which
+    is the safe direction for budgets and rate limits.
+    """
+    return sum(
+        1 + (len(piece) - 1) // CHARS_PER_WORD_TOKEN
+        for piece in TOKEN_PIECE_PATTERN.findall(text)
+    )